@@ -16,11 +16,36 @@
 
 import collections
 import dataclasses
+import hashlib
+import heapq
+import itertools
 import json
+import multiprocessing
+import os
 import re
+import time
 from typing import Dict, Optional, Sequence, Union
 
 from instruction_following_eval import instructions_registry
+from instruction_following_eval import instructions_util
+from instruction_following_eval import json_backend
+from instruction_following_eval import language_detection
+from instruction_following_eval import profiling
+from instruction_following_eval import report_lib
+from instruction_following_eval import result_cache as result_cache_lib
+
+
+# 厳密な評価と緩い評価の評価結果のファイル名（拡張子を除く）。
+RESULT_FILE_NAMES = ("eval_results_strict", "eval_results_loose")
+
+# 評価結果のファイル名に加える、レポートのファイル名の接尾辞。
+REPORT_FILE_SUFFIX = "_report.json"
+
+# 評価結果のファイル名に加える、シャードの集計のファイル名の接尾辞。
+ACCUMULATOR_FILE_SUFFIX = "_accumulator.json"
+
+# 複数の応答ファイルを評価した場合の、モデルごとの精度の一覧のファイル名。
+LEADERBOARD_FILE_NAME = "leaderboard.jsonl"
 
 
 @dataclasses.dataclass
@@ -40,36 +65,312 @@ class OutputExample:
   follow_instruction_list: list[bool]
 
 
-def read_prompt_list(input_jsonl_filename):
-  """jsonlから入力を読み込みます。"""
-  inputs = []
+def iter_prompt_list(input_jsonl_filename):
+  """jsonlから入力を1行ずつ遅延して読み込みます。"""
   with open(input_jsonl_filename, "r") as f:
     for l in f:
-      example = json.loads(l)
-      inputs.append(
-          InputExample(key=example["key"],
-                       instruction_id_list=example["instruction_id_list"],
-                       prompt=example["prompt"],
-                       kwargs=example["kwargs"]))
-  return inputs
+      example = json_backend.loads(l)
+      yield InputExample(key=example["key"],
+                         instruction_id_list=example["instruction_id_list"],
+                         prompt=example["prompt"],
+                         kwargs=example["kwargs"])
+
+
+def read_prompt_list(input_jsonl_filename):
+  """jsonlから入力を読み込みます。"""
+  return list(iter_prompt_list(input_jsonl_filename))
+
+
+# 評価結果の行のキー。以前の`dir`による順序と同じく名前の順に並べます。
+_OUTPUT_FIELD_NAMES = tuple(
+    sorted(field.name for field in dataclasses.fields(OutputExample)))
+
+
+def write_output(f, o):
+  """1つの出力をjsonlの1行としてファイルに書き込みます。"""
+  f.write(json_backend.dumps(
+      {name: getattr(o, name) for name in _OUTPUT_FIELD_NAMES}))
+  f.write("\n")
 
 
 def write_outputs(output_jsonl_filename, outputs):
   """出力をjsonlに書き込みます。"""
   assert outputs
-  with open(output_jsonl_filename, "w") as f:
+  with open(output_jsonl_filename, "w", encoding="utf-8") as f:
     for o in outputs:
-      f.write(
-          json.dumps(
-              {
-                  attr_name: o.__getattribute__(attr_name)
-                  for attr_name in [
-                      name for name in dir(o) if not name.startswith("_")
-                  ]
-              }
-          )
-      )
-      f.write("\n")
+      write_output(f, o)
+
+
+# チェッカーの呼び出しのプロファイル。Noneの場合は記録しません。
+_profile = None
+
+
+def enable_profiling():
+  """`check_following`と`build_description`の呼び出しの記録を始めます。
+
+  ワーカープロセスの記録は`evaluate_input_response_pairs`の結果とともに
+  現在のプロセスに集められます。ワーカーのプールは有効にした後に作成して
+  ください。
+  """
+  global _profile
+  _profile = profiling.Profile()
+
+
+def disable_profiling():
+  """呼び出しの記録をやめます。"""
+  global _profile
+  _profile = None
+
+
+def take_profile():
+  """これまでの記録を返し、新しい記録を始めます。
+
+  Returns:
+    `profiling.Profile`。記録が無効な場合はNone。
+  """
+  global _profile
+  if _profile is None:
+    return None
+  profile, _profile = _profile, profiling.Profile()
+  return profile
+
+
+@dataclasses.dataclass
+class CheckerCalls:
+  """`check_following`の呼び出し回数と、プロンプトレベルのみの評価で省いた回数。
+
+  `saved`は、評価を省いた指示ごとに完全な評価で必ず行われる元の応答の
+  チェックの1回を数えます。完全な評価で試す緩い評価の変形は数えないため、
+  実際に省いた呼び出しの下限です。
+  """
+  calls: int = 0
+  saved: int = 0
+
+  def merge(self, other):
+    """`other`の回数を加えます。"""
+    self.calls += other.calls
+    self.saved += other.saved
+
+  def to_json(self):
+    """JSONに変換できる辞書を返します。"""
+    return dataclasses.asdict(self)
+
+  def format_summary(self):
+    """完全な評価と比べた呼び出し回数の要約を返します。"""
+    return (f"checker calls: {self.calls} of {self.calls + self.saved}, "
+            f"saved {self.saved}")
+
+
+# このプロセスでの`check_following`の呼び出し回数。
+_checker_calls = CheckerCalls()
+
+
+def take_checker_calls():
+  """これまでの呼び出し回数を返し、0から数え直します。
+
+  ワーカープロセスの回数は`evaluate_input_response_pairs`の結果とともに
+  現在のプロセスに集められます。
+
+  Returns:
+    `CheckerCalls`。
+  """
+  global _checker_calls
+  checker_calls, _checker_calls = _checker_calls, CheckerCalls()
+  return checker_calls
+
+
+def _check_following(instruction, response, variant):
+  """`check_following`を呼び出し、記録が有効な場合はレイテンシを記録します。
+
+  Args:
+    instruction: `instructions.Instruction`。
+    response: 応答またはその変形。
+    variant: 緩い評価での変形の番号。元の応答は0です。
+
+  Returns:
+    `check_following`の戻り値。
+  """
+  _checker_calls.calls += 1
+  if _profile is None:
+    return instruction.check_following(response)
+  start = time.perf_counter()
+  try:
+    return instruction.check_following(response)
+  finally:
+    _profile.record(profiling.CHECK_FOLLOWING, instruction.id, variant,
+                    len(response), time.perf_counter() - start)
+
+
+def _build_description(instruction, kwargs):
+  """`build_description`を呼び出し、記録が有効な場合はレイテンシを記録します。"""
+  if _profile is None:
+    instruction.build_description(**kwargs)
+    return
+  start = time.perf_counter()
+  try:
+    instruction.build_description(**kwargs)
+  finally:
+    input_length = sum(len(v) for v in kwargs.values() if isinstance(v, str))
+    _profile.record(profiling.BUILD_DESCRIPTION, instruction.id, 0,
+                    input_length, time.perf_counter() - start)
+
+
+def _build_instruction(instruction_id, kwargs, prompt):
+  """指示IDと引数からチェック可能な指示オブジェクトを構築します。"""
+  instruction_cls = instructions_registry.INSTRUCTION_DICT[instruction_id]
+  instruction = instruction_cls(instruction_id)
+
+  _build_description(instruction, kwargs)
+  args = instruction.get_instruction_args()
+  if args and "prompt" in args:
+    _build_description(instruction, {"prompt": prompt})
+  return instruction
+
+
+# 構築済みの指示のキャッシュに保持する指示の最大数。
+_MAX_PREPARED_INSTRUCTIONS = 100000
+
+# (指示ID, 凍結した引数, プロンプト) から構築済みの指示への対応表。
+_prepared_instructions = {}
+
+
+def _freeze(value):
+  """辞書やリストを含む値を、辞書のキーに使えるハッシュ可能な値に変換します。"""
+  if isinstance(value, dict):
+    return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+  if isinstance(value, (list, tuple)):
+    return tuple(_freeze(v) for v in value)
+  return value
+
+
+def get_prepared_instruction(instruction_id, kwargs, prompt):
+  """チェック可能な構築済みの指示を返します。
+
+  同じ指示ID、引数、プロンプトの組に対しては同じ指示オブジェクトが返される
+  ため、データセットの指示は一度だけ構築され、応答ファイルをまたいで
+  再利用されます。
+
+  Args:
+    instruction_id: 指示ID。
+    kwargs: `build_description`のキーワード引数の辞書。
+    prompt: プロンプトを表す文字列。
+
+  Returns:
+    `build_description`を呼び出し済みの`instructions.Instruction`。
+  """
+  key = (instruction_id, _freeze(kwargs), prompt)
+  instruction = _prepared_instructions.get(key)
+  if instruction is None:
+    instruction = _build_instruction(instruction_id, kwargs, prompt)
+    if len(_prepared_instructions) >= _MAX_PREPARED_INSTRUCTIONS:
+      # 最も古い指示を捨てます。
+      del _prepared_instructions[next(iter(_prepared_instructions))]
+    _prepared_instructions[key] = instruction
+  return instruction
+
+
+def prepare_inputs(inputs):
+  """入力に含まれるすべての指示を事前に構築します。
+
+  ワーカープロセスを作成する前に呼び出すと、構築済みの指示が
+  ワーカープロセスに引き継がれます。
+
+  Args:
+    inputs: `InputExample`のイテラブル。
+  """
+  for inp in inputs:
+    for index, instruction_id in enumerate(inp.instruction_id_list):
+      get_prepared_instruction(instruction_id, inp.kwargs[index], inp.prompt)
+
+
+def clear_prepared_instructions():
+  """構築済みの指示のキャッシュを空にします。"""
+  _prepared_instructions.clear()
+
+
+class LooseResponseVariants:
+  """緩い評価で試す応答の変形を、必要になった時点で作成する列。
+
+  変形の順序は元の応答、"*"を除いた応答、最初の行を除いた応答、最後の行を
+  除いた応答、最初と最後の行を除いた応答、最初の行を除いた応答から"*"を
+  除いたもの、以下同様です。行の除去は最初と最後の改行の位置による切り出し
+  で行い、作成した変形は同じ例のすべての指示で共有されます。
+  """
+
+  _NUM_VARIANTS = 8
+
+  def __init__(self, response):
+    self._response = response
+    self._first_newline = response.find("\n")
+    self._last_newline = response.rfind("\n")
+    self._has_asterisk = "*" in response
+    self._variants = [response] + [None] * (self._NUM_VARIANTS - 1)
+
+  def __len__(self):
+    return self._NUM_VARIANTS
+
+  def _remove_lines(self, remove_first, remove_last):
+    """最初または最後の行を除いて前後の空白を除いた応答を返します。"""
+    if self._first_newline < 0:
+      return ""
+    start = self._first_newline + 1 if remove_first else 0
+    end = self._last_newline if remove_last else len(self._response)
+    return self._response[start:end].strip() if start <= end else ""
+
+  def _remove_asterisks(self, text):
+    # "*"を含まない応答では同じ文字列をそのまま返し、複製を避けます。
+    return text.replace("*", "") if self._has_asterisk else text
+
+  def __getitem__(self, index):
+    variant = self._variants[index]
+    if variant is None:
+      if index == 1:
+        variant = self._remove_asterisks(self._response)
+      elif index < 5:
+        variant = self._remove_lines(index in (2, 4), index in (3, 4))
+      else:
+        variant = self._remove_asterisks(self[index - 3])
+      self._variants[index] = variant
+    return variant
+
+  def is_duplicate(self, index):
+    """変形がそれより前の変形と同じ文字列のオブジェクトかどうかを返します。
+
+    "*"を含まない応答では"*"を除いた変形は元の変形と同じなので、
+    同じ判定を繰り返さずに済みます。
+    """
+    return not self._has_asterisk and index in (1, 5, 6, 7)
+
+
+def _loose_response_variants(response):
+  """緩い評価で試す応答の変形を、元の応答を先頭にして返します。"""
+  return LooseResponseVariants(response)
+
+
+def _is_blank(text):
+  """`text.strip()`が空かどうかを、文字列を複製せずに返します。"""
+  return not text or text.isspace()
+
+
+def _release_response_analyses():
+  """評価を終えた例の応答と変形の`ResponseAnalysis`を破棄します。
+
+  `instructions_util.analyze_response`のキャッシュは同じ例の指示の間で
+  解析結果を共有するためのもので、次の例まで応答を保持しないように
+  例ごとに空にします。
+  """
+  instructions_util.analyze_response.cache_clear()
+
+
+def _check_loose_variants(instruction, variants, start):
+  """`start`番目以降の変形のいずれかが指示に従っているかを返します。"""
+  for index in range(start, len(variants)):
+    if variants.is_duplicate(index):
+      continue
+    r = variants[index]
+    if not _is_blank(r) and _check_following(instruction, r, index):
+      return True
+  return False
 
 
 def test_instruction_following_strict(
@@ -82,19 +383,15 @@ def test_instruction_following_strict(
   is_following_list = []
 
   for index, instruction_id in enumerate(instruction_list):
-    instruction_cls = instructions_registry.INSTRUCTION_DICT[instruction_id]
-    instruction = instruction_cls(instruction_id)
-
-    instruction.build_description(**inp.kwargs[index])
-    args = instruction.get_instruction_args()
-    if args and "prompt" in args:
-      instruction.build_description(prompt=inp.prompt)
+    instruction = get_prepared_instruction(
+        instruction_id, inp.kwargs[index], inp.prompt)
 
-    if response.strip() and instruction.check_following(response):
+    if not _is_blank(response) and _check_following(instruction, response, 0):
       is_following_list.append(True)
     else:
       is_following_list.append(False)
 
+  _release_response_analyses()
   return OutputExample(
       instruction_id_list=inp.instruction_id_list,
       prompt=inp.prompt,
@@ -110,44 +407,18 @@ def test_instruction_following_loose(
 ):
   """指示に従うための上限について応答をテストします。"""
   response = prompt_to_response[inp.prompt]
-  r = response.split("\n")
-  response_remove_first = "\n".join(r[1:]).strip()
-  response_remove_last = "\n".join(r[:-1]).strip()
-  response_remove_both = "\n".join(r[1:-1]).strip()
-  revised_response = response.replace("*", "")
-  revised_response_remove_first = response_remove_first.replace("*", "")
-  revised_response_remove_last = response_remove_last.replace("*", "")
-  revised_response_remove_both = response_remove_both.replace("*", "")
-  all_responses = [
-      response,
-      revised_response,
-      response_remove_first,
-      response_remove_last,
-      response_remove_both,
-      revised_response_remove_first,
-      revised_response_remove_last,
-      revised_response_remove_both,
-  ]
+  all_responses = _loose_response_variants(response)
   instruction_list = inp.instruction_id_list
   is_following_list = []
 
   for index, instruction_id in enumerate(instruction_list):
-    instruction_cls = instructions_registry.INSTRUCTION_DICT[instruction_id]
-    instruction = instruction_cls(instruction_id)
-
-    instruction.build_description(**inp.kwargs[index])
-    args = instruction.get_instruction_args()
-    if args and "prompt" in args:
-      instruction.build_description(prompt=inp.prompt)
+    instruction = get_prepared_instruction(
+        instruction_id, inp.kwargs[index], inp.prompt)
 
-    is_following = False
-    for r in all_responses:
-      if r.strip() and instruction.check_following(r):
-        is_following = True
-        break
-
-    is_following_list.append(is_following)
+    is_following_list.append(
+        _check_loose_variants(instruction, all_responses, 0))
 
+  _release_response_analyses()
   return OutputExample(
       instruction_id_list=inp.instruction_id_list,
       prompt=inp.prompt,
@@ -157,64 +428,654 @@ def test_instruction_following_loose(
   )
 
 
-def read_prompt_to_response_dict(input_jsonl_filename):
-  """プロンプトと応答を対応付ける辞書を作成します。"""
+def test_instruction_following_strict_and_loose(
+    inp,
+    prompt_to_response,
+    cached_verdicts=None,
+):
+  """厳密な評価と緩い評価を1回の走査で行います。
+
+  各指示は一度だけ構築されます。緩い評価の最初の変形は元の応答そのもの
+  なので、厳密な評価の結果をそのまま再利用し、厳密な評価に失敗した指示
+  についてのみ残りの変形を試します。
+
+  Args:
+    inp: `InputExample`。
+    prompt_to_response: プロンプトから応答への辞書。
+    cached_verdicts: 指示ごとのキャッシュ済みの`(strict, loose)`のタプル
+      またはNoneのリスト。キャッシュ済みの指示は評価しません。
+
+  Returns:
+    厳密な評価と緩い評価の`OutputExample`のタプル。
+  """
+  response = prompt_to_response[inp.prompt]
+  # 変形はすべての指示が厳密な評価に通った場合は不要なので、遅延して作成します。
+  loose_responses = None
+  strict_list = []
+  loose_list = []
+
+  for index, instruction_id in enumerate(inp.instruction_id_list):
+    if cached_verdicts is not None and cached_verdicts[index] is not None:
+      strict, loose = cached_verdicts[index]
+      strict_list.append(strict)
+      loose_list.append(loose)
+      continue
+
+    instruction = get_prepared_instruction(
+        instruction_id, inp.kwargs[index], inp.prompt)
+
+    is_following = bool(
+        not _is_blank(response) and _check_following(instruction, response, 0))
+    strict_list.append(is_following)
+
+    if not is_following:
+      if loose_responses is None:
+        loose_responses = _loose_response_variants(response)
+      is_following = _check_loose_variants(instruction, loose_responses, 1)
+    loose_list.append(is_following)
+
+  _release_response_analyses()
+  return (
+      OutputExample(
+          instruction_id_list=inp.instruction_id_list,
+          prompt=inp.prompt,
+          response=response,
+          follow_all_instructions=all(strict_list),
+          follow_instruction_list=strict_list,
+      ),
+      OutputExample(
+          instruction_id_list=inp.instruction_id_list,
+          prompt=inp.prompt,
+          response=response,
+          follow_all_instructions=all(loose_list),
+          follow_instruction_list=loose_list,
+      ),
+  )
+
+
+# チェッカーの1回あたりの相対的なコスト（マイクロ秒）。サンプルデータの
+# 応答で計測した平均値で、プロンプトレベルのみの評価で安価な指示から
+# 評価するために使います。
+_CHECKER_COSTS = {
+    "detectable_format:constrained_response": 2,
+    "startend:quotation": 2,
+    "punctuation:no_comma": 2,
+    "detectable_format:title": 6,
+    "combination:two_responses": 7,
+    "startend:end_checker": 10,
+    "combination:repeat_prompt": 11,
+    "detectable_format:number_highlighted_sections": 11,
+    "keywords:existence": 13,
+    "keywords:letter_frequency": 14,
+    "detectable_format:number_bullet_lists": 22,
+    "keywords:frequency": 25,
+    "detectable_format:json_format": 26,
+    "detectable_content:number_placeholders": 28,
+    "length_constraints:nth_paragraph_first_word": 29,
+    "detectable_content:postscript": 45,
+    "detectable_format:multiple_sections": 52,
+    "length_constraints:number_paragraphs": 52,
+    "keywords:forbidden_words": 83,
+    "length_constraints:number_words": 318,
+    "length_constraints:number_sentences": 761,
+    "language:response_language": 1329,
+    "change_case:capital_word_frequency": 2235,
+    "change_case:english_capital": 2658,
+    "change_case:english_lowercase": 5589,
+}
+
+# コストが未計測の指示のコスト。
+_DEFAULT_CHECKER_COST = 100
+
+
+def test_instruction_following_prompt_level(
+    inp,
+    prompt_to_response,
+):
+  """プロンプトレベルの厳密な評価と緩い評価のみを行います。
+
+  指示は`_CHECKER_COSTS`の安価な順に評価し、緩い評価で従っていない指示が
+  見つかった時点で残りの指示の評価を省きます（緩い評価に失敗した指示は
+  厳密な評価にも失敗します）。厳密な評価に失敗した後は緩い評価のみを
+  続けます。
+
+  Args:
+    inp: `InputExample`。
+    prompt_to_response: プロンプトから応答への辞書。
+
+  Returns:
+    厳密な評価と緩い評価の`OutputExample`のタプル。`follow_all_instructions`
+    は完全な評価と同じ値で、`follow_instruction_list`の評価を省いた指示は
+    Noneです。緩い評価の判定がNoneの指示では`check_following`を一度も
+    呼び出していません。厳密な評価のみがNoneの指示は、緩い評価で元の応答を
+    チェックしています。評価を省いた指示の数は`take_checker_calls`の
+    `saved`に加えます。
+  """
+  response = prompt_to_response[inp.prompt]
+  loose_responses = None
+  num_instructions = len(inp.instruction_id_list)
+  strict_list = [None] * num_instructions
+  loose_list = [None] * num_instructions
+  order = sorted(
+      range(num_instructions),
+      key=lambda i: _CHECKER_COSTS.get(
+          inp.instruction_id_list[i], _DEFAULT_CHECKER_COST))
+
+  strict_all = loose_all = True
+  for index in order:
+    instruction = get_prepared_instruction(
+        inp.instruction_id_list[index], inp.kwargs[index], inp.prompt)
+
+    if strict_all:
+      is_following = not _is_blank(response) and _check_following(
+          instruction, response, 0)
+      strict_list[index] = is_following
+      strict_all = is_following
+      if is_following:
+        loose_list[index] = True
+        continue
+
+    if loose_responses is None:
+      loose_responses = _loose_response_variants(response)
+    # 厳密な評価を済ませた場合は元の応答を試し直しません。
+    start = 1 if strict_list[index] is not None else 0
+    is_following = _check_loose_variants(instruction, loose_responses, start)
+    loose_list[index] = is_following
+    if not is_following:
+      loose_all = False
+      break
+
+  # 評価した指示では完全な評価と同じ変形を同じ順に試すため、完全な評価との
+  # 差は評価を省いた指示のチェックのみです。
+  if not _is_blank(response):
+    _checker_calls.saved += loose_list.count(None)
+
+  _release_response_analyses()
+  return (
+      OutputExample(
+          instruction_id_list=inp.instruction_id_list,
+          prompt=inp.prompt,
+          response=response,
+          follow_all_instructions=strict_all,
+          follow_instruction_list=strict_list,
+      ),
+      OutputExample(
+          instruction_id_list=inp.instruction_id_list,
+          prompt=inp.prompt,
+          response=response,
+          follow_all_instructions=loose_all,
+          follow_instruction_list=loose_list,
+      ),
+  )
+
+
+def _get_worker_settings():
+  """ワーカープロセスに引き継ぐモジュールレベルの設定を返します。"""
+  return {
+      "language_detector": language_detection.get_backend(),
+      "sentence_counter": instructions_util.get_sentence_counter(),
+      "profiling": _profile is not None,
+  }
+
+
+def _apply_worker_settings(settings):
+  """親プロセスの設定をワーカープロセスに適用します。"""
+  language_detection.set_backend(settings["language_detector"])
+  instructions_util.set_sentence_counter(settings["sentence_counter"])
+  # 親プロセスから複製された記録は引き継がず、空の記録から始めます。
+  if settings["profiling"]:
+    enable_profiling()
+  else:
+    disable_profiling()
+  take_checker_calls()
+
+
+def create_pool(num_workers):
+  """現在の設定を引き継いだワーカープロセスのプールを作成します。
+
+  複数の応答ファイルを評価する場合は、1つのプールを
+  `evaluate_input_response_pairs`に渡して使い回せます。
+
+  Args:
+    num_workers: ワーカープロセスの数。
+
+  Returns:
+    `multiprocessing.pool.Pool`。
+  """
+  return multiprocessing.Pool(
+      num_workers,
+      initializer=_apply_worker_settings,
+      initargs=(_get_worker_settings(),),
+  )
+
+
+def _evaluate_task_in_worker(task):
+  """入力と応答の組を厳密な評価と緩い評価で評価します。"""
+  inp, response, cached_verdicts, prompt_level_only = task
+  if prompt_level_only:
+    return test_instruction_following_prompt_level(
+        inp, {inp.prompt: response})
+  return test_instruction_following_strict_and_loose(
+      inp, {inp.prompt: response}, cached_verdicts)
+
+
+def _evaluate_tasks_in_worker(tasks):
+  """タスクを評価し、結果とワーカープロセスでの記録と呼び出し回数を返します。"""
+  return ([_evaluate_task_in_worker(task) for task in tasks], take_profile(),
+          take_checker_calls())
+
+
+def _iter_tasks(pairs, result_cache, prompt_level_only):
+  """組ごとに、評価のタスクと評価結果のキャッシュのキーを返します。"""
+  for inp, response in pairs:
+    if result_cache is None:
+      yield (inp, response, None, prompt_level_only), None
+    else:
+      keys = result_cache_lib.make_keys(inp, response)
+      yield (inp, response, result_cache.get_many(keys),
+             prompt_level_only), keys
+
+
+def _store_result(result_cache, task, keys, result):
+  """キャッシュになかった指示の評価結果をキャッシュに保存します。"""
+  if result_cache is None:
+    return
+  _, _, cached_verdicts, _ = task
+  strict, loose = result
+  result_cache.put_many(
+      (key, is_strict, is_loose)
+      for key, cached, is_strict, is_loose in zip(
+          keys, cached_verdicts, strict.follow_instruction_list,
+          loose.follow_instruction_list)
+      if cached is None
+  )
+
+
+def evaluate_input_response_pairs(pairs, num_workers=1, window_size=None,
+                                  pool=None, result_cache=None,
+                                  prompt_level_only=False):
+  """入力と応答の組を遅延して評価し、入力と同じ順序で結果を返します。
+
+  `pairs`は必要な分だけ読み進められるため、ワーカーを使う場合でも
+  同時にメモリ上に存在する応答は`window_size`個程度に抑えられます。
+  キャッシュの参照と保存は現在のプロセスで行い、ワーカーにはキャッシュ済みの
+  評価結果を渡して、キャッシュになかった指示のみを評価させます。
+
+  Args:
+    pairs: `(InputExample, 応答)`の組のイテラブル。
+    num_workers: ワーカープロセスの数。1以下で`pool`も指定されていない
+      場合は現在のプロセスで評価します。`pool`を指定する場合はその
+      ワーカーの数を指定します。
+    window_size: ワーカーで同時に評価中にする組の最大数。Noneの場合は
+      ワーカーの数から決めます。
+    pool: 使用するワーカープロセスのプール。Noneの場合は必要に応じて
+      作成します。
+    result_cache: 指示ごとの評価結果の`result_cache.ResultCache`。Noneの
+      場合はキャッシュを使いません。
+    prompt_level_only: Trueの場合は`test_instruction_following_prompt_level`
+      で評価します。`result_cache`とは併用できません。
+
+  Yields:
+    厳密な評価と緩い評価の`OutputExample`のタプル。
+  """
+  if prompt_level_only and result_cache is not None:
+    raise ValueError(
+        "prompt_level_only cannot be used together with result_cache.")
+  if pool is None:
+    if num_workers <= 1:
+      for task, keys in _iter_tasks(pairs, result_cache, prompt_level_only):
+        result = _evaluate_task_in_worker(task)
+        _store_result(result_cache, task, keys, result)
+        yield result
+      return
+    with create_pool(num_workers) as pool:
+      yield from evaluate_input_response_pairs(
+          pairs, num_workers=num_workers, window_size=window_size, pool=pool,
+          result_cache=result_cache, prompt_level_only=prompt_level_only)
+    return
+
+  # 組を小さなチャンクにまとめて非同期に投入し、完了した順ではなく
+  # 投入した順に結果を返します。
+  chunksize = 4
+  if window_size is None:
+    window_size = max(num_workers, 1) * chunksize * 8
+  pending = collections.deque()
+  tasks = _iter_tasks(pairs, result_cache, prompt_level_only)
+  while True:
+    chunk = list(itertools.islice(tasks, chunksize))
+    if chunk:
+      pending.append((
+          chunk,
+          pool.apply_async(
+              _evaluate_tasks_in_worker, ([task for task, _ in chunk],)),
+      ))
+    while pending and (not chunk or len(pending) * chunksize >= window_size):
+      done_chunk, async_result = pending.popleft()
+      results, profile, checker_calls = async_result.get()
+      if profile is not None and _profile is not None:
+        _profile.merge(profile)
+      _checker_calls.merge(checker_calls)
+      for (task, keys), result in zip(done_chunk, results):
+        _store_result(result_cache, task, keys, result)
+        yield result
+    if not chunk:
+      break
+
+
+def shard_of(prompt, num_shards):
+  """プロンプトを評価するシャードの番号を返します。
+
+  Pythonの`hash`はプロセスごとに異なるため、プロンプトのSHA-256を使い、
+  どのノードでも同じシャードに割り当てます。プロンプトは入力データと
+  応答データの両方にあるため、応答ファイルも読みながら分割できます。
+
+  Args:
+    prompt: プロンプトを表す文字列。
+    num_shards: シャードの数。
+
+  Returns:
+    0から`num_shards` - 1までの整数。
+  """
+  digest = hashlib.sha256(prompt.encode("utf-8", "surrogatepass")).digest()
+  return int.from_bytes(digest[:8], "big") % num_shards
+
+
+def shard_file_name(file_name, shard_index, num_shards):
+  """拡張子の前にシャードの番号を加えたファイル名を返します。"""
+  base, extension = os.path.splitext(file_name)
+  return f"{base}-{shard_index:05d}-of-{num_shards:05d}{extension}"
+
+
+def shard_file_pattern(file_name):
+  """すべてのシャードの`shard_file_name`に一致するglobパターンを返します。"""
+  base, extension = os.path.splitext(file_name)
+  return f"{base}-?????-of-?????{extension}"
+
+
+def read_prompt_to_response_dict(input_jsonl_filename, shard_index=0,
+                                 num_shards=1):
+  """プロンプトと応答を対応付ける辞書を作成します。
+
+  Args:
+    input_jsonl_filename: プロンプトと応答を含むjsonlファイル。
+    shard_index: 読み込むシャードの番号。
+    num_shards: シャードの数。2以上の場合は`shard_index`のシャードの
+      プロンプトの応答のみを読み込みます。
+
+  Returns:
+    プロンプトから応答への辞書。
+  """
   return_dict = {}
   with open(input_jsonl_filename, "r") as f:
     for l in f:
-      example = json.loads(l)
+      example = json_backend.loads(l)
+      if num_shards > 1 and shard_of(
+          example["prompt"], num_shards) != shard_index:
+        continue
       return_dict[example["prompt"]] = example["response"]
   return return_dict
 
 
-def print_report(outputs):
-  """精度スコアのレポートを出力します。"""
+def count_repeated_prompts(inputs):
+  """入力に2回以上現れるプロンプトの出現回数の辞書を返します。
+
+  Args:
+    inputs: `InputExample`のイテラブル。
+
+  Returns:
+    プロンプトから出現回数への辞書。一度だけ現れるプロンプトは含みません。
+  """
+  counts = collections.Counter(inp.prompt for inp in inputs)
+  return {prompt: count for prompt, count in counts.items() if count > 1}
+
+
+def iter_input_response_pairs(inputs, input_response_jsonl_filename,
+                              shard_index=0, num_shards=1,
+                              repeated_prompts=None):
+  """入力と対応する応答の組を、応答ファイルを遅延して読みながら返します。
+
+  応答ファイルが入力と同じ順序で並んでいる場合、先読みする応答は常に
+  1件だけです。順序が異なる場合は、必要な応答が見つかるまで読み進めた
+  応答を一時的に保持します。応答は対応するプロンプトの最後の入力で
+  返した後に破棄します。
+
+  Args:
+    inputs: `InputExample`のイテラブル。
+    input_response_jsonl_filename: プロンプトと応答を含むjsonlファイル。
+    shard_index: 評価するシャードの番号。
+    num_shards: シャードの数。2以上の場合、`inputs`は`shard_index`の
+      シャードの入力のみとし、他のシャードのプロンプトの応答は保持せずに
+      読み飛ばします。
+    repeated_prompts: `inputs`に2回以上現れるプロンプトの出現回数の辞書
+      （`count_repeated_prompts`の戻り値）。含まれないプロンプトは一度だけ
+      現れるものとし、応答を返した後に破棄します。
+
+  Yields:
+    `(InputExample, 応答)`の組。
+
+  Raises:
+    KeyError: 入力のプロンプトに対応する応答が見つからない場合。
+  """
+  pending = {}
+  # 応答をまだ返す必要がある、2回以上現れるプロンプトの残りの出現回数。
+  remaining = dict(repeated_prompts or {})
+  with open(input_response_jsonl_filename, "r") as f:
+    for inp in inputs:
+      while inp.prompt not in pending:
+        l = f.readline()
+        if not l:
+          raise KeyError(inp.prompt)
+        example = json_backend.loads(l)
+        if num_shards > 1 and shard_of(
+            example["prompt"], num_shards) != shard_index:
+          continue
+        pending[example["prompt"]] = example["response"]
+      if remaining.get(inp.prompt, 1) > 1:
+        remaining[inp.prompt] -= 1
+        yield inp, pending[inp.prompt]
+      else:
+        remaining.pop(inp.prompt, None)
+        yield inp, pending.pop(inp.prompt)
+
+
+class ReportAccumulator:
+  """出力を1つずつ集め、精度スコアのレポートを計算します。"""
+
+  def __init__(self):
+    self._matrix = report_lib.VerdictMatrix()
+    # ブートストラップの標本数から計算済みのレポートへの対応表。
+    self._reports = {}
+
+  def add(self, example):
+    """1つの出力を集計に加えます。
+
+    評価を省いた指示（None）は従っていないものとして集計するため、
+    プロンプトレベルの精度は完全な評価と同じになります。
+    """
+    self.add_verdicts(
+        example.instruction_id_list, example.follow_instruction_list)
+
+  def add_verdicts(self, instruction_id_list, follow_instruction_list):
+    """1つの出力の指示IDと判定のリストを集計に加えます。"""
+    self._matrix.add(instruction_id_list, follow_instruction_list)
+    self._reports.clear()
+
+  @property
+  def num_examples(self):
+    """集計した出力の数。"""
+    return self._matrix.num_examples
+
+  def report(self, num_bootstrap_samples=0):
+    """`report_lib.Report`を返します。
+
+    Args:
+      num_bootstrap_samples: ブートストラップの標本数。0の場合は信頼区間を
+        計算しません。
+
+    Returns:
+      `report_lib.Report`。
+    """
+    if num_bootstrap_samples not in self._reports:
+      self._reports[num_bootstrap_samples] = report_lib.compute_report(
+          self._matrix, num_bootstrap_samples=num_bootstrap_samples)
+    return self._reports[num_bootstrap_samples]
+
+  def prompt_accuracy(self):
+    """プロンプトレベルの精度を返します。"""
+    return self.report().prompt_level.value
 
-  prompt_total = 0
-  prompt_correct = 0
-  instruction_total = 0
-  instruction_correct = 0
+  def instruction_accuracy(self):
+    """指示レベルの精度を返します。"""
+    return self.report().instruction_level.value
 
-  tier0_total = collections.defaultdict(int)
-  tier0_correct = collections.defaultdict(int)
+  def print_report(self, num_bootstrap_samples=0):
+    """精度スコアのレポートを出力します。"""
+    print(report_lib.format_report(self.report(num_bootstrap_samples)))
 
-  tier1_total = collections.defaultdict(int)
-  tier1_correct = collections.defaultdict(int)
 
+def print_report(outputs, num_bootstrap_samples=0):
+  """精度スコアのレポートを出力します。
+
+  チェッカーの呼び出しを記録している場合は、その要約も出力します。
+  """
+  accumulator = ReportAccumulator()
   for example in outputs:
-    follow_instruction_list = example.follow_instruction_list
-    instruction_id_list = example.instruction_id_list
-
-    prompt_total += 1
-    if all(follow_instruction_list):
-      prompt_correct += 1
-
-    instruction_total += len(instruction_id_list)
-    instruction_correct += sum(follow_instruction_list)
-
-    for instruction_id, followed_or_not in zip(
-        instruction_id_list, follow_instruction_list
-    ):
-      instruction_id = instruction_id.split(":")[0]
-      tier0_total[instruction_id] += 1
-      if followed_or_not:
-        tier0_correct[instruction_id] += 1
-
-    for instruction_id, followed_or_not in zip(
-        instruction_id_list, follow_instruction_list
-    ):
-      tier1_total[instruction_id] += 1
-      if followed_or_not:
-        tier1_correct[instruction_id] += 1
-
-  print(f"prompt-level: {prompt_correct / prompt_total}")
-  print(f"instruction-level: {instruction_correct / instruction_total}")
-  print()
-  for instruction_id in sorted(tier0_total.keys()):
-    accuracy = tier0_correct[instruction_id] / tier0_total[instruction_id]
-    print(f"{instruction_id} {accuracy}")
-  print()
-  for instruction_id in sorted(tier1_total.keys()):
-    accuracy = tier1_correct[instruction_id] / tier1_total[instruction_id]
-    print(f"{instruction_id} {accuracy}")
+    accumulator.add(example)
+  accumulator.print_report(num_bootstrap_samples)
+  if _profile:
+    print()
+    print(_profile.format_summary())
+
+
+def write_report(output_file_name, accumulator, num_bootstrap_samples=0,
+                 prompt_level_only=False):
+  """評価結果のファイルの精度スコアのレポートを書き込み、出力します。
+
+  レポートはJSONで評価結果のファイルの隣に書き込みます。
+
+  Args:
+    output_file_name: 評価結果のjsonlファイルへのパス。
+    accumulator: 評価結果を集めた`ReportAccumulator`。
+    num_bootstrap_samples: ブートストラップの標本数。
+    prompt_level_only: Trueの場合はプロンプトレベルの精度のみを出力します。
+
+  Returns:
+    書き込んだレポートのファイルへのパス。
+  """
+  report = accumulator.report(num_bootstrap_samples)
+  report_file_name = os.path.splitext(output_file_name)[0] + REPORT_FILE_SUFFIX
+  with open(report_file_name, "w") as f:
+    json.dump(
+        report_lib.report_to_json(report, prompt_level_only), f, indent=2)
+    f.write("\n")
+
+  print("=" * 64)
+  print(f"{output_file_name} Accuracy Scores:")
+  print(report_lib.format_report(report, prompt_level_only))
+  return report_file_name
+
+
+def write_leaderboard(output_file_name, model_to_accumulators,
+                      prompt_level_only=False):
+  """モデルごとの精度をプロンプトレベルの厳密な精度の降順で書き込みます。
+
+  Args:
+    output_file_name: リーダーボードのjsonlファイルへのパス。
+    model_to_accumulators: モデル名から、厳密な評価と緩い評価の
+      `ReportAccumulator`の組への辞書。
+    prompt_level_only: Trueの場合は指示レベルの精度を含めません。
+  """
+  rows = []
+  for model, (strict, loose) in model_to_accumulators.items():
+    row = {
+        "model": model,
+        "prompt_level_strict": strict.prompt_accuracy(),
+        "instruction_level_strict": strict.instruction_accuracy(),
+        "prompt_level_loose": loose.prompt_accuracy(),
+        "instruction_level_loose": loose.instruction_accuracy(),
+    }
+    # プロンプトレベルのみの評価では指示レベルの精度は求まりません。
+    if prompt_level_only:
+      del row["instruction_level_strict"], row["instruction_level_loose"]
+    rows.append(row)
+  rows.sort(key=lambda row: row["prompt_level_strict"], reverse=True)
+  with open(output_file_name, "w") as f:
+    for row in rows:
+      f.write(json.dumps(row))
+      f.write("\n")
+
+  print("=" * 64)
+  print(f"{output_file_name}:")
+  print(" ".join(rows[0]))
+  for row in rows:
+    print(" ".join(str(value) for value in row.values()))
+
+
+class ShardAccumulator:
+  """シャードの評価結果の判定を、入力データでの位置とともに集めます。
+
+  `to_json`の辞書をシャードごとに書き込み、`merge_shard_results`で
+  すべてのシャードの判定を入力データの順序に並べ直します。指示IDは
+  番号で保持し、評価結果のファイルを読み直さずにレポートを計算できます。
+  """
+
+  def __init__(self):
+    self._columns = {}
+    self._examples = []
+
+  def add(self, input_index, example):
+    """入力データで`input_index`番目の入力の出力を加えます。"""
+    self._examples.append([
+        input_index,
+        [
+            self._columns.setdefault(instruction_id, len(self._columns))
+            for instruction_id in example.instruction_id_list
+        ],
+        example.follow_instruction_list,
+    ])
+
+  def to_json(self):
+    """JSONに変換できる辞書を返します。"""
+    return {"instruction_ids": list(self._columns), "examples": self._examples}
+
+
+def _iter_shard_results(lines, accumulator):
+  """シャードの評価結果の行と判定を、入力データでの位置とともに返します。"""
+  instruction_ids = accumulator["instruction_ids"]
+  for line, example in itertools.zip_longest(lines, accumulator["examples"]):
+    if line is None or example is None:
+      raise ValueError(
+          "Shard results and accumulator have different lengths.")
+    input_index, columns, follow_instruction_list = example
+    yield (input_index, line, [instruction_ids[c] for c in columns],
+           follow_instruction_list)
+
+
+def merge_shard_results(shards):
+  """シャードの評価結果を入力データの順序にまとめます。
+
+  各シャードの評価結果は入力データの順序で書き込まれているため、
+  入力データでの位置によるk方向のマージで単一の実行と同じ順序になります。
+
+  Args:
+    shards: シャードごとの`(評価結果のjsonlファイルの行のイテラブル,
+      ShardAccumulator.to_jsonの辞書)`の組のイテラブル。
+
+  Yields:
+    入力データの順序に並んだ`(評価結果の行, 指示IDのリスト,
+    判定のリスト)`の組。
 
+  Raises:
+    ValueError: 同じ入力が複数のシャードに含まれる場合や、評価結果の行数と
+      判定の数が異なる場合。
+  """
+  previous_index = -1
+  for input_index, line, instruction_id_list, follow_instruction_list in (
+      heapq.merge(
+          *(_iter_shard_results(lines, accumulator)
+            for lines, accumulator in shards),
+          key=lambda result: result[0])):
+    if input_index <= previous_index:
+      raise ValueError(f"Input {input_index} appears in more than one shard.")
+    previous_index = input_index
+    yield line, instruction_id_list, follow_instruction_list
@@ -0,0 +1,415 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""evaluation_lib.pyのテスト。"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+import weakref
+
+from absl.testing import absltest
+from instruction_following_eval import evaluation_lib
+from instruction_following_eval import instructions_util
+from instruction_following_eval import result_cache
+
+
+def _make_inputs():
+  """nltkのデータを必要としない指示のみを使った入力を作成します。"""
+  inputs = []
+  prompt_to_response = {}
+  for i in range(44):
+    prompt = f"Prompt {i}: write a titled answer without commas."
+    inputs.append(
+        evaluation_lib.InputExample(
+            key=i,
+            instruction_id_list=[
+                "punctuation:no_comma", "detectable_format:title"],
+            prompt=prompt,
+            kwargs=[{}, {}],
+        )
+    )
+    if i >= 40:
+      # 厳密な評価には従わず、最初の行を除いた緩い評価の変形のみが従う応答。
+      response = f"Intro, answer\n**<<Title {i}>>**\nOutro"
+    elif i % 3 == 0:
+      response = f"<<Title {i}>>\n*Answer* number {i}"
+    elif i % 3 == 1:
+      response = f"Answer, number {i}"
+    else:
+      response = f"**Intro**\n<<Title {i}>>, answer\nOutro"
+    prompt_to_response[prompt] = response
+  return inputs, prompt_to_response
+
+
+class EvaluationLibTest(absltest.TestCase):
+
+  def _make_tempdir(self):
+    tempdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, tempdir)
+    return tempdir
+
+  def test_parallel_evaluation_preserves_order(self):
+    """並列評価が単一プロセス評価と同じ出力を同じ順序で返すかのテスト。"""
+    inputs, prompt_to_response = _make_inputs()
+    pairs = [(inp, prompt_to_response[inp.prompt]) for inp in inputs]
+    expected = [
+        evaluation_lib.test_instruction_following_strict_and_loose(
+            inp, prompt_to_response) for inp in inputs
+    ]
+    actual = evaluation_lib.evaluate_input_response_pairs(pairs, num_workers=4)
+    self.assertEqual(expected, list(actual))
+
+  def test_strict_and_loose_matches_separate_passes(self):
+    """1回の走査での評価が個別の評価と一致するかのテスト。"""
+    inputs, prompt_to_response = _make_inputs()
+    for inp in inputs:
+      strict, loose = (
+          evaluation_lib.test_instruction_following_strict_and_loose(
+              inp, prompt_to_response))
+      self.assertEqual(
+          evaluation_lib.test_instruction_following_strict(
+              inp, prompt_to_response),
+          strict)
+      self.assertEqual(
+          evaluation_lib.test_instruction_following_loose(
+              inp, prompt_to_response),
+          loose)
+
+  def test_prompt_level_matches_full_evaluation(self):
+    """プロンプトレベルのみの評価が完全な評価と同じ判定になるかのテスト。"""
+    inputs, prompt_to_response = _make_inputs()
+    for inp in inputs:
+      expected = evaluation_lib.test_instruction_following_strict_and_loose(
+          inp, prompt_to_response)
+      actual = evaluation_lib.test_instruction_following_prompt_level(
+          inp, prompt_to_response)
+      for expected_output, actual_output in zip(expected, actual):
+        self.assertEqual(expected_output.follow_all_instructions,
+                         actual_output.follow_all_instructions)
+        # 評価した指示の判定は完全な評価と一致すること。
+        for expected_verdict, actual_verdict in zip(
+            expected_output.follow_instruction_list,
+            actual_output.follow_instruction_list):
+          if actual_verdict is not None:
+            self.assertEqual(expected_verdict, actual_verdict)
+    # 安価な`punctuation:no_comma`に失敗した応答では`title`の評価を省くこと。
+    strict, _ = evaluation_lib.test_instruction_following_prompt_level(
+        inputs[1], prompt_to_response)
+    self.assertEqual([False, None], strict.follow_instruction_list)
+
+  def test_prompt_level_checker_calls(self):
+    """呼び出し回数が実際の呼び出しの数と完全な評価との差に一致するかのテスト。"""
+    inputs, prompt_to_response = _make_inputs()
+    evaluation_lib.prepare_inputs(inputs)
+    checked = []
+    check_following = evaluation_lib._check_following
+
+    def record(instruction, response, variant):
+      checked.append(instruction)
+      return check_following(instruction, response, variant)
+
+    evaluation_lib.take_checker_calls()
+    total_saved = 0
+    with mock.patch.object(evaluation_lib, "_check_following", record):
+      for inp in inputs:
+        del checked[:]
+        _, loose = evaluation_lib.test_instruction_following_prompt_level(
+            inp, prompt_to_response)
+        checker_calls = evaluation_lib.take_checker_calls()
+        self.assertLen(checked, checker_calls.calls)
+        # 緩い評価の判定がNoneの指示のみでチェッカーが呼び出されないこと。
+        for index, verdict in enumerate(loose.follow_instruction_list):
+          instruction = evaluation_lib.get_prepared_instruction(
+              inp.instruction_id_list[index], inp.kwargs[index], inp.prompt)
+          self.assertEqual(verdict is None,
+                           all(c is not instruction for c in checked))
+        self.assertEqual(loose.follow_instruction_list.count(None),
+                         checker_calls.saved)
+
+        del checked[:]
+        evaluation_lib.test_instruction_following_strict_and_loose(
+            inp, prompt_to_response)
+        full_calls = evaluation_lib.take_checker_calls()
+        self.assertLen(checked, full_calls.calls)
+        self.assertEqual(0, full_calls.saved)
+        # 評価を省かなかった場合は完全な評価と同じ回数で、省いた場合の
+        # 回数の合計は完全な評価の回数を超えないこと。
+        if checker_calls.saved:
+          self.assertLessEqual(checker_calls.calls + checker_calls.saved,
+                               full_calls.calls)
+        else:
+          self.assertEqual(full_calls.calls, checker_calls.calls)
+        total_saved += checker_calls.saved
+    self.assertGreater(total_saved, 0)
+
+  def test_checker_calls_merge_worker_counts(self):
+    """ワーカープロセスでの呼び出し回数も集められるかのテスト。"""
+    inputs, prompt_to_response = _make_inputs()
+    pairs = [(inp, prompt_to_response[inp.prompt]) for inp in inputs]
+    evaluation_lib.prepare_inputs(inputs)
+    evaluation_lib.take_checker_calls()
+    counts = []
+    for num_workers in (1, 3):
+      list(evaluation_lib.evaluate_input_response_pairs(
+          pairs, num_workers=num_workers, prompt_level_only=True))
+      counts.append(evaluation_lib.take_checker_calls())
+    self.assertEqual(counts[0], counts[1])
+    self.assertGreater(counts[0].saved, 0)
+    self.assertEqual(
+        f"checker calls: {counts[0].calls} of "
+        f"{counts[0].calls + counts[0].saved}, saved {counts[0].saved}",
+        counts[0].format_summary())
+
+  def test_response_analyses_are_released(self):
+    """評価を終えた例の応答の解析結果をキャッシュに残さないかのテスト。"""
+    inp = evaluation_lib.InputExample(
+        key=0,
+        instruction_id_list=["length_constraints:number_words"],
+        prompt="Answer in at least three words.",
+        kwargs=[{"relation": "at least", "num_words": 3}],
+    )
+    # 厳密な評価に失敗し、緩い評価の変形も解析される応答。
+    prompt_to_response = {inp.prompt: "*Too*\nshort"}
+    evaluation_lib.prepare_inputs([inp])
+    analyses = []
+
+    class RecordedAnalysis(instructions_util.ResponseAnalysis):
+
+      def __init__(self, text):
+        super().__init__(text)
+        analyses.append(weakref.ref(self))
+
+    for evaluate in (
+        evaluation_lib.test_instruction_following_strict,
+        evaluation_lib.test_instruction_following_loose,
+        evaluation_lib.test_instruction_following_strict_and_loose,
+        evaluation_lib.test_instruction_following_prompt_level,
+    ):
+      with self.subTest(evaluate.__name__), mock.patch.object(
+          instructions_util, "ResponseAnalysis", RecordedAnalysis):
+        del analyses[:]
+        evaluate(inp, prompt_to_response)
+        self.assertNotEmpty(analyses)
+        self.assertEqual(
+            0, instructions_util.analyze_response.cache_info().currsize)
+        self.assertEqual([None] * len(analyses),
+                         [analysis() for analysis in analyses])
+
+  def test_loose_response_variants(self):
+    """遅延して作成した変形が従来の変形と一致するかのテスト。"""
+    for response in ["", "one line", "*one* line", "first\nlast",
+                     " first \n*middle*\n\n last *\n", "\n\n", "a\n*\nb"]:
+      with self.subTest(response=response):
+        r = response.split("\n")
+        remove_first = "\n".join(r[1:]).strip()
+        remove_last = "\n".join(r[:-1]).strip()
+        remove_both = "\n".join(r[1:-1]).strip()
+        expected = [
+            response, response.replace("*", ""),
+            remove_first, remove_last, remove_both,
+            remove_first.replace("*", ""), remove_last.replace("*", ""),
+            remove_both.replace("*", ""),
+        ]
+        variants = evaluation_lib.LooseResponseVariants(response)
+        self.assertEqual(expected, [variants[i] for i in range(len(variants))])
+        for i in range(len(variants)):
+          if variants.is_duplicate(i):
+            self.assertIn(variants[i], expected[:i])
+
+  def test_streaming_evaluation_matches_in_memory(self):
+    """ストリーミング評価がメモリ上の評価と一致するかのテスト。"""
+    inputs, prompt_to_response = _make_inputs()
+    # 応答ファイルの順序が入力と異なる場合も正しく対応付けられること。
+    response_file = os.path.join(self._make_tempdir(), "responses.jsonl")
+    with open(response_file, "w") as f:
+      for prompt, response in reversed(list(prompt_to_response.items())):
+        f.write(json.dumps({"prompt": prompt, "response": response}) + "\n")
+    expected = [
+        evaluation_lib.test_instruction_following_strict_and_loose(
+            inp, prompt_to_response) for inp in inputs
+    ]
+    for num_workers in (1, 3):
+      with self.subTest(num_workers=num_workers):
+        pairs = evaluation_lib.iter_input_response_pairs(
+            iter(inputs), response_file)
+        actual = evaluation_lib.evaluate_input_response_pairs(
+            pairs, num_workers=num_workers, window_size=7)
+        self.assertEqual(expected, list(actual))
+
+  def test_streaming_repeated_prompts(self):
+    """同じプロンプトの入力が複数ある場合もメモリ上の評価と一致するかのテスト。"""
+    inputs, prompt_to_response = _make_inputs()
+    # 離れた位置と連続した位置で同じプロンプトを繰り返します。
+    inputs = (inputs[:10] + [inputs[3], inputs[0]] + inputs[10:] +
+              [inputs[3], inputs[-1], inputs[-1]])
+    response_file = os.path.join(self._make_tempdir(), "responses.jsonl")
+    with open(response_file, "w") as f:
+      for prompt, response in reversed(list(prompt_to_response.items())):
+        f.write(json.dumps({"prompt": prompt, "response": response}) + "\n")
+    expected = [(inp, prompt_to_response[inp.prompt]) for inp in inputs]
+    pairs = evaluation_lib.iter_input_response_pairs(
+        iter(inputs), response_file,
+        repeated_prompts=evaluation_lib.count_repeated_prompts(inputs))
+    self.assertEqual(expected, list(pairs))
+    self.assertEqual(
+        {inputs[0].prompt: 2, inputs[3].prompt: 3, inputs[-1].prompt: 3},
+        evaluation_lib.count_repeated_prompts(inputs))
+
+  def test_sharded_reading_skips_other_shards(self):
+    """シャードの読み込みが他のシャードの応答を読み飛ばすかのテスト。"""
+    inputs, prompt_to_response = _make_inputs()
+    response_file = os.path.join(self._make_tempdir(), "responses.jsonl")
+    with open(response_file, "w") as f:
+      for prompt, response in reversed(list(prompt_to_response.items())):
+        f.write(json.dumps({"prompt": prompt, "response": response}) + "\n")
+    num_shards = 3
+    shards = [[] for _ in range(num_shards)]
+    for inp in inputs:
+      shards[evaluation_lib.shard_of(inp.prompt, num_shards)].append(inp)
+    self.assertTrue(all(shards))
+    for shard_index, shard_inputs in enumerate(shards):
+      self.assertEqual(
+          {inp.prompt: prompt_to_response[inp.prompt] for inp in shard_inputs},
+          evaluation_lib.read_prompt_to_response_dict(
+              response_file, shard_index, num_shards))
+      self.assertEqual(
+          [(inp, prompt_to_response[inp.prompt]) for inp in shard_inputs],
+          list(evaluation_lib.iter_input_response_pairs(
+              iter(shard_inputs), response_file, shard_index, num_shards)))
+
+  def test_write_output_format(self):
+    """評価結果の行のキーが名前の順に並び、標準ライブラリの形式になるかのテスト。"""
+    output = evaluation_lib.OutputExample(
+        instruction_id_list=["punctuation:no_comma"],
+        prompt="Prompt é",
+        response="Answer",
+        follow_all_instructions=False,
+        follow_instruction_list=[None],
+    )
+    f = io.StringIO()
+    evaluation_lib.write_output(f, output)
+    self.assertEqual(
+        '{"follow_all_instructions": false, "follow_instruction_list": [null],'
+        ' "instruction_id_list": ["punctuation:no_comma"],'
+        ' "prompt": "Prompt \\u00e9", "response": "Answer"}\n',
+        f.getvalue())
+
+  def test_merge_shard_results_restores_input_order(self):
+    """シャードの評価結果が入力の順序にまとめられるかのテスト。"""
+    inputs, prompt_to_response = _make_inputs()
+    outputs = [
+        strict for strict, _ in evaluation_lib.evaluate_input_response_pairs(
+            (inp, prompt_to_response[inp.prompt]) for inp in inputs)
+    ]
+    num_shards = 3
+    files = [io.StringIO() for _ in range(num_shards)]
+    accumulators = [
+        evaluation_lib.ShardAccumulator() for _ in range(num_shards)]
+    expected = io.StringIO()
+    expected_accumulator = evaluation_lib.ReportAccumulator()
+    for index, (inp, output) in enumerate(zip(inputs, outputs)):
+      shard_index = evaluation_lib.shard_of(inp.prompt, num_shards)
+      evaluation_lib.write_output(files[shard_index], output)
+      accumulators[shard_index].add(index, output)
+      evaluation_lib.write_output(expected, output)
+      expected_accumulator.add(output)
+
+    # 集計はJSONを経由してもまとめられること。
+    shards = [
+        (io.StringIO(f.getvalue()), json.loads(json.dumps(a.to_json())))
+        for f, a in zip(files, accumulators)
+    ]
+    actual_accumulator = evaluation_lib.ReportAccumulator()
+    lines = []
+    for line, instruction_id_list, follow_instruction_list in (
+        evaluation_lib.merge_shard_results(shards)):
+      lines.append(line)
+      actual_accumulator.add_verdicts(
+          instruction_id_list, follow_instruction_list)
+    self.assertEqual(expected.getvalue(), "".join(lines))
+    self.assertEqual(expected_accumulator.report(100),
+                     actual_accumulator.report(100))
+
+    # 同じ入力が複数のシャードに含まれる場合はエラーになります。
+    duplicated = [(io.StringIO(files[0].getvalue()), accumulators[0].to_json())
+                  for _ in range(2)]
+    with self.assertRaises(ValueError):
+      list(evaluation_lib.merge_shard_results(duplicated))
+
+  def test_result_cache_skips_evaluated_pairs(self):
+    """評価結果のキャッシュを使った評価がキャッシュなしの評価と一致するかのテスト。"""
+    inputs, prompt_to_response = _make_inputs()
+    pairs = [(inp, prompt_to_response[inp.prompt]) for inp in inputs]
+    expected = list(evaluation_lib.evaluate_input_response_pairs(pairs))
+    cache = result_cache.ResultCache(
+        os.path.join(self._make_tempdir(), "cache.sqlite"))
+    self.addCleanup(cache.close)
+    num_instructions = sum(len(inp.instruction_id_list) for inp in inputs)
+    for num_workers in (1, 1, 3):
+      actual = evaluation_lib.evaluate_input_response_pairs(
+          pairs, num_workers=num_workers, window_size=7, result_cache=cache)
+      self.assertEqual(expected, list(actual))
+    self.assertEqual(num_instructions, cache.misses)
+    self.assertEqual(2 * num_instructions, cache.hits)
+
+    # 応答が変わった組のみがキャッシュに当たりません。
+    changed_pairs = [(inputs[0], "Changed, response")] + pairs[1:]
+    list(evaluation_lib.evaluate_input_response_pairs(
+        changed_pairs, result_cache=cache))
+    self.assertEqual(num_instructions + 2, cache.misses)
+
+  def test_profiling_merges_worker_samples(self):
+    """ワーカープロセスでの呼び出しも記録されるかのテスト。"""
+    inputs, prompt_to_response = _make_inputs()
+    pairs = [(inp, prompt_to_response[inp.prompt]) for inp in inputs]
+    evaluation_lib.clear_prepared_instructions()
+    evaluation_lib.prepare_inputs(inputs)
+    self.addCleanup(evaluation_lib.disable_profiling)
+    counts = []
+    for num_workers in (1, 3):
+      evaluation_lib.enable_profiling()
+      list(evaluation_lib.evaluate_input_response_pairs(
+          pairs, num_workers=num_workers))
+      profile = evaluation_lib.take_profile()
+      counts.append({
+          (row["instruction_id"], row["variant"]): row["count"]
+          for row in profile.rows()
+      })
+    self.assertEqual(counts[0], counts[1])
+    # 厳密な評価は指示ごとに1回呼び出されます。
+    self.assertEqual(len(inputs), counts[0]["punctuation:no_comma", 0])
+    self.assertIn("detectable_format:title", profile.format_summary())
+
+  def test_prepared_instructions_are_reused(self):
+    """同じ指示と引数とプロンプトに対して構築済みの指示が再利用されるかのテスト。"""
+    evaluation_lib.clear_prepared_instructions()
+    instruction = evaluation_lib.get_prepared_instruction(
+        "keywords:existence", {"keywords": ["alpha", "beta"]}, "prompt")
+    self.assertIs(
+        instruction,
+        evaluation_lib.get_prepared_instruction(
+            "keywords:existence", {"keywords": ["alpha", "beta"]}, "prompt"))
+    self.assertIsNot(
+        instruction,
+        evaluation_lib.get_prepared_instruction(
+            "keywords:existence", {"keywords": ["alpha"]}, "prompt"))
+    self.assertTrue(instruction.check_following("Alpha and beta."))
+
+
+if __name__ == "__main__":
+  absltest.main()
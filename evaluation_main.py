@@ -14,6 +14,8 @@
 
 """指示追従評価のバイナリ。README.mdを参照してください。"""
 
+import glob
+import json
 import os
 from typing import Sequence
 
@@ -22,14 +24,24 @@ from absl import flags
 from absl import logging
 
 from instruction_following_eval import evaluation_lib
+from instruction_following_eval import instructions_util
+from instruction_following_eval import json_backend
+from instruction_following_eval import language_detection
+from instruction_following_eval import response_store
+from instruction_following_eval import result_cache
 
 
 _INPUT_DATA = flags.DEFINE_string(
     "input_data", None, "入力データへのパス", required=True
 )
 
-_INPUT_RESPONSE_DATA = flags.DEFINE_string(
-    "input_response_data", None, "入力応答データへのパス", required=False
+_INPUT_RESPONSE_DATA = flags.DEFINE_list(
+    "input_response_data",
+    None,
+    "入力応答データへのパス。カンマ区切りのリストやglobパターンで複数の"
+    "ファイルを指定すると、各ファイルをモデルごとに評価し、結果を"
+    "`output_dir`配下のモデル名のディレクトリとリーダーボードに書き込みます。",
+    required=False,
 )
 
 _OUTPUT_DIR = flags.DEFINE_string(
@@ -39,38 +51,337 @@ _OUTPUT_DIR = flags.DEFINE_string(
     required=True,
 )
 
+_NUM_WORKERS = flags.DEFINE_integer(
+    "num_workers",
+    1,
+    "評価に使用するワーカープロセスの数。1の場合は単一プロセスで評価します。",
+)
+
+_STREAMING = flags.DEFINE_bool(
+    "streaming",
+    False,
+    "入力と応答を遅延して読み込み、評価結果を逐次書き込みます。"
+    "応答全体をメモリに保持しないため、巨大な応答ファイルに使用します。",
+)
+
+_LANGUAGE_DETECTOR = flags.DEFINE_enum(
+    "language_detector",
+    language_detection.LANGDETECT,
+    language_detection.BACKENDS,
+    "応答の言語検出に使う検出器。",
+)
+
+_SENTENCE_COUNTER = flags.DEFINE_enum(
+    "sentence_counter",
+    instructions_util.PUNKT,
+    instructions_util.SENTENCE_COUNTERS,
+    "文の数のカウンター。`rules`はnltkのpunktモデルを読み込まず、"
+    "punktと同じ手順をpunktのモデルから書き出した省略語の一覧で行います。",
+)
+
+_JSON_BACKEND = flags.DEFINE_enum(
+    "json_backend",
+    json_backend.AUTO,
+    json_backend.BACKENDS,
+    "jsonlの読み書きに使うJSONライブラリ。`auto`はインストールされている"
+    "最も速いライブラリで読み込み、標準ライブラリと同じ形式で書き込みます。"
+    "`orjson`と`msgspec`は空白を省いたUTF-8で評価結果を書き込みます。",
+)
+
+_RESULT_CACHE = flags.DEFINE_bool(
+    "result_cache",
+    False,
+    "指示ごとの評価結果を`output_dir`のSQLiteデータベースにキャッシュし、"
+    "評価済みの指示と応答の組の再評価を省きます。",
+)
+
+_INVALIDATE_RESULT_CACHE = flags.DEFINE_bool(
+    "invalidate_result_cache",
+    False,
+    "評価の前に評価結果のキャッシュを空にします。チェッカーのクラス以外の"
+    "変更（ユーティリティ関数など）の後に使用します。",
+)
+
+_NUM_BOOTSTRAP_SAMPLES = flags.DEFINE_integer(
+    "num_bootstrap_samples",
+    1000,
+    "精度の95%信頼区間を求めるブートストラップの標本数。0の場合は"
+    "信頼区間を計算しません。",
+)
+
+_PROMPT_LEVEL_ONLY = flags.DEFINE_bool(
+    "prompt_level_only",
+    False,
+    "プロンプトレベルの精度のみを求めます。指示を計測済みのコストの安い順に"
+    "評価し、従っていない指示が見つかった時点で残りの指示の評価を省きます。"
+    "省いた指示は評価結果の`follow_instruction_list`でnullになります。",
+)
+
+_NUM_SHARDS = flags.DEFINE_integer(
+    "num_shards",
+    1,
+    "入力をプロンプトのハッシュで分割するシャードの数。2以上の場合は"
+    "`shard_index`のシャードの入力のみを評価し、部分的な評価結果と"
+    "レポートの集計を`output_dir`に書き込みます。すべてのシャードを"
+    "評価した後、`merge_shards`で単一の実行と同じ出力にまとめます。",
+)
+
+_SHARD_INDEX = flags.DEFINE_integer(
+    "shard_index", 0, "評価するシャードの番号（0から`num_shards` - 1）。"
+)
+
+_PROFILE_CHECKERS = flags.DEFINE_bool(
+    "profile_checkers",
+    False,
+    "`check_following`と`build_description`の呼び出しごとのレイテンシを"
+    "指示IDと緩い評価の変形ごとに記録し、評価結果の隣に"
+    "`checker_profile.{json,csv}`として書き込みます。",
+)
+
+
+_RESULT_CACHE_FILE_NAME = "result_cache.sqlite"
+
+_PROFILE_FILE_NAME = "checker_profile"
+
+
+def _expand_response_files(patterns):
+  """ファイル名やglobパターンのリストを応答ファイルのリストに展開します。"""
+  response_files = []
+  for pattern in patterns:
+    matches = sorted(glob.glob(pattern))
+    if not matches:
+      raise app.UsageError(f"No input response data matches {pattern}.")
+    response_files.extend(matches)
+  return response_files
+
+
+def _model_name(response_file):
+  """応答ファイル名からモデル名を決めます。"""
+  return os.path.splitext(os.path.basename(response_file))[0]
+
+
+def _is_sharded():
+  return _NUM_SHARDS.value > 1
+
+
+def _shard_file_name(file_name):
+  """評価するシャードの番号を加えたファイル名を返します。"""
+  return evaluation_lib.shard_file_name(
+      file_name, _SHARD_INDEX.value, _NUM_SHARDS.value)
+
+
+def _iter_indexed_inputs(inputs):
+  """評価するシャードの入力を、入力データでの位置とともに返します。
+
+  Args:
+    inputs: `InputExample`のリスト。ストリーミングの場合はNone。
+
+  Yields:
+    `(入力データでの位置, InputExample)`の組。
+  """
+  if inputs is None:
+    inputs = evaluation_lib.iter_prompt_list(_INPUT_DATA.value)
+  for index, inp in enumerate(inputs):
+    if not _is_sharded() or evaluation_lib.shard_of(
+        inp.prompt, _NUM_SHARDS.value) == _SHARD_INDEX.value:
+      yield index, inp
+
+
+def _record_indices(indexed_inputs, input_indices):
+  """入力を返しながら、その入力データでの位置を`input_indices`に加えます。"""
+  for index, inp in indexed_inputs:
+    input_indices.append(index)
+    yield inp
+
+
+def _evaluate_response_file(response_file, output_dir, inputs, pool, cache,
+                            models=None):
+  """1つの応答ファイルを評価し、結果とレポートを出力します。
+
+  シャードを評価する場合は、レポートの代わりにシャードの評価結果と
+  レポートの集計を書き込みます。
+
+  Args:
+    response_file: 応答データへのパス。
+    output_dir: 評価結果の出力ディレクトリ。
+    inputs: `InputExample`のリスト。ストリーミングの場合はNone。
+    pool: ワーカープロセスのプール。単一プロセスの場合はNone。
+    cache: 評価結果の`result_cache.ResultCache`。使わない場合はNone。
+    models: 複数の応答ファイルを評価する場合の、評価する順のモデル名の
+      リスト。シャードの集計に記録され、リーダーボードの作成に使われます。
+
+  Returns:
+    厳密な評価と緩い評価の`ReportAccumulator`のリスト。
+  """
+  input_indices = []
+  shard_inputs = _record_indices(_iter_indexed_inputs(inputs), input_indices)
+  if _STREAMING.value:
+    # 入力データを先に一度読み、同じプロンプトの入力が複数ある場合は
+    # 最後の入力まで応答を保持します。
+    repeated_prompts = evaluation_lib.count_repeated_prompts(
+        inp for _, inp in _iter_indexed_inputs(inputs))
+    pairs = evaluation_lib.iter_input_response_pairs(
+        shard_inputs, response_file, _SHARD_INDEX.value, _NUM_SHARDS.value,
+        repeated_prompts)
+  else:
+    # 応答はすべて読み込まず、評価する入力の応答のみを必要なときに読みます。
+    prompt_to_response = response_store.ResponseStore(
+        response_file, _SHARD_INDEX.value, _NUM_SHARDS.value)
+    pairs = ((inp, prompt_to_response[inp.prompt]) for inp in shard_inputs)
+  results = evaluation_lib.evaluate_input_response_pairs(
+      pairs, num_workers=_NUM_WORKERS.value, pool=pool, result_cache=cache,
+      prompt_level_only=_PROMPT_LEVEL_ONLY.value)
+
+  # 厳密な評価と緩い評価の結果を1回の走査で取得し、逐次書き込みます。
+  base_names = [
+      os.path.join(output_dir, output_file_name)
+      for output_file_name in evaluation_lib.RESULT_FILE_NAMES
+  ]
+  output_file_names = [base_name + ".jsonl" for base_name in base_names]
+  if _is_sharded():
+    output_file_names = [_shard_file_name(name) for name in output_file_names]
+  accumulators = [evaluation_lib.ReportAccumulator() for _ in output_file_names]
+  shard_accumulators = [
+      evaluation_lib.ShardAccumulator() for _ in output_file_names]
+  logging.info("Generating %s...", ", ".join(output_file_names))
+  with open(output_file_names[0], "w", encoding="utf-8") as strict_file, open(
+      output_file_names[1], "w", encoding="utf-8") as loose_file:
+    output_files = [strict_file, loose_file]
+    for i, result in enumerate(results):
+      for output, f, accumulator, shard_accumulator in zip(
+          result, output_files, accumulators, shard_accumulators):
+        evaluation_lib.write_output(f, output)
+        accumulator.add(output)
+        if _is_sharded():
+          shard_accumulator.add(input_indices[i], output)
+  if not _STREAMING.value:
+    prompt_to_response.close()
+  checker_calls = evaluation_lib.take_checker_calls()
+
+  for base_name, output_file_name, accumulator, shard_accumulator in zip(
+      base_names, output_file_names, accumulators, shard_accumulators):
+    # プロンプトが割り当てられなかったシャードでは精度が求まりません。
+    if accumulator.num_examples:
+      logging.info("Accuracy: %f", accumulator.prompt_accuracy())
+    logging.info("Generated: %s", output_file_name)
+
+    if _is_sharded():
+      # レポートは`merge_shards`ですべてのシャードをまとめてから計算します。
+      accumulator_file_name = _shard_file_name(
+          base_name + evaluation_lib.ACCUMULATOR_FILE_SUFFIX)
+      with open(accumulator_file_name, "w") as f:
+        json.dump({
+            "shard_index": _SHARD_INDEX.value,
+            "num_shards": _NUM_SHARDS.value,
+            "models": models,
+            "num_bootstrap_samples": _NUM_BOOTSTRAP_SAMPLES.value,
+            "prompt_level_only": _PROMPT_LEVEL_ONLY.value,
+            "checker_calls": checker_calls.to_json(),
+        } | shard_accumulator.to_json(), f)
+      logging.info("Generated: %s", accumulator_file_name)
+      continue
+
+    if not accumulator.num_examples:
+      logging.warning("No examples were evaluated; skipping the report.")
+      continue
+
+    # 指示追従精度レポートをテキストとJSONで出力します。
+    report_file_name = evaluation_lib.write_report(
+        output_file_name, accumulator, _NUM_BOOTSTRAP_SAMPLES.value,
+        _PROMPT_LEVEL_ONLY.value)
+    logging.info("Generated: %s", report_file_name)
+  if (_PROMPT_LEVEL_ONLY.value and not _is_sharded() and
+      accumulators[1].num_examples):
+    print(checker_calls.format_summary())
+
+  profile = evaluation_lib.take_profile()
+  if profile:
+    profile_file_name = os.path.join(output_dir, _PROFILE_FILE_NAME)
+    if _is_sharded():
+      profile_file_name = _shard_file_name(profile_file_name)
+    profile.write_json(profile_file_name + ".json")
+    profile.write_csv(profile_file_name + ".csv")
+    logging.info("Generated: %s.{json,csv}", profile_file_name)
+    print("=" * 64)
+    print(f"{profile_file_name} Checker Profile:")
+    print(profile.format_summary())
+  return accumulators
+
 
 def main(argv):
   if len(argv) > 1:
     raise app.UsageError("コマンドライン引数が多すぎます。")
+  if not _INPUT_RESPONSE_DATA.value:
+    raise app.UsageError("--input_response_data must be specified.")
 
-  inputs = evaluation_lib.read_prompt_list(_INPUT_DATA.value)
-  prompt_to_response = evaluation_lib.read_prompt_to_response_dict(
-      _INPUT_RESPONSE_DATA.value)
-
-  # 指示追従の結果を取得
-  for func, output_file_name in [
-      (evaluation_lib.test_instruction_following_strict, "eval_results_strict"),
-      (evaluation_lib.test_instruction_following_loose, "eval_results_loose"),
-  ]:
-    logging.info("Generating %s...", output_file_name)
-    outputs = []
-    for inp in inputs:
-      outputs.append(func(inp, prompt_to_response))
-    follow_all_instructions = [o.follow_all_instructions for o in outputs]
-    accuracy = sum(follow_all_instructions) / len(outputs)
-    logging.info("Accuracy: %f", accuracy)
-
-    output_file_name = os.path.join(
-        _OUTPUT_DIR.value, output_file_name + ".jsonl"
-    )
-    evaluation_lib.write_outputs(output_file_name, outputs)
-    logging.info("Generated: %s", output_file_name)
+  if _PROMPT_LEVEL_ONLY.value and _RESULT_CACHE.value:
+    raise app.UsageError(
+        "--prompt_level_only cannot be used together with --result_cache.")
+  if not 0 <= _SHARD_INDEX.value < _NUM_SHARDS.value:
+    raise app.UsageError(
+        f"--shard_index must be in [0, {_NUM_SHARDS.value}).")
 
-    # 指示追従精度レポートを出力します。
-    print("=" * 64)
-    print(f"{output_file_name} Accuracy Scores:")
-    evaluation_lib.print_report(outputs)
+  language_detection.set_backend(_LANGUAGE_DETECTOR.value)
+  instructions_util.set_sentence_counter(_SENTENCE_COUNTER.value)
+  try:
+    json_backend.set_backend(_JSON_BACKEND.value)
+  except ValueError as e:
+    raise app.UsageError(str(e)) from e
+  if _PROFILE_CHECKERS.value:
+    evaluation_lib.enable_profiling()
+
+  response_files = _expand_response_files(_INPUT_RESPONSE_DATA.value)
+  # 応答ファイルが1つの場合は従来どおり`output_dir`に直接書き込みます。
+  models = None
+  if len(response_files) == 1:
+    output_dirs = [_OUTPUT_DIR.value]
+  else:
+    models = [_model_name(response_file) for response_file in response_files]
+    if len(set(models)) != len(models):
+      raise app.UsageError(
+          f"Input response data must have distinct file names: {models}")
+    output_dirs = [os.path.join(_OUTPUT_DIR.value, model) for model in models]
+
+  # 入力と構築済みの指示はすべての応答ファイルで共有します。
+  inputs = None
+  if not _STREAMING.value:
+    inputs = evaluation_lib.read_prompt_list(_INPUT_DATA.value)
+    evaluation_lib.prepare_inputs(
+        inp for _, inp in _iter_indexed_inputs(inputs))
+
+  # 評価結果のキャッシュは内容でアドレスされるため、すべてのモデルで共有します。
+  cache = None
+  if _RESULT_CACHE.value:
+    os.makedirs(_OUTPUT_DIR.value, exist_ok=True)
+    cache = result_cache.ResultCache(
+        os.path.join(_OUTPUT_DIR.value, _RESULT_CACHE_FILE_NAME))
+    if _INVALIDATE_RESULT_CACHE.value:
+      cache.clear()
+
+  pool = None
+  if _NUM_WORKERS.value > 1:
+    pool = evaluation_lib.create_pool(_NUM_WORKERS.value)
+  try:
+    model_to_accumulators = {}
+    for response_file, output_dir in zip(response_files, output_dirs):
+      os.makedirs(output_dir, exist_ok=True)
+      model_to_accumulators[_model_name(response_file)] = (
+          _evaluate_response_file(
+              response_file, output_dir, inputs, pool, cache, models))
+  finally:
+    if pool is not None:
+      pool.close()
+      pool.join()
+    if cache is not None:
+      logging.info("Result cache: %d hits, %d misses.", cache.hits,
+                   cache.misses)
+      cache.close()
+
+  # シャードのリーダーボードは`merge_shards`でまとめてから作成します。
+  if len(response_files) > 1 and not _is_sharded():
+    evaluation_lib.write_leaderboard(
+        os.path.join(_OUTPUT_DIR.value, evaluation_lib.LEADERBOARD_FILE_NAME),
+        model_to_accumulators, _PROMPT_LEVEL_ONLY.value)
 
 
 if __name__ == "__main__":
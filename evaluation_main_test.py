@@ -0,0 +1,174 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""evaluation_mainとmerge_shardsのテスト。"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from absl.testing import absltest
+from instruction_following_eval import evaluation_lib
+
+
+def _write_data(tempdir, include_prompt=None):
+  """nltkのデータを必要としない指示のみを使った入力と応答を書き込みます。
+
+  Args:
+    tempdir: 入力と応答のファイルを書き込むディレクトリ。
+    include_prompt: プロンプトを受け取り、書き込むかどうかを返す関数。
+      Noneの場合はすべてのプロンプトを書き込みます。
+
+  Returns:
+    入力データと応答データのファイル名の組。
+  """
+  input_file = os.path.join(tempdir, "input_data.jsonl")
+  response_file = os.path.join(tempdir, "responses.jsonl")
+  with open(input_file, "w") as inputs, open(response_file, "w") as responses:
+    for i in range(60):
+      prompt = f"Prompt {i}: write a titled answer without commas."
+      if include_prompt is not None and not include_prompt(prompt):
+        continue
+      inputs.write(json.dumps({
+          "key": i,
+          "instruction_id_list": [
+              "punctuation:no_comma", "detectable_format:title"],
+          "prompt": prompt,
+          "kwargs": [{}, {}],
+      }) + "\n")
+      response = [
+          f"<<Title {i}>>\n*Answer* number {i}",
+          f"Answer, number {i}",
+          f"Intro, answer\n**<<Title {i}>>**\nOutro",
+      ][i % 3]
+      responses.write(
+          json.dumps({"prompt": prompt, "response": response}) + "\n")
+  return input_file, response_file
+
+
+def _run(module, *args):
+  """モジュールを別のプロセスで実行し、標準出力を返します。"""
+  return subprocess.run(
+      [sys.executable, "-m", f"instruction_following_eval.{module}", *args],
+      check=True, capture_output=True, text=True).stdout
+
+
+class EvaluationMainTest(absltest.TestCase):
+
+  def _make_tempdir(self):
+    tempdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, tempdir)
+    return tempdir
+
+  def test_merged_shards_match_single_run(self):
+    """ノードの代わりのプロセスで評価したシャードが単一の実行と一致するかのテスト。"""
+    tempdir = self._make_tempdir()
+    input_file, response_file = _write_data(tempdir)
+    flags = [f"--input_data={input_file}",
+             f"--input_response_data={response_file}",
+             "--num_bootstrap_samples=50"]
+    single_dir = os.path.join(tempdir, "single")
+    sharded_dir = os.path.join(tempdir, "sharded")
+    expected_stdout = _run("evaluation_main", *flags,
+                           f"--output_dir={single_dir}")
+
+    num_shards = 3
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-m", "instruction_following_eval.evaluation_main",
+             *flags, f"--output_dir={sharded_dir}",
+             f"--num_shards={num_shards}", f"--shard_index={shard_index}"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for shard_index in range(num_shards)
+    ]
+    for process in processes:
+      self.assertEqual(0, process.wait())
+    stdout = _run("merge_shards", f"--output_dir={sharded_dir}")
+
+    self.assertEqual(expected_stdout.replace(single_dir, sharded_dir), stdout)
+    for file_name in ["eval_results_strict.jsonl", "eval_results_loose.jsonl",
+                      "eval_results_strict_report.json",
+                      "eval_results_loose_report.json"]:
+      with self.subTest(file_name):
+        with open(os.path.join(single_dir, file_name)) as f:
+          expected = f.read()
+        with open(os.path.join(sharded_dir, file_name)) as f:
+          self.assertEqual(expected, f.read())
+
+  def test_empty_shard(self):
+    """プロンプトが割り当てられないシャードがあってもまとめられるかのテスト。"""
+    tempdir = self._make_tempdir()
+    num_shards = 2
+    input_file, response_file = _write_data(
+        tempdir,
+        lambda prompt: evaluation_lib.shard_of(prompt, num_shards) == 0)
+    flags = [f"--input_data={input_file}",
+             f"--input_response_data={response_file}",
+             "--num_bootstrap_samples=0"]
+    single_dir = os.path.join(tempdir, "single")
+    sharded_dir = os.path.join(tempdir, "sharded")
+    expected_stdout = _run("evaluation_main", *flags,
+                           f"--output_dir={single_dir}")
+    for shard_index in range(num_shards):
+      _run("evaluation_main", *flags, f"--output_dir={sharded_dir}",
+           f"--num_shards={num_shards}", f"--shard_index={shard_index}")
+    with open(os.path.join(
+        sharded_dir, "eval_results_strict-00001-of-00002.jsonl")) as f:
+      self.assertEmpty(f.read())
+    self.assertTrue(os.path.exists(os.path.join(
+        sharded_dir, "eval_results_strict_accumulator-00001-of-00002.json")))
+
+    stdout = _run("merge_shards", f"--output_dir={sharded_dir}")
+    self.assertEqual(expected_stdout.replace(single_dir, sharded_dir), stdout)
+    with open(os.path.join(single_dir, "eval_results_strict.jsonl")) as f:
+      expected = f.read()
+    with open(os.path.join(sharded_dir, "eval_results_strict.jsonl")) as f:
+      self.assertEqual(expected, f.read())
+
+  def test_merged_prompt_level_shards_match_single_run(self):
+    """プロンプトレベルのみの評価のシャードの呼び出し回数がまとめられるかのテスト。"""
+    tempdir = self._make_tempdir()
+    input_file, response_file = _write_data(tempdir)
+    flags = [f"--input_data={input_file}",
+             f"--input_response_data={response_file}",
+             "--num_bootstrap_samples=0", "--prompt_level_only"]
+    single_dir = os.path.join(tempdir, "single")
+    sharded_dir = os.path.join(tempdir, "sharded")
+    expected_stdout = _run("evaluation_main", *flags,
+                           f"--output_dir={single_dir}")
+    self.assertIn("checker calls: ", expected_stdout)
+
+    num_shards = 3
+    for shard_index in range(num_shards):
+      _run("evaluation_main", *flags, f"--output_dir={sharded_dir}",
+           f"--num_shards={num_shards}", f"--shard_index={shard_index}")
+    stdout = _run("merge_shards", f"--output_dir={sharded_dir}")
+    self.assertEqual(expected_stdout.replace(single_dir, sharded_dir), stdout)
+
+  def test_merge_requires_all_shards(self):
+    """シャードが欠けている場合にまとめられないかのテスト。"""
+    tempdir = self._make_tempdir()
+    input_file, response_file = _write_data(tempdir)
+    _run("evaluation_main", f"--input_data={input_file}",
+         f"--input_response_data={response_file}", f"--output_dir={tempdir}",
+         "--num_shards=2", "--shard_index=1")
+    with self.assertRaises(subprocess.CalledProcessError):
+      _run("merge_shards", f"--output_dir={tempdir}")
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -14,16 +14,16 @@
 
 """指示のライブラリ。"""
 import collections
-import json
 import random
 import re
 import string
 from typing import Dict, Optional, Sequence, Union
 
 from absl import logging
-import langdetect
 
 from instruction_following_eval import instructions_util
+from instruction_following_eval import json_validation
+from instruction_following_eval import language_detection
 
 
 _InstructionArgsDtype = Optional[Dict[str, Union[int, str, Sequence[str]]]]
@@ -89,6 +89,12 @@ _ALL_CAPITAL_WORD_FREQUENCY = 20
 _NUM_WORDS_LOWER_LIMIT = 100
 _NUM_WORDS_UPPER_LIMIT = 500
 
+# 指示の引数に依存しないパターン。
+_CHANGE_PATTERN = re.compile(r"\*.*\*")
+_WORD_PATTERN = re.compile(r"\w+")
+_TITLE_PATTERN = re.compile(r"<<[^\n]+>>")
+_COMMA_PATTERN = re.compile(r"\,")
+
 
 class Instruction:
   """指示テンプレート。"""
@@ -154,8 +160,8 @@ class ResponseLanguageChecker(Instruction):
     assert isinstance(value, str)
 
     try:
-      return langdetect.detect(value) == self._language
-    except langdetect.LangDetectException as e:
+      return language_detection.detect_language(value) == self._language
+    except language_detection.LanguageDetectionError as e:
       # 指示に従っていると見なす。
       logging.error(
           "Unable to detect language for text %s due to %s", value, e
@@ -223,7 +229,7 @@ class NumberOfSentences(Instruction):
         `instruction_args`の文字列が[`less_than`, `at_least`]に
         含まれていない場合はValueError。
     """
-    num_sentences = instructions_util.count_sentences(value)
+    num_sentences = instructions_util.analyze_response(value).num_sentences
     if self._comparison_relation == _COMPARISON_RELATION[0]:
       return num_sentences < self._num_sentences_threshold
     elif self._comparison_relation == _COMPARISON_RELATION[1]:
@@ -270,8 +276,7 @@ class PlaceholderChecker(Instruction):
       応答内の実際のプレースホルダーの数が`num_placeholders`以上の
       場合はTrue、そうでない場合はFalse。
     """
-    placeholders = re.findall(r"\[.*?\]", value)
-    num_placeholders = len(placeholders)
+    num_placeholders = instructions_util.count_placeholders(value)
     return num_placeholders >= self._num_placeholders
 
 
@@ -317,9 +322,23 @@ class BulletListChecker(Instruction):
     Returns:
       応答内の実際の箇条書きリストの数が要件を満たしている場合はTrue。
     """
-    bullet_lists = re.findall(r"^\s*\*[^\*].*$", value, flags=re.MULTILINE)
-    bullet_lists_2 = re.findall(r"^\s*-.*$", value, flags=re.MULTILINE)
-    num_bullet_lists = len(bullet_lists) + len(bullet_lists_2)
+    # `^\s*\*[^\*].*$`と`^\s*-.*$`（`re.MULTILINE`）の一致の数を、行ごとの
+    # 最初の空白でない文字から数えます。"*"で終わる行では`[^\*]`が改行に、
+    # `.*`が次の行に一致するため、次の行の"*"は数えません。
+    line_index = instructions_util.analyze_response(value).line_index
+    num_bullet_lists = 0
+    skipped_line_start = -1
+    for line_start, start in line_index.non_blank_lines():
+      first_char = value[start]
+      if first_char == "-":
+        num_bullet_lists += 1
+      elif first_char == "*" and line_start != skipped_line_start:
+        next_char = value[start + 1:start + 2]
+        if next_char == "\n":
+          num_bullet_lists += 1
+          skipped_line_start = start + 2
+        elif next_char and next_char != "*":
+          num_bullet_lists += 1
     return num_bullet_lists == self._num_bullets
 
 
@@ -375,6 +394,8 @@ class ConstrainedStartChecker(Instruction):
     self._starter = starter.strip() if isinstance(starter, str) else starter
     if self._starter is None:
       self._starter = random.choice(_STARTER_OPTIONS)
+    self._starter_pattern = instructions_util.compile_pattern(
+        r"^\s*" + self._starter + r".*$", re.MULTILINE)
     self._description_pattern = (
         "During the conversation, when it is your turn, " +
         "please always start with {starter}")
@@ -398,9 +419,7 @@ class ConstrainedStartChecker(Instruction):
       応答が`instruction_args`に含まれる指定されたフレーズまたは
       キーワードで始まる場合はTrue、そうでない場合はFalse。
     """
-    response_pattern = r"^\s*" + self._starter + r".*$"
-    response_with_constrained_start = re.search(response_pattern, value,
-                                                flags=re.MULTILINE)
+    response_with_constrained_start = self._starter_pattern.search(value)
     return True if response_with_constrained_start else False
 
 
@@ -445,16 +464,7 @@ class HighlightSectionChecker(Instruction):
       *ハイライトされたセクション*の形式での実際のハイライトされた
       セクションの数が最小要件を満たしている場合はTrue、そうでない場合はFalse。
     """
-    num_highlights = 0
-    highlights = re.findall(r"\*[^\n\*]*\*", value)
-    double_highlights = re.findall(r"\*\*[^\n\*]*\*\*", value)
-    for highlight in highlights:
-      if highlight.strip("*").strip():
-        num_highlights += 1
-    for highlight in double_highlights:
-      if highlight.removeprefix("**").removesuffix("**").strip():
-        num_highlights += 1
-
+    num_highlights = instructions_util.count_highlighted_sections(value)
     return num_highlights >= self._num_highlights
 
 
@@ -477,6 +487,8 @@ class SectionChecker(Instruction):
         section_spliter, str) else section_spliter
     if self._section_spliter is None:
       self._section_spliter = random.choice(_SECTION_SPLITER)
+    self._section_splitter_pattern = instructions_util.compile_pattern(
+        r"\s?" + self._section_spliter + r"\s?\d+\s?")
 
     self._num_sections = num_sections
     if self._num_sections is None or self._num_sections < 0:
@@ -515,8 +527,7 @@ class SectionChecker(Instruction):
       応答内のセクション数が最小セクション数以上の場合はTrue、
       そうでない場合はFalse。
     """
-    section_splitter_patten = r"\s?" + self._section_spliter  + r"\s?\d+\s?"
-    sections = re.split(section_splitter_patten, value)
+    sections = self._section_splitter_pattern.split(value)
     num_sections = len(sections) - 1
     return num_sections >= self._num_sections
 
@@ -561,7 +572,7 @@ class ParagraphChecker(Instruction):
     Returns:
       実際の段落数が必要数と同じ場合はTrue、そうでない場合はFalse。
     """
-    paragraphs = re.split(r"\s?\*\*\*\s?", value)
+    paragraphs = instructions_util.analyze_response(value).divided_paragraphs
     num_paragraphs = len(paragraphs)
 
     for index, paragraph in enumerate(paragraphs):
@@ -593,6 +604,17 @@ class PostscriptChecker(Instruction):
     if self._postscript_marker is None:
       self._postscript_marker = random.choice(_POSTSCRIPT_MARKER)
 
+    # 追伸の有無のみを調べるため、先頭の`\s*`は一致の有無に影響しません。
+    # 空白の連続の各位置から`\s*`を試すと二乗の時間がかかるため省きます。
+    if self._postscript_marker == "P.P.S":
+      postscript_pattern = r"p\.\s?p\.\s?s.*$"
+    elif self._postscript_marker == "P.S.":
+      postscript_pattern = r"p\.\s?s\..*$"
+    else:
+      postscript_pattern = self._postscript_marker.lower() + r".*$"
+    self._postscript_pattern = instructions_util.compile_pattern(
+        postscript_pattern, re.MULTILINE)
+
     self._description_pattern = (
         "At the end of your response, please explicitly add a postscript " +
         "starting with {postscript}")
@@ -618,15 +640,8 @@ class PostscriptChecker(Instruction):
       応答に`instruction_args`に含まれるキーワードで始まる追伸セクションが
       含まれている場合はTrue、そうでない場合はFalse。
     """
-    value = value.lower()
-    if self._postscript_marker == "P.P.S":
-      postscript_pattern = r"\s*p\.\s?p\.\s?s.*$"
-    elif self._postscript_marker == "P.S.":
-      postscript_pattern = r"\s*p\.\s?s\..*$"
-    else:
-      postscript_pattern = r"\s*" + self._postscript_marker.lower() + r".*$"
-    postscript = re.findall(postscript_pattern, value, flags=re.MULTILINE)
-    return True if postscript else False
+    value = instructions_util.analyze_response(value).lower
+    return self._postscript_pattern.search(value) is not None
 
 
 class RephraseChecker(Instruction):
@@ -686,11 +701,11 @@ class RephraseChecker(Instruction):
 
   def is_change(self, response):
     """応答に*change me*の形式の変更があるかをチェックします。"""
-    return re.search(r"\*.*\*", response)
+    return _CHANGE_PATTERN.search(response)
 
   def strip_changes(self, response):
     """変更を削除します。"""
-    return re.sub(r"\*.*\*", "", response)
+    return _CHANGE_PATTERN.sub("", response)
 
 
 class KeywordChecker(Instruction):
@@ -713,6 +728,8 @@ class KeywordChecker(Instruction):
     else:
       self._keywords = keywords
     self._keywords = sorted(self._keywords)
+    self._keyword_matcher = instructions_util.KeywordMatcher(
+        self._keywords, re.IGNORECASE)
 
     self._description_pattern = ("Include keywords {keywords} in the response.")
 
@@ -728,10 +745,11 @@ class KeywordChecker(Instruction):
 
   def check_following(self, value):
     """応答に期待されるキーワードが含まれているかをチェックします。"""
-    for keyword in self._keywords:
-      if not re.search(keyword, value, flags=re.IGNORECASE):
-        return False
-    return True
+    return self._keyword_matcher.contains_all(value)
+
+  def get_matched_keywords(self, value):
+    """応答に含まれているキーワードの集合を返します。"""
+    return self._keyword_matcher.find_all(value)
 
 
 class KeywordFrequencyChecker(Instruction):
@@ -758,6 +776,8 @@ class KeywordFrequencyChecker(Instruction):
       self._keyword = instructions_util.generate_keywords(num_keywords=1)[0]
     else:
       self._keyword = keyword.strip()
+    self._keyword_pattern = instructions_util.compile_pattern(
+        self._keyword, re.IGNORECASE)
 
     self._frequency = frequency
     if self._frequency is None or self._frequency < 0:
@@ -792,8 +812,7 @@ class KeywordFrequencyChecker(Instruction):
 
   def check_following(self, value):
     """応答に必要な頻度でキーワードが含まれているかをチェックします。"""
-    actual_occurrences = len(re.findall(
-        self._keyword, value, flags=re.IGNORECASE))
+    actual_occurrences = len(self._keyword_pattern.findall(value))
 
     if self._comparison_relation == _COMPARISON_RELATION[0]:
       return actual_occurrences < self._frequency
@@ -852,7 +871,7 @@ class NumberOfWords(Instruction):
 
   def check_following(self, value):
     """応答に期待される単語数が含まれているかをチェックします。"""
-    num_words = instructions_util.count_words(value)
+    num_words = instructions_util.analyze_response(value).num_words
 
     if self._comparison_relation == _COMPARISON_RELATION[0]:
       return num_words < self._num_words
@@ -879,20 +898,8 @@ class JsonFormat(Instruction):
     return []
 
   def check_following(self, value):
-    value = (
-        value.strip()
-        .removeprefix("```json")
-        .removeprefix("```Json")
-        .removeprefix("```JSON")
-        .removeprefix("```")
-        .removesuffix("```")
-        .strip()
-    )
-    try:
-      json.loads(value)
-    except ValueError as _:
-      return False
-    return True
+    start, end = json_validation.strip_code_fence(value)
+    return json_validation.is_valid_json(value, start, end)
 
 
 class ParagraphFirstWordCheck(Instruction):
@@ -964,7 +971,7 @@ class ParagraphFirstWordCheck(Instruction):
       必要なものと同じ場合はTrue。そうでない場合はFalse。
     """
 
-    paragraphs = re.split(r"\n\n", value)
+    paragraphs = instructions_util.analyze_response(value).paragraphs
     num_paragraphs = len(paragraphs)
 
     for paragraph in paragraphs:
@@ -1074,6 +1081,8 @@ class ForbiddenWords(Instruction):
     else:
       self._forbidden_words = list(set(forbidden_words))
     self._forbidden_words = sorted(self._forbidden_words)
+    self._forbidden_word_matcher = instructions_util.KeywordMatcher(
+        self._forbidden_words, re.IGNORECASE, word_boundary=True)
     self._description_pattern = (
         "Do not include keywords {forbidden_words} in the response."
     )
@@ -1092,10 +1101,11 @@ class ForbiddenWords(Instruction):
 
   def check_following(self, value):
     """応答に期待されるキーワードが含まれていないかをチェックします。"""
-    for word in self._forbidden_words:
-      if re.search(r"\b" + word + r"\b", value, flags=re.IGNORECASE):
-        return False
-    return True
+    return not self._forbidden_word_matcher.contains_any(value)
+
+  def get_matched_keywords(self, value):
+    """応答に含まれている禁止された単語の集合を返します。"""
+    return self._forbidden_word_matcher.find_all(value)
 
 
 class RephraseParagraph(Instruction):
@@ -1118,6 +1128,8 @@ class RephraseParagraph(Instruction):
     self._original_paragraph = original_paragraph
     self._low = low
     self._high = high
+    self._original_word_counts = collections.Counter(
+        _WORD_PATTERN.findall(original_paragraph.lower()))
 
     self._description = ("Rephrase the following paragraph: " +
                          "{original_paragraph}\nYour response should have " +
@@ -1141,13 +1153,12 @@ class RephraseParagraph(Instruction):
     return ["original_paragraph", "low", "high"]
 
   def check_following(self, value):
-    val_words = re.findall(r"\w+", value.lower())
-    original_words = re.findall(r"\w+", self._original_paragraph.lower())
+    # 元の段落の単語のみを数えます。
+    dict_original = self._original_word_counts
+    dict_val = instructions_util.analyze_response(
+        value).lower_token_index.word_counts(dict_original)
     similar_words = 0
 
-    dict_val = collections.Counter(val_words)
-    dict_original = collections.Counter(original_words)
-
     for word in dict_original:
       similar_words += min(dict_original[word], dict_val[word])
 
@@ -1228,7 +1239,8 @@ class RepeatPromptThenAnswer(Instruction):
     return ["prompt_to_repeat"]
 
   def check_following(self, value):
-    if value.strip().lower().startswith(self._prompt_to_repeat.strip().lower()):
+    value = instructions_util.analyze_response(value).lower.strip()
+    if value.startswith(self._prompt_to_repeat.strip().lower()):
       return True
     return False
 
@@ -1264,7 +1276,7 @@ class EndChecker(Instruction):
 
   def check_following(self, value):
     """応答が期待されるフレーズで終わるかをチェックします。"""
-    value = value.strip().strip("\"").lower()
+    value = instructions_util.analyze_response(value).lower.strip().strip("\"")
     self._end_phrase = self._end_phrase.strip().lower()
     return value.endswith(self._end_phrase)
 
@@ -1289,9 +1301,7 @@ class TitleChecker(Instruction):
 
   def check_following(self, value):
     """応答にタイトルが含まれているかをチェックします。"""
-    pattern = r"<<[^\n]+>>"
-    re_pattern = re.compile(pattern)
-    titles = re.findall(re_pattern, value)
+    titles = _TITLE_PATTERN.findall(value)
 
     for title in titles:
       if title.lstrip("<").rstrip(">").strip():
@@ -1366,13 +1376,13 @@ class LetterFrequencyChecker(Instruction):
 
   def check_following(self, value):
     """応答に文字が正しい頻度で含まれているかをチェックします。"""
-    value = value.lower()
-    letters = collections.Counter(value)
+    value = instructions_util.analyze_response(value).lower
+    num_letters = value.count(self._letter)
 
     if self._comparison_relation == _COMPARISON_RELATION[0]:
-      return letters[self._letter] < self._frequency
+      return num_letters < self._frequency
     else:
-      return letters[self._letter] >= self._frequency
+      return num_letters >= self._frequency
 
 
 class CapitalLettersEnglishChecker(Instruction):
@@ -1397,8 +1407,9 @@ class CapitalLettersEnglishChecker(Instruction):
     assert isinstance(value, str)
 
     try:
-      return value.isupper() and langdetect.detect(value) == "en"
-    except langdetect.LangDetectException as e:
+      return (value.isupper() and
+              language_detection.detect_language(value) == "en")
+    except language_detection.LanguageDetectionError as e:
       # 指示に従っていると見なす。
       logging.error(
           "Unable to detect language for text %s due to %s", value, e
@@ -1429,8 +1440,9 @@ class LowercaseLettersEnglishChecker(Instruction):
     assert isinstance(value, str)
 
     try:
-      return value.islower() and langdetect.detect(value) == "en"
-    except langdetect.LangDetectException as e:
+      return (value.islower() and
+              language_detection.detect_language(value) == "en")
+    except language_detection.LanguageDetectionError as e:
       # 指示に従っていると見なす。
       logging.error(
           "Unable to detect language for text %s due to %s", value, e
@@ -1457,7 +1469,7 @@ class CommaChecker(Instruction):
 
   def check_following(self, value):
     """応答にコンマが含まれていないかをチェックします。"""
-    return not re.search(r"\,", value)
+    return not _COMMA_PATTERN.search(value)
 
 
 class CapitalWordFrequencyChecker(Instruction):
@@ -1513,7 +1525,7 @@ class CapitalWordFrequencyChecker(Instruction):
   def check_following(self, value):
     """すべて大文字の単語の頻度をチェックします。"""
     # ハイフンでつながれた単語は1つの単語としてカウントされます
-    words = instructions_util.nltk.word_tokenize(value)
+    words = instructions_util.analyze_response(value).word_tokens
     capital_words = [word for word in words if word.isupper()]
 
     capital_words = len(capital_words)
@@ -0,0 +1,325 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""登録されたすべてのチェッカーと評価全体のベンチマーク。
+
+`INSTRUCTION_DICT`のすべての指示について、合成した応答（通常の文章と、
+"*"、"["、改行を大量に含む敵対的な入力）の大きさごとに`check_following`の
+1回あたりのレイテンシを計測し、同梱のデータセットで`evaluation_main`全体の
+スループットを計測します。結果は1行に1件のjsonlで書き込まれ、コミット間の
+比較に使えます。
+
+例:
+
+  python3 -m instruction_following_eval.instructions_benchmark \
+    --output_file=/tmp/benchmark.jsonl
+"""
+
+import datetime
+import functools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from absl import app
+from absl import flags
+
+from instruction_following_eval import evaluation_lib
+from instruction_following_eval import instructions_registry
+from instruction_following_eval import instructions_util
+from instruction_following_eval import language_detection
+
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+_INPUT_DATA = flags.DEFINE_string(
+    "input_data",
+    os.path.join(_DATA_DIR, "input_data.jsonl"),
+    "指示の引数と評価全体の計測に使う入力データへのパス。",
+)
+
+_INPUT_RESPONSE_DATA = flags.DEFINE_string(
+    "input_response_data",
+    os.path.join(_DATA_DIR, "input_response_data_gpt4_20231107_145030.jsonl"),
+    "評価全体の計測に使う入力応答データへのパス。",
+)
+
+_OUTPUT_FILE = flags.DEFINE_string(
+    "output_file", None, "計測結果を書き込むjsonlファイルへのパス。"
+)
+
+_SIZES = flags.DEFINE_list(
+    "sizes",
+    ["1024", "10240", "102400", "1048576"],
+    "合成する応答の大きさ（文字数）。",
+)
+
+_INSTRUCTION_IDS = flags.DEFINE_list(
+    "instruction_ids",
+    None,
+    "計測する指示ID。指定しない場合は`INSTRUCTION_DICT`のすべての指示。",
+)
+
+_MIN_TIME = flags.DEFINE_float(
+    "min_time", 0.2, "1つの計測で繰り返す最小の時間（秒）。"
+)
+
+_MAX_REPEATS = flags.DEFINE_integer(
+    "max_repeats", 100, "1つの計測での最大の繰り返し回数。"
+)
+
+_MAX_CALL_TIME = flags.DEFINE_float(
+    "max_call_time",
+    1.0,
+    "1回の呼び出しがこの秒数を超えた場合、同じ指示と入力の種類のより大きな"
+    "応答の計測を省きます。超線形に遅くなるチェッカーで計測が終わらなく"
+    "なるのを防ぎます。",
+)
+
+_END_TO_END = flags.DEFINE_bool(
+    "end_to_end", True, "`evaluation_main`全体のスループットを計測します。"
+)
+
+_NUM_WORKERS = flags.DEFINE_integer(
+    "num_workers", 1, "評価全体の計測での`--num_workers`。"
+)
+
+
+_SEED = 0
+
+# 通常の文章に使う単語。
+_WORDS = (
+    "the", "model", "answer", "should", "include", "several", "paragraphs",
+    "with", "clear", "sentences", "and", "Some", "Capitalized", "words",
+    "like", "Paris", "or", "JSON", "because", "evaluation", "is", "fun",
+)
+
+
+def _make_text(size, rng):
+  """文、段落、箇条書き、強調などを含む英語風の文章を作成します。"""
+  parts = []
+  length = 0
+  while length < size:
+    words = rng.choices(_WORDS, k=rng.randint(5, 15))
+    sentence = " ".join(words).capitalize() + rng.choice([".", "!", "?", ","])
+    if rng.random() < 0.1:
+      sentence = f"*{sentence}*"
+    separator = rng.choice([" ", " ", " ", "\n\n", "\n* "])
+    parts.append(sentence + separator)
+    length += len(sentence) + len(separator)
+  return "".join(parts)[:size]
+
+
+def _make_repeated(unit, size):
+  return (unit * (size // len(unit) + 1))[:size]
+
+
+# 入力の種類から、大きさを受け取って応答を作成する関数への対応表。
+_INPUTS = {
+    "text": lambda size: _make_text(size, random.Random(_SEED)),
+    # 閉じられない強調と大量の"*"。
+    "asterisks": lambda size: _make_repeated("**a *", size),
+    # 閉じられないプレースホルダーと大量の"["。
+    "brackets": lambda size: _make_repeated("[a [", size),
+    # 大量の空行と、空白だけの行。
+    "newlines": lambda size: _make_repeated("\n \n\n", size),
+}
+
+
+def _instruction_examples(input_data):
+  """指示IDごとに、入力データで最初に現れる引数とプロンプトを返します。"""
+  examples = {}
+  for inp in evaluation_lib.iter_prompt_list(input_data):
+    for instruction_id, kwargs in zip(inp.instruction_id_list, inp.kwargs):
+      examples.setdefault(instruction_id, (kwargs, inp.prompt))
+  return examples
+
+
+def _clear_response_caches():
+  """応答ごとの解析結果と言語検出の結果のキャッシュを空にします。"""
+  instructions_util.analyze_response.cache_clear()
+  language_detection.clear_cache()
+
+
+def _time_call(func, min_time, max_repeats, setup=None):
+  """`func`を繰り返し呼び出し、1回あたりのレイテンシ（秒）の一覧を返します。
+
+  Args:
+    func: 計測する関数。
+    min_time: 計測を続ける最小の秒数。
+    max_repeats: 呼び出しの最大の回数。
+    setup: 各呼び出しの前に計測の外で呼び出す関数。Noneの場合は呼び出しません。
+
+  Returns:
+    1回あたりのレイテンシ（秒）のリスト。
+  """
+  latencies = []
+  deadline = time.perf_counter() + min_time
+  while len(latencies) < max_repeats:
+    if setup is not None:
+      setup()
+    start = time.perf_counter()
+    func()
+    end = time.perf_counter()
+    latencies.append(end - start)
+    if end >= deadline:
+      break
+  return latencies
+
+
+def _benchmark_checkers(instruction_ids, sizes, examples):
+  """チェッカーごとの計測結果を返します。"""
+  random.seed(_SEED)
+  responses = {
+      (kind, size): make(size)
+      for kind, make in _INPUTS.items() for size in sorted(sizes)
+  }
+  for instruction_id in instruction_ids:
+    kwargs, prompt = examples.get(instruction_id, ({}, "Write an answer."))
+    instruction = evaluation_lib.get_prepared_instruction(
+        instruction_id, kwargs, prompt)
+    # 呼び出しが`--max_call_time`を超えた入力の種類。
+    too_slow_kinds = set()
+    for (kind, size), response in responses.items():
+      record = {
+          "benchmark": "check_following",
+          "instruction_id": instruction_id,
+          "input": kind,
+          "size": size,
+      }
+      if kind in too_slow_kinds:
+        record["skipped"] = "a smaller input exceeded --max_call_time"
+        yield record
+        continue
+      try:
+        # 初回の呼び出し（遅延読み込みなど）は計測に含めません。
+        instruction.check_following(response)
+        # 同じ応答の解析結果や言語検出の結果のキャッシュを使わないよう、
+        # 呼び出しのたびにキャッシュを空にします。
+        latencies = _time_call(
+            functools.partial(instruction.check_following, response),
+            _MIN_TIME.value, _MAX_REPEATS.value,
+            setup=_clear_response_caches)
+      except Exception as e:  # pylint: disable=broad-except
+        record["error"] = f"{type(e).__name__}: {e}"
+      else:
+        record |= {
+            "repeats": len(latencies),
+            "mean_us": statistics.fmean(latencies) * 1e6,
+            "min_us": min(latencies) * 1e6,
+            "median_us": statistics.median(latencies) * 1e6,
+        }
+        if min(latencies) > _MAX_CALL_TIME.value:
+          too_slow_kinds.add(kind)
+      yield record
+
+
+def _benchmark_end_to_end(input_data, input_response_data, num_workers):
+  """`evaluation_main`を別のプロセスで実行し、スループットを返します。"""
+  num_examples = sum(1 for _ in evaluation_lib.iter_prompt_list(input_data))
+  record = {
+      "benchmark": "end_to_end",
+      "num_examples": num_examples,
+      "num_workers": num_workers,
+  }
+  with tempfile.TemporaryDirectory() as output_dir:
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-m", "instruction_following_eval.evaluation_main",
+         f"--input_data={input_data}",
+         f"--input_response_data={input_response_data}",
+         f"--output_dir={output_dir}",
+         f"--num_workers={num_workers}"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        check=False)
+    seconds = time.perf_counter() - start
+  if process.returncode:
+    record["error"] = process.stderr.strip().splitlines()[-1]
+  else:
+    record |= {
+        "seconds": seconds,
+        "examples_per_second": num_examples / seconds,
+    }
+  return record
+
+
+def _git_revision():
+  """このファイルのリポジトリの現在のコミットを返します。"""
+  try:
+    return subprocess.run(
+        ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__),
+        capture_output=True, text=True, check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def _format_record(record):
+  if record["benchmark"] == "end_to_end":
+    name = f"end_to_end (num_workers={record['num_workers']})"
+    if "error" in record:
+      return f"{name:60s} error: {record['error']}"
+    return (f"{name:60s} {record['seconds']:10.3f} s "
+            f"{record['examples_per_second']:10.1f} examples/s")
+  name = f"{record['instruction_id']} {record['input']} {record['size']}"
+  if "error" in record:
+    return f"{name:60s} error: {record['error']}"
+  if "skipped" in record:
+    return f"{name:60s} skipped: {record['skipped']}"
+  return f"{name:60s} {record['median_us']:12.1f} us (x{record['repeats']})"
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError("コマンドライン引数が多すぎます。")
+
+  instruction_ids = (_INSTRUCTION_IDS.value or
+                     list(instructions_registry.INSTRUCTION_DICT))
+  unknown = set(instruction_ids) - set(instructions_registry.INSTRUCTION_DICT)
+  if unknown:
+    raise app.UsageError(f"Unknown instruction ids: {sorted(unknown)}")
+  sizes = [int(size) for size in _SIZES.value]
+
+  metadata = {
+      "benchmark": "metadata",
+      "git_revision": _git_revision(),
+      "python": platform.python_version(),
+      "platform": platform.platform(),
+      "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+  }
+  records = [metadata]
+  examples = _instruction_examples(_INPUT_DATA.value)
+  for record in _benchmark_checkers(instruction_ids, sizes, examples):
+    print(_format_record(record), flush=True)
+    records.append(record)
+  if _END_TO_END.value:
+    record = _benchmark_end_to_end(
+        _INPUT_DATA.value, _INPUT_RESPONSE_DATA.value, _NUM_WORKERS.value)
+    print(_format_record(record))
+    records.append(record)
+
+  if _OUTPUT_FILE.value:
+    with open(_OUTPUT_FILE.value, "w") as f:
+      for record in records:
+        f.write(json.dumps(record))
+        f.write("\n")
+
+
+if __name__ == "__main__":
+  app.run(main)
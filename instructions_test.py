@@ -15,6 +15,8 @@
 
 """instructions.pyのテスト。"""
 
+import re
+
 from absl.testing import absltest
 from absl.testing import parameterized
 from instruction_following_eval import instructions
@@ -187,6 +189,20 @@ class InstructionsTest(parameterized.TestCase):
     actual = instruction.check_following(template)
     self.assertEqual(actual, expected)
 
+  @parameterized.parameters(
+      '\n\n* a\n - b', '*\n* a\n- b', '*\n\n* a', '**a\n*', '* a\n*',
+      ' \n\t-\n*b*\n*', '\n' * 1000 + '* a', '*\n' * 1000,
+  )
+  def test_number_bullet_lists_matches_pattern(self, response):
+    """箇条書きの数が以前の複数行の正規表現の一致の数と同じかのテスト。"""
+    num_bullets = (
+        len(re.findall(r'^\s*\*[^\*].*$', response, flags=re.MULTILINE)) +
+        len(re.findall(r'^\s*-.*$', response, flags=re.MULTILINE)))
+    instruction = instructions.BulletListChecker(
+        'detectable_format:exact_number_bullet_points')
+    instruction.build_description(num_bullets=num_bullets)
+    self.assertTrue(instruction.check_following(response))
+
   CONSTRAINED_RESPONSE_TEST_RESPONSE_1 = """\n My answer is no.\n"""
   CONSTRAINED_RESPONSE_TEST_RESPONSE_2 = """My answer is no.   """
   CONSTRAINED_RESPONSE_TEST_RESPONSE_3 = """
@@ -422,6 +438,10 @@ class InstructionsTest(parameterized.TestCase):
       self.assertTrue(
           instruction.check_following(self.POSTSCRIPT_TEST_MESSAGE_4))
 
+    with self.subTest('test many newlines'):
+      self.assertTrue(instruction.check_following('\n' * 100000 + 'p. p. s'))
+      self.assertFalse(instruction.check_following('\n \n' * 100000))
+
     postscript_start_keyword = 'P.S.'
     instruction.build_description(postscript_marker=postscript_start_keyword)
     with self.subTest(f'test {postscript_start_keyword}'):
@@ -538,6 +558,9 @@ class InstructionsTest(parameterized.TestCase):
     with self.subTest(f'test {self.TEST_INCLUDE_KEYWORD_MESSAGE_2}'):
       self.assertFalse(
           instruction.check_following(self.TEST_INCLUDE_KEYWORD_MESSAGE_2))
+      self.assertEqual(
+          {'romantic', 'river'},
+          instruction.get_matched_keywords(self.TEST_INCLUDE_KEYWORD_MESSAGE_2))
 
   TEST_KEYWORD_FREQUNECY_MESSAGE_1 = """
   keyword, Keyword, KEYWORD
@@ -802,6 +825,9 @@ I love it too much. I'll just have to make sure to eat it in moderation.
                       f'with forbidden words: {self.FORBIDDEN_WORDS_1}. '):
       self.assertFalse(
           instruction.check_following(self.TEST_FORBIDDEN_WORDS_MESSAGE_1))
+      self.assertEqual(
+          {'POWER', 'BECOME'},
+          instruction.get_matched_keywords(self.TEST_FORBIDDEN_WORDS_MESSAGE_1))
 
     with self.subTest(f'test {self.TEST_FORBIDDEN_WORDS_MESSAGE_2}\n ' +
                       f'with forbidden words: {self.FORBIDDEN_WORDS_1}. '):
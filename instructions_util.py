@@ -15,13 +15,16 @@
 
 """インストラクションのユーティリティライブラリ。"""
 
+import array
+import collections
 import functools
+import itertools
 import random
 import re
+import string
 from typing import List
 
 import immutabledict
-import nltk
 
 WORD_LIST = ["western", "sentence", "signal", "dump", "spot", "opposite", "bottom", "potato", "administration", "working", "welcome", "morning", "good", "agency", "primary", "wish", "responsibility", "press", "problem", "president", "steal", "brush", "read", "type", "beat", "trainer", "growth", "lock", "bone", "case", "equal", "comfortable", "region", "replacement", "performance", "mate", "walk", "medicine", "film", "thing", "rock", "tap", "total", "competition", "ease", "south", "establishment", "gather", "parking", "world", "plenty", "breath", "claim", "alcohol", "trade", "dear", "highlight", "street", "matter", "decision", "mess", "agreement", "studio", "coach", "assist", "brain", "wing", "style", "private", "top", "brown", "leg", "buy", "procedure", "method", "speed", "high", "company", "valuable", "pie", "analyst", "session", "pattern", "district", "pleasure", "dinner", "swimming", "joke", "order", "plate", "department", "motor", "cell", "spend", "cabinet", "difference", "power", "examination", "engine", "horse", "dimension", "pay", "toe", "curve", "literature", "bother", "fire", "possibility", "debate", "activity", "passage", "hello", "cycle", "background", "quiet", "author", "effect", "actor", "page", "bicycle", "error", "throat", "attack", "character", "phone", "tea", "increase", "outcome", "file", "specific", "inspector", "internal", "potential", "staff", "building", "employer", "shoe", "hand", "direction", "garden", "purchase", "interview", "study", "recognition", "member", "spiritual", "oven", "sandwich", "weird", "passenger", "particular", "response", "reaction", "size", "variation", "a", "cancel", "candy", "exit", "guest", "condition", "fly", "price", "weakness", "convert", "hotel", "great", "mouth", "mind", "song", "sugar", "suspect", "telephone", "ear", "roof", "paint", "refrigerator", "organization", "jury", "reward", "engineering", "day", "possession", "crew", "bar", "road", "description", "celebration", "score", "mark", "letter", "shower", "suggestion", "sir", "luck", "national", "progress", "hall", "stroke", "theory", "offer", "story", "tax", "definition", "history", "ride", "medium", "opening", "glass", "elevator", "stomach", "question", "ability", "leading", "village", "computer", "city", "grand", "confidence", "candle", "priest", "recommendation", "point", "necessary", "body", "desk", "secret", "horror", "noise", "culture", "warning", "water", "round", "diet", "flower", "bus", "tough", "permission", "week", "prompt", "connection", "abuse", "height", "save", "corner", "border", "stress", "drive", "stop", "rip", "meal", "listen", "confusion", "girlfriend", "living", "relation", "significance", "plan", "creative", "atmosphere", "blame", "invite", "housing", "paper", "drink", "roll", "silver", "drunk", "age", "damage", "smoke", "environment", "pack", "savings", "influence", "tourist", "rain", "post", "sign", "grandmother", "run", "profit", "push", "clerk", "final", "wine", "swim", "pause", "stuff", "singer", "funeral", "average", "source", "scene", "tradition", "personal", "snow", "nobody", "distance", "sort", "sensitive", "animal", "major", "negotiation", "click", "mood", "period", "arrival", "expression", "holiday", "repeat", "dust", "closet", "gold", "bad", "sail", "combination", "clothes", "emphasis", "duty", "black", "step", "school", "jump", "document", "professional", "lip", "chemical", "front", "wake", "while", "inside", "watch", "row", "subject", "penalty", "balance", "possible", "adult", "aside", "sample", "appeal", "wedding", "depth", "king", "award", "wife", "blow", "site", "camp", "music", "safe", "gift", "fault", "guess", "act", "shame", "drama", "capital", "exam", "stupid", "record", "sound", "swing", "novel", "minimum", "ratio", "machine", "shape", "lead", "operation", "salary", "cloud", "affair", "hit", "chapter", "stage", "quantity", "access", "army", "chain", "traffic", "kick", "analysis", "airport", "time", "vacation", "philosophy", "ball", "chest", "thanks", "place", "mountain", "advertising", "red", "past", "rent", "return", "tour", "house", "construction", "net", "native", "war", "figure", "fee", "spray", "user", "dirt", "shot", "task", "stick", "friend", "software", "promotion", "interaction", "surround", "block", "purpose", "practice", "conflict", "routine", "requirement", "bonus", "hole", "state", "junior", "sweet", "catch", "tear", "fold", "wall", "editor", "life", "position", "pound", "respect", "bathroom", "coat", "script", "job", "teach", "birth", "view", "resolve", "theme", "employee", "doubt", "market", "education", "serve", "recover", "tone", "harm", "miss", "union", "understanding", "cow", "river", "association", "concept", "training", "recipe", "relationship", "reserve", "depression", "proof", "hair", "revenue", "independent", "lift", "assignment", "temporary", "amount", "loss", "edge", "track", "check", "rope", "estimate", "pollution", "stable", "message", "delivery", "perspective", "mirror", "assistant", "representative", "witness", "nature", "judge", "fruit", "tip", "devil", "town", "emergency", "upper", "drop", "stay", "human", "neck", "speaker", "network", "sing", "resist", "league", "trip", "signature", "lawyer", "importance", "gas", "choice", "engineer", "success", "part", "external", "worker", "simple", "quarter", "student", "heart", "pass", "spite", "shift", "rough", "lady", "grass", "community", "garage", "youth", "standard", "skirt", "promise", "blind", "television", "disease", "commission", "positive", "energy", "calm", "presence", "tune", "basis", "preference", "head", "common", "cut", "somewhere", "presentation", "current", "thought", "revolution", "effort", "master", "implement", "republic", "floor", "principle", "stranger", "shoulder", "grade", "button", "tennis", "police", "collection", "account", "register", "glove", "divide", "professor", "chair", "priority", "combine", "peace", "extension", "maybe", "evening", "frame", "sister", "wave", "code", "application", "mouse", "match", "counter", "bottle", "half", "cheek", "resolution", "back", "knowledge", "make", "discussion", "screw", "length", "accident", "battle", "dress", "knee", "log", "package", "it", "turn", "hearing", "newspaper", "layer", "wealth", "profile", "imagination", "answer", "weekend", "teacher", "appearance", "meet", "bike", "rise", "belt", "crash", "bowl", "equivalent", "support", "image", "poem", "risk", "excitement", "remote", "secretary", "public", "produce", "plane", "display", "money", "sand", "situation", "punch", "customer", "title", "shake", "mortgage", "option", "number", "pop", "window", "extent", "nothing", "experience", "opinion", "departure", "dance", "indication", "boy", "material", "band", "leader", "sun", "beautiful", "muscle", "farmer", "variety", "fat", "handle", "director", "opportunity", "calendar", "outside", "pace", "bath", "fish", "consequence", "put", "owner", "go", "doctor", "information", "share", "hurt", "protection", "career", "finance", "force", "golf", "garbage", "aspect", "kid", "food", "boot", "milk", "respond", "objective", "reality", "raw", "ring", "mall", "one", "impact", "area", "news", "international", "series", "impress", "mother", "shelter", "strike", "loan", "month", "seat", "anything", "entertainment", "familiar", "clue", "year", "glad", "supermarket", "natural", "god", "cost", "conversation", "tie", "ruin", "comfort", "earth", "storm", "percentage", "assistance", "budget", "strength", "beginning", "sleep", "other", "young", "unit", "fill", "store", "desire", "hide", "value", "cup", "maintenance", "nurse", "function", "tower", "role", "class", "camera", "database", "panic", "nation", "basket", "ice", "art", "spirit", "chart", "exchange", "feedback", "statement", "reputation", "search", "hunt", "exercise", "nasty", "notice", "male", "yard", "annual", "collar", "date", "platform", "plant", "fortune", "passion", "friendship", "spread", "cancer", "ticket", "attitude", "island", "active", "object", "service", "buyer", "bite", "card", "face", "steak", "proposal", "patient", "heat", "rule", "resident", "broad", "politics", "west", "knife", "expert", "girl", "design", "salt", "baseball", "grab", "inspection", "cousin", "couple", "magazine", "cook", "dependent", "security", "chicken", "version", "currency", "ladder", "scheme", "kitchen", "employment", "local", "attention", "manager", "fact", "cover", "sad", "guard", "relative", "county", "rate", "lunch", "program", "initiative", "gear", "bridge", "breast", "talk", "dish", "guarantee", "beer", "vehicle", "reception", "woman", "substance", "copy", "lecture", "advantage", "park", "cold", "death", "mix", "hold", "scale", "tomorrow", "blood", "request", "green", "cookie", "church", "strip", "forever", "beyond", "debt", "tackle", "wash", "following", "feel", "maximum", "sector", "sea", "property", "economics", "menu", "bench", "try", "language", "start", "call", "solid", "address", "income", "foot", "senior", "honey", "few", "mixture", "cash", "grocery", "link", "map", "form", "factor", "pot", "model", "writer", "farm", "winter", "skill", "anywhere", "birthday", "policy", "release", "husband", "lab", "hurry", "mail", "equipment", "sink", "pair", "driver", "consideration", "leather", "skin", "blue", "boat", "sale", "brick", "two", "feed", "square", "dot", "rush", "dream", "location", "afternoon", "manufacturer", "control", "occasion", "trouble", "introduction", "advice", "bet", "eat", "kill", "category", "manner", "office", "estate", "pride", "awareness", "slip", "crack", "client", "nail", "shoot", "membership", "soft", "anybody", "web", "official", "individual", "pizza", "interest", "bag", "spell", "profession", "queen", "deal", "resource", "ship", "guy", "chocolate", "joint", "formal", "upstairs", "car", "resort", "abroad", "dealer", "associate", "finger", "surgery", "comment", "team", "detail", "crazy", "path", "tale", "initial", "arm", "radio", "demand", "single", "draw", "yellow", "contest", "piece", "quote", "pull", "commercial", "shirt", "contribution", "cream", "channel", "suit", "discipline", "instruction", "concert", "speech", "low", "effective", "hang", "scratch", "industry", "breakfast", "lay", "join", "metal", "bedroom", "minute", "product", "rest", "temperature", "many", "give", "argument", "print", "purple", "laugh", "health", "credit", "investment", "sell", "setting", "lesson", "egg", "middle", "marriage", "level", "evidence", "phrase", "love", "self", "benefit", "guidance", "affect", "you", "dad", "anxiety", "special", "boyfriend", "test", "blank", "payment", "soup", "obligation", "reply", "smile", "deep", "complaint", "addition", "review", "box", "towel", "minor", "fun", "soil", "issue", "cigarette", "internet", "gain", "tell", "entry", "spare", "incident", "family", "refuse", "branch", "can", "pen", "grandfather", "constant", "tank", "uncle", "climate", "ground", "volume", "communication", "kind", "poet", "child", "screen", "mine", "quit", "gene", "lack", "charity", "memory", "tooth", "fear", "mention", "marketing", "reveal", "reason", "court", "season", "freedom", "land", "sport", "audience", "classroom", "law", "hook", "win", "carry", "eye", "smell", "distribution", "research", "country", "dare", "hope", "whereas", "stretch", "library", "if", "delay", "college", "plastic", "book", "present", "use", "worry", "champion", "goal", "economy", "march", "election", "reflection", "midnight", "slide", "inflation", "action", "challenge", "guitar", "coast", "apple", "campaign", "field", "jacket", "sense", "way", "visual", "remove", "weather", "trash", "cable", "regret", "buddy", "beach", "historian", "courage", "sympathy", "truck", "tension", "permit", "nose", "bed", "son", "person", "base", "meat", "usual", "air", "meeting", "worth", "game", "independence", "physical", "brief", "play", "raise", "board", "she", "key", "writing", "pick", "command", "party", "yesterday", "spring", "candidate", "physics", "university", "concern", "development", "change", "string", "target", "instance", "room", "bitter", "bird", "football", "normal", "split", "impression", "wood", "long", "meaning", "stock", "cap", "leadership", "media", "ambition", "fishing", "essay", "salad", "repair", "today", "designer", "night", "bank", "drawing", "inevitable", "phase", "vast", "chip", "anger", "switch", "cry", "twist", "personality", "attempt", "storage", "being", "preparation", "bat", "selection", "white", "technology", "contract", "side", "section", "station", "till", "structure", "tongue", "taste", "truth", "difficulty", "group", "limit", "main", "move", "feeling", "light", "example", "mission", "might", "wait", "wheel", "shop", "host", "classic", "alternative", "cause", "agent", "consist", "table", "airline", "text", "pool", "craft", "range", "fuel", "tool", "partner", "load", "entrance", "deposit", "hate", "article", "video", "summer", "feature", "extreme", "mobile", "hospital", "flight", "fall", "pension", "piano", "fail", "result", "rub", "gap", "system", "report", "suck", "ordinary", "wind", "nerve", "ask", "shine", "note", "line", "mom", "perception", "brother", "reference", "bend", "charge", "treat", "trick", "term", "homework", "bake", "bid", "status", "project", "strategy", "orange", "let", "enthusiasm", "parent", "concentrate", "device", "travel", "poetry", "business", "society", "kiss", "end", "vegetable", "employ", "schedule", "hour", "brave", "focus", "process", "movie", "illegal", "general", "coffee", "ad", "highway", "chemistry", "psychology", "hire", "bell", "conference", "relief", "show", "neat", "funny", "weight", "quality", "club", "daughter", "zone", "touch", "tonight", "shock", "burn", "excuse", "name", "survey", "landscape", "advance", "satisfaction", "bread", "disaster", "item", "hat", "prior", "shopping", "visit", "east", "photo", "home", "idea", "father", "comparison", "cat", "pipe", "winner", "count", "lake", "fight", "prize", "foundation", "dog", "keep", "ideal", "fan", "struggle", "peak", "safety", "solution", "hell", "conclusion", "population", "strain", "alarm", "measurement", "second", "train", "race", "due", "insurance", "boss", "tree", "monitor", "sick", "course", "drag", "appointment", "slice", "still", "care", "patience", "rich", "escape", "emotion", "royal", "female", "childhood", "government", "picture", "will", "sock", "big", "gate", "oil", "cross", "pin", "improvement", "championship", "silly", "help", "sky", "pitch", "man", "diamond", "most", "transition", "work", "science", "committee", "moment", "fix", "teaching", "dig", "specialist", "complex", "guide", "people", "dead", "voice", "original", "break", "topic", "data", "degree", "reading", "recording", "bunch", "reach", "judgment", "lie", "regular", "set", "painting", "mode", "list", "player", "bear", "north", "wonder", "carpet", "heavy", "officer", "negative", "clock", "unique", "baby", "pain", "assumption", "disk", "iron", "bill", "drawer", "look", "double", "mistake", "finish", "future", "brilliant", "contact", "math", "rice", "leave", "restaurant", "discount", "sex", "virus", "bit", "trust", "event", "wear", "juice", "failure", "bug", "context", "mud", "whole", "wrap", "intention", "draft", "pressure", "cake", "dark", "explanation", "space", "angle", "word", "efficiency", "management", "habit", "star", "chance", "finding", "transportation", "stand", "criticism", "flow", "door", "injury", "insect", "surprise", "apartment"]  # pylint: disable=line-too-long
 
@@ -59,14 +62,374 @@ LANGUAGE_CODES = immutabledict.immutabledict({
     "fi": "Finnish",
     })
 
-_ALPHABETS = "([A-Za-z])"
-_PREFIXES = "(Mr|St|Mrs|Ms|Dr)[.]"
-_SUFFIXES = "(Inc|Ltd|Jr|Sr|Co)"
-_STARTERS = r"(Mr|Mrs|Ms|Dr|Prof|Capt|Cpt|Lt|He\s|She\s|It\s|They\s|Their\s|Our\s|We\s|But\s|However\s|That\s|This\s|Wherever)"
-_ACRONYMS = "([A-Z][.][A-Z][.](?:[A-Z][.])?)"
-_WEBSITES = "[.](com|net|org|io|gov|edu|me)"
-_DIGITS = "([0-9])"
-_MULTIPLE_DOTS = r"\.{2,}"
+# `split_into_sentences`の規則で使う文字と単語。
+_ALPHABETS = frozenset(string.ascii_letters)
+_UPPERCASE_ALPHABETS = frozenset(string.ascii_uppercase)
+_LOWERCASE_ALPHABETS = frozenset(string.ascii_lowercase)
+_DIGITS = frozenset(string.digits)
+_PREFIXES = ("Mr", "St", "Mrs", "Ms", "Dr")
+_SUFFIXES = ("Inc", "Ltd", "Jr", "Sr", "Co")
+# 文の始まりとみなす単語と、空白文字が続く必要があるか。順序は一致を試す順序です。
+_STARTERS = (
+    ("Mr", False), ("Mrs", False), ("Ms", False), ("Dr", False),
+    ("Prof", False), ("Capt", False), ("Cpt", False), ("Lt", False),
+    ("He", True), ("She", True), ("It", True), ("They", True),
+    ("Their", True), ("Our", True), ("We", True), ("But", True),
+    ("However", True), ("That", True), ("This", True), ("Wherever", False),
+)
+_WEBSITES = ("com", "net", "org", "io", "gov", "edu", "me")
+_SENTENCE_TERMINATORS = re.compile(r"[.?!]")
+_PERIOD = re.compile(r"\.")
+_SENTENCE_QUOTES = "\"”"
+# 文末の記号の直後の引用符を記号の前に移す置換。順に一度ずつ適用します。
+_QUOTE_SWAPS = ((".", "”"), (".", '"'), ("!", '"'), ("?", '"'))
+
+# コンパイル済みパターンのキャッシュに保持するパターンの最大数。
+_PATTERN_CACHE_SIZE = 4096
+
+_DIVIDED_PARAGRAPH_SPLITTER = re.compile(r"\s?\*\*\*\s?")
+
+
+@functools.lru_cache(maxsize=_PATTERN_CACHE_SIZE)
+def compile_pattern(pattern, flags=0):
+  """コンパイル済みの正規表現パターンを返します。
+
+  すべての指示で共有される上限付きのキャッシュを使います。`re`モジュールの
+  内部キャッシュより大きいため、多数のキーワードを扱う場合でも
+  再コンパイルが繰り返されません。
+
+  Args:
+    pattern: 正規表現パターンを表す文字列。
+    flags: `re`モジュールのフラグ。
+
+  Returns:
+    コンパイル済みの`re.Pattern`。
+  """
+  return re.compile(pattern, flags)
+
+
+def pattern_cache_info():
+  """コンパイル済みパターンのキャッシュのヒット数とミス数などを返します。"""
+  return compile_pattern.cache_info()
+
+
+class KeywordMatcher:
+  """複数のキーワードのパターンをまとめて探します。
+
+  いずれかのキーワードが現れるかは、キーワードのパターンを選択にまとめた
+  1つのパターンで、1回の走査で調べます。すべてのキーワードが現れるかは、
+  キーワードごとのパターンで調べます。まとめたパターンでは、すでに見つかった
+  キーワードの出現もすべて列挙することになり、最初の出現で止まる個別の
+  検索より遅くなるためです。グループを含むパターンなど、まとめられない
+  キーワードがある場合は個別のパターンのみを使います。
+  """
+
+  def __init__(self, keywords, flags=0, word_boundary=False):
+    """初期化します。
+
+    Args:
+      keywords: 正規表現パターンとして扱うキーワードのシーケンス。
+      flags: `re`モジュールのフラグ。
+      word_boundary: Trueの場合、各キーワードを単語境界`\\b`で囲みます。
+    """
+    self.keywords = tuple(dict.fromkeys(keywords))
+    patterns = [
+        rf"\b{keyword}\b" if word_boundary else keyword
+        for keyword in self.keywords
+    ]
+    self._patterns = [compile_pattern(pattern, flags) for pattern in patterns]
+    self._combined = None
+    if len(patterns) > 1 and not any(p.groups for p in self._patterns):
+      try:
+        self._combined = compile_pattern(
+            "|".join(f"(?:{pattern})" for pattern in patterns), flags)
+      except re.error:
+        # 途中に置けないインラインフラグなどを含む場合です。
+        pass
+
+  def find_all(self, text):
+    """`text`に現れるキーワードの集合を返します。"""
+    return {
+        keyword for keyword, pattern in zip(self.keywords, self._patterns)
+        if pattern.search(text)
+    }
+
+  def contains_all(self, text):
+    """`text`にすべてのキーワードが現れるかを返します。"""
+    return all(pattern.search(text) for pattern in self._patterns)
+
+  def contains_any(self, text):
+    """`text`にいずれかのキーワードが現れるかを返します。"""
+    if self._combined is not None:
+      return self._combined.search(text) is not None
+    return any(pattern.search(text) for pattern in self._patterns)
+
+
+def _starter_length(text, start):
+  """`start`から文の始まりとみなす単語が続く場合、その長さを返します。
+
+  空白文字が続く必要がある単語の長さは、その空白文字を含みます。
+  続かない場合は0を返します。
+  """
+  for word, needs_space in _STARTERS:
+    if text.startswith(word, start):
+      if not needs_space:
+        return len(word)
+      end = start + len(word)
+      if end >= len(text) or text[end].isspace():
+        return len(word) + 1
+  return 0
+
+
+def _swap_quotes(run):
+  """文末の記号と引用符の並びで、記号の直後の引用符を記号の前に移します。
+
+  Args:
+    run: (文字, 元の位置) のリスト。
+
+  Returns:
+    入れ替えた後の (文字, 元の位置) のリスト。
+  """
+  for mark, quote in _QUOTE_SWAPS:
+    i = 0
+    while i < len(run) - 1:
+      if run[i][0] == mark and run[i + 1][0] == quote:
+        run[i], run[i + 1] = run[i + 1], run[i]
+        i += 2
+      else:
+        i += 1
+  return run
+
+
+def _find_sentence_boundaries(text):
+  """ピリオドごとの扱いと、文の区切りを置く位置を返します。
+
+  文の区切りの規則（敬称、ウェブサイト、小数、省略記号、Ph.D.、頭文字、
+  略語、会社名などの接尾辞）を、それぞれのピリオドの前後の文字のみを見て
+  判定します。規則は従来の置換と同じ順序で適用され、前の規則で文末では
+  ないと判定されたピリオドは後の規則の対象になりません。改行は空白として
+  扱い、テキストの前後は空白とみなします。
+
+  Args:
+    text: 文字列。
+
+  Returns:
+    (文末ではないピリオドの位置の集合, 削除するピリオドの位置の集合,
+    (位置, 優先度) の順に並べた文の区切りの一覧, 半角の空白に置き換える
+    空白文字の位置の一覧) の組。文の区切りは`text`の位置の直前に
+    置かれます。
+  """
+  n = len(text)
+
+  def char(i):
+    if 0 <= i < n:
+      c = text[i]
+      return " " if c == "\n" else c
+    return " "
+
+  # 2文字以上の単語の後の、空白か改行かテキストの末尾が続くピリオドは、
+  # 敬称か接尾辞でなければどの規則にも当てはまらないため、判定を省きます。
+  period_set = set()
+  periods = []
+  for match in _PERIOD.finditer(text):
+    i = match.start()
+    period_set.add(i)
+    if not (i >= 2 and text[i - 1] in _LOWERCASE_ALPHABETS and
+            text[i - 2] in _ALPHABETS and (i + 1 == n or text[i + 1] in " \n")
+            and not text.endswith(_PREFIXES + _SUFFIXES, 0, i)):
+      periods.append(i)
+  protected = set()
+  removed = set()
+  breaks = []
+
+  def is_literal(i):
+    return i in period_set and i not in protected and i not in removed
+
+  # 敬称、ウェブサイト、小数。小数の規則は一致が重ならないように、
+  # 直前の小数の後の数字から始まる小数には適用しません。
+  decimals = set()
+  for i in periods:
+    if text.endswith(_PREFIXES, 0, i) or text.startswith(_WEBSITES, i + 1):
+      protected.add(i)
+    elif (char(i - 1) in _DIGITS and char(i + 1) in _DIGITS and
+          i - 2 not in decimals):
+      protected.add(i)
+      decimals.add(i)
+
+  # 2つ以上続くピリオド（省略記号）の後で文を区切ります。
+  k = 0
+  while k < len(periods):
+    j = k
+    if periods[k] not in protected:
+      while (j + 1 < len(periods) and periods[j + 1] == periods[j] + 1 and
+             periods[j + 1] not in protected):
+        j += 1
+      if j > k:
+        protected.update(periods[k:j + 1])
+        breaks.append((periods[j] + 1, 0))
+    k = j + 1
+
+  # Ph.D.と、空白文字で挟まれた1文字と空白の組。後者は一致が重ならない
+  # ように、直前の一致の後の空白から始まる場合には適用せず、1文字の前の
+  # 空白文字は半角の空白に置き換えます。
+  single_letters = set()
+  spaces = []
+  for i in periods:
+    if not is_literal(i):
+      continue
+    if (text.endswith("Ph", 0, i) and char(i + 1) == "D" and
+        is_literal(i + 2)):
+      protected.update((i, i + 2))
+    elif (char(i + 1) == " " and char(i - 1) in _ALPHABETS and
+          char(i - 2).isspace() and
+          not (char(i - 2) == " " and i - 3 in single_letters)):
+      protected.add(i)
+      single_letters.add(i)
+      if text[i - 2] != " ":
+        spaces.append(i - 2)
+
+  # 文の始まりの単語が続く頭字語（U.S. Heなど）の後で文を区切ります。
+  for i in periods:
+    if (is_literal(i) and char(i + 1) == " " and
+        char(i - 1) in _UPPERCASE_ALPHABETS and is_literal(i - 2) and
+        char(i - 3) in _UPPERCASE_ALPHABETS and _starter_length(text, i + 2)):
+      breaks.append((i + 1, 1))
+
+  # 1文字とピリオドの連続（U.S.A.など）。先頭から3組ずつ、残りが2組の場合は
+  # その2組のピリオドを文末ではないとします。
+  visited = set()
+  for i in periods:
+    if i in visited or not is_literal(i) or char(i - 1) not in _ALPHABETS:
+      continue
+    chain = [i]
+    while is_literal(chain[-1] + 2) and char(chain[-1] + 1) in _ALPHABETS:
+      chain.append(chain[-1] + 2)
+    visited.update(chain)
+    num_protected = len(chain) // 3 * 3
+    protected.update(chain[:num_protected])
+    if len(chain) - num_protected == 2:
+      protected.update(chain[num_protected:])
+
+  # 文の始まりの単語が続く接尾辞（Inc. Heなど）はピリオドを除いて文を区切り、
+  # それ以外の接尾辞と、空白の後の1文字のピリオドは文末ではないとします。
+  # 一致は重ならないため、直前の一致に含まれる空白から始まる場合は除きます。
+  last_match_end = -1
+  for i in periods:
+    if not is_literal(i):
+      continue
+    for suffix in _SUFFIXES:
+      if text.endswith(suffix, 0, i) and char(i - len(suffix) - 1) == " ":
+        start = i - len(suffix) - 1
+        starter_length = (_starter_length(text, i + 2)
+                          if char(i + 1) == " " else 0)
+        if starter_length and start >= last_match_end:
+          removed.add(i)
+          breaks.append((i, 1))
+          last_match_end = i + 2 + starter_length
+        break
+  for i in periods:
+    if is_literal(i) and any(
+        text.endswith(suffix, 0, i) and char(i - len(suffix) - 1) == " "
+        for suffix in _SUFFIXES):
+      protected.add(i)
+  for i in periods:
+    if is_literal(i) and char(i - 1) in _ALPHABETS and char(i - 2) == " ":
+      protected.add(i)
+
+  breaks.sort()
+  return protected, removed, breaks, spaces
+
+
+def split_into_sentences_with_offsets(text):
+  """テキストを文に分割し、各文の元のテキストでの位置も返します。
+
+  `split_into_sentences`と同じ文を、テキストを一度走査して求めます。
+
+  Args:
+    text: 1つ以上の文で構成される文字列。
+
+  Returns:
+    (文, 開始位置, 終了位置) のリスト。開始位置と終了位置は、文の前後の
+    空白を除いた部分の`text`での範囲です。文末の記号と引用符の順序が
+    入れ替わる場合や、ピリオドが除かれる場合は、文はその範囲の文字列と
+    一致しません。
+  """
+  protected, removed, breaks, spaces = _find_sentence_boundaries(text)
+  n = len(text)
+  sentences = []
+  # 現在の文の (元の位置, 文字列) の断片。
+  pieces = []
+  segment_start = 0
+  next_space = 0
+
+  def close_sentence():
+    sentence = "".join(piece for _, piece in pieces).replace("\n", " ")
+    start = end = None
+    for position, piece in pieces:
+      stripped = piece.lstrip()
+      if stripped:
+        piece_start = position + len(piece) - len(stripped)
+        piece_end = position + len(piece.rstrip())
+        if start is None:
+          start, end = piece_start, piece_end
+        else:
+          start, end = min(start, piece_start), max(end, piece_end)
+    if start is None:
+      start = end = segment_start
+    sentences.append((sentence.strip(), start, end))
+    pieces.clear()
+
+  def add_text(end):
+    nonlocal next_space
+    start = segment_start
+    while next_space < len(spaces) and spaces[next_space] < end:
+      position = spaces[next_space]
+      next_space += 1
+      if start < position:
+        pieces.append((start, text[start:position]))
+      pieces.append((position, " "))
+      start = position + 1
+    if start < end:
+      pieces.append((start, text[start:end]))
+
+  # 文末とみなす記号の位置と、文の区切りを位置の順に処理します。
+  terminators = (
+      match.start() for match in _SENTENCE_TERMINATORS.finditer(text)
+      if match.start() not in protected and match.start() not in removed)
+  # 同じ位置では、文の区切りを記号より先に処理します。
+  events = sorted(breaks + [(position, 2) for position in terminators])
+  for position, priority in events:
+    if position < segment_start:
+      # 前の記号と引用符の並びに含まれる記号です。
+      continue
+    if priority < 2:
+      add_text(position)
+      close_sentence()
+      segment_start = position + (position in removed)
+      continue
+    # 記号と引用符の並びの範囲を求め、引用符を入れ替えて記号の後で区切ります。
+    run_start = position
+    while (run_start > segment_start and
+           text[run_start - 1] in _SENTENCE_QUOTES):
+      run_start -= 1
+    run_end = position
+    while run_end < n and (
+        text[run_end] in _SENTENCE_QUOTES or text[run_end] in "?!" or
+        (text[run_end] == "." and run_end not in protected and
+         run_end not in removed)):
+      run_end += 1
+    add_text(run_start)
+    segment_start = run_end
+    for mark, original_position in _swap_quotes(
+        [(text[i], i) for i in range(run_start, run_end)]):
+      pieces.append((original_position, mark))
+      if mark in ".?!":
+        close_sentence()
+  add_text(n)
+  close_sentence()
+  if not sentences[-1][0]:
+    sentences.pop()
+  return sentences
 
 
 def split_into_sentences(text):
@@ -78,70 +441,566 @@ def split_into_sentences(text):
   Returns:
     各文字列が1つの文である文字列のリスト。
   """
-  text = " " + text + "  "
-  text = text.replace("\n", " ")
-  text = re.sub(_PREFIXES, "\\1<prd>", text)
-  text = re.sub(_WEBSITES, "<prd>\\1", text)
-  text = re.sub(_DIGITS + "[.]" + _DIGITS, "\\1<prd>\\2", text)
-  text = re.sub(
-      _MULTIPLE_DOTS,
-      lambda match: "<prd>" * len(match.group(0)) + "<stop>",
-      text,
-  )
-  if "Ph.D" in text:
-    text = text.replace("Ph.D.", "Ph<prd>D<prd>")
-  text = re.sub(r"\s" + _ALPHABETS + "[.] ", " \\1<prd> ", text)
-  text = re.sub(_ACRONYMS + " " + _STARTERS, "\\1<stop> \\2", text)
-  text = re.sub(
-      _ALPHABETS + "[.]" + _ALPHABETS + "[.]" + _ALPHABETS + "[.]",
-      "\\1<prd>\\2<prd>\\3<prd>",
-      text,
-  )
-  text = re.sub(
-      _ALPHABETS + "[.]" + _ALPHABETS + "[.]", "\\1<prd>\\2<prd>", text
-  )
-  text = re.sub(" " + _SUFFIXES + "[.] " + _STARTERS, " \\1<stop> \\2", text)
-  text = re.sub(" " + _SUFFIXES + "[.]", " \\1<prd>", text)
-  text = re.sub(" " + _ALPHABETS + "[.]", " \\1<prd>", text)
-  if "”" in text:
-    text = text.replace(".”", "”.")
-  if '"' in text:
-    text = text.replace('."', '".')
-  if "!" in text:
-    text = text.replace('!"', '"!')
-  if "?" in text:
-    text = text.replace('?"', '"?')
-  text = text.replace(".", ".<stop>")
-  text = text.replace("?", "?<stop>")
-  text = text.replace("!", "!<stop>")
-  text = text.replace("<prd>", ".")
-  sentences = text.split("<stop>")
-  sentences = [s.strip() for s in sentences]
-  if sentences and not sentences[-1]:
-    sentences = sentences[:-1]
-  return sentences
+  return [
+      sentence for sentence, _, _ in split_into_sentences_with_offsets(text)
+  ]
+
+
+# `nltk.tokenize.RegexpTokenizer(r"\w+")`と同じ単語の区切り。
+_WORD_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+@functools.lru_cache(maxsize=None)
+def _import_nltk():
+  """nltkを必要になった時点で一度だけ読み込みます。
+
+  nltkの読み込みには時間がかかるため、正規表現のみを使うチェッカーだけを
+  実行する場合は読み込みません。
+  """
+  import nltk  # pylint: disable=g-import-not-at-top
+  return nltk
+
+
+def __getattr__(name):
+  # `instructions_util.nltk`を参照する既存のコードのために遅延して読み込みます。
+  if name == "nltk":
+    return _import_nltk()
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def count_words(text):
   """単語数をカウントします。"""
-  tokenizer = nltk.tokenize.RegexpTokenizer(r"\w+")
-  tokens = tokenizer.tokenize(text)
-  num_words = len(tokens)
-  return num_words
+  return len(_WORD_TOKEN_PATTERN.findall(text))
+
+
+# `\*[^\n\*]*\*`と`\*\*[^\n\*]*\*\*`と同じ範囲に一致し、内容が空白だけでない
+# 場合にのみグループが"*"になるパターン。空白の後の"*"の選択肢は後戻りしても
+# 1文字で失敗するため、どちらも線形時間で一致します。
+_HIGHLIGHT_PATTERN = re.compile(r"\*(?:[^\S\n]*\*|[^\n*]*(\*))")
+_DOUBLE_HIGHLIGHT_PATTERN = re.compile(r"\*\*(?:[^\S\n]*\*\*|[^\n*]*(\*)\*)")
+
+
+def count_placeholders(text):
+  r"""`[address]`のような角括弧で囲まれたプレースホルダーの数を返します。
+
+  `len(re.findall(r"\[.*?\]", text))`と同じ数を返します。`[`ごとに同じ
+  行の最も近い`]`までを1つと数えますが、一致した文字列は作りません。
+  閉じられない`[`の後は行の残りを読み飛ばすため、`[`が大量に続く行でも
+  線形時間で数えます。
+  """
+  count = 0
+  line_end = -1
+  start = text.find("[")
+  while start >= 0:
+    if start > line_end:
+      line_end = text.find("\n", start)
+      if line_end < 0:
+        line_end = len(text)
+    end = text.find("]", start + 1, line_end)
+    if end < 0:
+      # この行の残りの`[`も閉じられません。
+      start = text.find("[", line_end)
+      continue
+    count += 1
+    start = text.find("[", end + 1)
+  return count
+
+
+def count_highlighted_sections(text):
+  r"""`*強調*`と`**強調**`の形式の、内容が空白だけでない強調の数の合計を返します。
+
+  `re.findall(r"\*[^\n\*]*\*", text)`と
+  `re.findall(r"\*\*[^\n\*]*\*\*", text)`で見つかる強調のうち、内容が
+  空白だけでないものの数と同じです。同じ範囲に一致するパターンで、内容が
+  空白だけでない場合にのみ閉じる"*"を1文字のグループとして返させ、
+  その数を数えます。強調の文字列は作りません。`**強調**`のように両方の
+  形式に一致する強調は2回数えます。
+  """
+  return (_HIGHLIGHT_PATTERN.findall(text).count("*") +
+          _DOUBLE_HIGHLIGHT_PATTERN.findall(text).count("*"))
+
+
+class TokenIndex:
+  """テキストの単語（`\\w+`）の (開始位置, 終了位置) の索引。
+
+  位置は最初に必要になったときに一度だけ求め、`array`にまとめて保持します。
+  単語数は位置を求める前であれば`count_words`で数えます。単語の文字列は
+  `word`、`count_capital_words`、`word_counts`で必要な場合にのみ作成します。
+  """
+
+  def __init__(self, text):
+    self.text = text
+    self._offsets = None
+    self._num_words = None
+
+  def _get_offsets(self):
+    if self._offsets is None:
+      offsets = array.array("q")
+      for match in _WORD_TOKEN_PATTERN.finditer(self.text):
+        offsets.extend(match.span())
+      self._offsets = offsets
+    return self._offsets
+
+  def __len__(self):
+    if self._num_words is None:
+      if self._offsets is None:
+        self._num_words = count_words(self.text)
+      else:
+        self._num_words = len(self._offsets) // 2
+    return self._num_words
+
+  def span(self, i):
+    """i番目の単語の (開始位置, 終了位置) を返します。"""
+    offsets = self._get_offsets()
+    return offsets[2 * i], offsets[2 * i + 1]
+
+  def word(self, i):
+    """i番目の単語を返します。"""
+    start, end = self.span(i)
+    return self.text[start:end]
+
+  def count_capital_words(self):
+    """すべて大文字の単語の数を返します。"""
+    offsets = self._get_offsets()
+    text = self.text
+    return sum(
+        text[offsets[i]:offsets[i + 1]].isupper()
+        for i in range(0, len(offsets), 2))
+
+  def word_counts(self, vocabulary):
+    """`vocabulary`に含まれる単語ごとの出現回数を返します。
+
+    `vocabulary`のどの単語とも長さが異なる単語は、文字列を作成せずに
+    読み飛ばします。
+
+    Args:
+      vocabulary: 単語の集合。
+
+    Returns:
+      単語から出現回数への`collections.Counter`。
+    """
+    counts = collections.Counter()
+    lengths = {len(word) for word in vocabulary}
+    offsets = self._get_offsets()
+    text = self.text
+    for i in range(0, len(offsets), 2):
+      start, end = offsets[i], offsets[i + 1]
+      if end - start in lengths:
+        word = text[start:end]
+        if word in vocabulary:
+          counts[word] += 1
+    return counts
+
+
+# 空白だけでない行の先頭の空白に一致するパターン。一致の終了位置は行の
+# 最初の空白でない文字です。
+_LINE_INDENT_PATTERN = re.compile(r"^[^\S\n]*(?=\S)", flags=re.MULTILINE)
+
+
+class LineIndex:
+  """テキストの行の開始位置と、各行の最初の空白でない文字の位置の索引。
+
+  行は"\\n"で区切り、正規表現の`^`と`$`（`re.MULTILINE`）と同じく、最後の
+  "\\n"の後の空の行も含めます。行の開始位置は最初に必要になったときに
+  一度だけ求め、`array`にまとめて保持します。行の文字列は`line`と
+  `lower_line`で必要な場合にのみ作成します。
+  """
+
+  def __init__(self, text):
+    self.text = text
+    self._starts = None
+
+  def _get_starts(self):
+    if self._starts is None:
+      starts = array.array("q", itertools.accumulate(
+          map((1).__add__, map(len, self.text.split("\n"))), initial=0))
+      starts.pop()
+      self._starts = starts
+    return self._starts
+
+  def __len__(self):
+    return len(self._get_starts())
+
+  def span(self, i):
+    """i番目の行の改行を除いた (開始位置, 終了位置) を返します。"""
+    starts = self._get_starts()
+    end = starts[i + 1] - 1 if i + 1 < len(starts) else len(self.text)
+    return starts[i], end
+
+  def line(self, i):
+    """i番目の行を改行を除いて返します。"""
+    start, end = self.span(i)
+    return self.text[start:end]
+
+  def lower_line(self, i):
+    """i番目の行を小文字に変換して返します。"""
+    return self.line(i).lower()
+
+  def first_non_space(self, i):
+    """i番目の行の最初の空白でない文字の位置を返し、空白だけの行では-1を返します。"""
+    match = _LINE_INDENT_PATTERN.match(self.text, self._get_starts()[i])
+    return match.end() if match else -1
+
+  def non_blank_lines(self):
+    """空白だけでない行の (開始位置, 最初の空白でない文字の位置) を順に返します。
+
+    空白だけの行は正規表現で読み飛ばすため、行の開始位置を求めません。
+    """
+    return map(re.Match.span, _LINE_INDENT_PATTERN.finditer(self.text))
+
+
+PUNKT = "punkt"
+RULES = "rules"
+SENTENCE_COUNTERS = (PUNKT, RULES)
+
+_sentence_counter = PUNKT
+
+# 以下の正規表現はnltk 3.10の`PunktLanguageVars`と同じです。
+_PUNKT_NON_WORD = (
+    r"(?:[)\";}\]\*:@\'\({\[‘’“”\xab\xbb?!])")
+_PUNKT_MULTI_CHAR = r"(?:\-{2,}|\.{2,}|(?:\.\s){2,}\.)"
+_PUNKT_WORD_START = r"[^\(\"\`{\[:;&\#\*@\)}\]\-,]"
+_PUNKT_WORD_TOKENIZER = re.compile(
+    rf"({_PUNKT_MULTI_CHAR}|(?={_PUNKT_WORD_START})\S+?"
+    rf"(?=\s|$|{_PUNKT_NON_WORD}|{_PUNKT_MULTI_CHAR}|"
+    rf",(?=$|\s|{_PUNKT_NON_WORD}|{_PUNKT_MULTI_CHAR}))|\S)")
+_PUNKT_PERIOD_CONTEXT = re.compile(
+    rf"[.?!](?=(?P<after_tok>{_PUNKT_NON_WORD}|\s+(?P<next_tok>\S+)))")
+_PUNKT_BOUNDARY_REALIGNMENT = re.compile(
+    r"[\"\')\]}‘’“”\xab\xbb]+?(?:\s+|(?=--)|$)",
+    re.MULTILINE)
+_PUNKT_NUMERIC = re.compile(r"-?[\.,]?\d[\d,\.-]*\.?")
+_PUNKT_INITIAL = re.compile(r"[^\W\d]\.$")
+_PUNKT_ELLIPSIS = re.compile(r"\.\.+$")
+_PUNKT_SENTENCE_END_CHARS = (".", "?", "!")
+_PUNKT_PUNCTUATION = (";", ":", ",", ".", "!", "?")
+_PUNKT_NUMBER = "##number##"
+
+# nltkの英語のpunktモデル（tokenizers/punkt/english.pickle）の学習済みの
+# パラメータ`abbrev_types`と`sent_starters`を書き出した値です。
+# `instructions_util_test`でモデルのパラメータと一致することを確認します。
+
+# 文の区切りとみなさない、ピリオドで終わる省略語（小文字、末尾のピリオドなし）。
+_PUNKT_ABBREVIATIONS = frozenset((
+    ". . ", "a.a", "a.c", "a.d", "a.g", "a.h", "a.m", "a.m.e", "a.s", "a.t",
+    "adm", "ala", "ariz", "aug", "ave", "b.f", "b.v", "bros", "c", "c.i.t",
+    "c.o.m.b", "c.v", "calif", "chg", "cie", "co", "col", "colo", "conn",
+    "corp", "cos", "ct", "d", "d.c", "d.h", "d.w", "dec", "dr", "e", "e.f",
+    "e.h", "e.l", "e.m", "f", "f.g", "f.j", "feb", "fla", "fri", "ft", "g",
+    "g.d", "g.f", "g.k", "ga", "gen", "h", "h.c", "h.f", "h.m", "i.m.s", "ill",
+    "inc", "j.b", "j.c", "j.j", "j.k", "j.p", "j.r", "jan", "jr", "k", "kan",
+    "ky", "l", "l.a", "l.f", "l.p", "lt", "ltd", "m", "m.b.a", "m.d.c", "m.j",
+    "maj", "messrs", "mg", "mich", "minn", "mr", "mrs", "ms", "n", "n.c", "n.d",
+    "n.h", "n.j", "n.m", "n.v", "n.y", "nev", "nov", "oct", "ok", "okla", "ore",
+    "p", "p.a.m", "p.m", "pa", "ph.d", "prof", "r", "r.a", "r.h", "r.i", "r.j",
+    "r.k", "r.t", "rep", "reps", "s", "s.a", "s.a.y", "s.c", "s.g", "s.p.a",
+    "s.s", "sen", "sep", "sept", "sr", "st", "sw", "t", "t.j", "tenn", "tues",
+    "u.k", "u.n", "u.s", "u.s.a", "u.s.s.r", "v", "va", "vs", "vt", "w", "w.c",
+    "w.r", "w.va", "w.w", "wash", "wed", "wis", "yr",
+))
+
+# 省略語の後で大文字で始まる場合に、新しい文の始まりとみなす単語。
+_PUNKT_SENTENCE_STARTERS = frozenset((
+    "according", "although", "among", "both", "but", "despite", "even", "he",
+    "however", "i", "if", "in", "indeed", "instead", "it", "many", "meanwhile",
+    "moreover", "most", "nevertheless", "nonetheless", "nor", "sales",
+    "separately", "similarly", "since", "so", "some", "the", "there", "these",
+    "they", "this", "though", "thus", "under", "when", "while", "yet",
+))
 
 
 @functools.lru_cache(maxsize=None)
 def _get_sentence_tokenizer():
-  return nltk.data.load("nltk:tokenizers/punkt/english.pickle")
+  return _import_nltk().data.load("nltk:tokenizers/punkt/english.pickle")
+
+
+def _punkt_type(token):
+  token = token.lower()
+  return _PUNKT_NUMBER if _PUNKT_NUMERIC.fullmatch(token) else token
+
+
+def _punkt_type_no_period(token_type):
+  if len(token_type) > 1 and token_type[-1] == ".":
+    return token_type[:-1]
+  return token_type
+
+
+def _punkt_ortho_heuristic(token, token_type, sentence_starters):
+  """次のトークンが文の始まりかをTrue、False、Noneで返します。
+
+  学習済みの大文字小文字の出現の統計の代わりに、大文字で始まる
+  `sentence_starters`の単語のみを文の始まりとみなします。
+  """
+  if token in _PUNKT_PUNCTUATION:
+    return False
+  if token[0].isupper() and token_type in sentence_starters:
+    return True
+  if token[0].islower():
+    return False
+  return None
+
+
+def _punkt_first_pass(token, abbreviations):
+  """トークンの種類による (文末か, 省略語または省略記号か) を返します。"""
+  if token in _PUNKT_SENTENCE_END_CHARS:
+    return True, False
+  if token[-1] != ".":
+    return False, False
+  if token.endswith(".."):
+    return False, bool(_PUNKT_ELLIPSIS.match(token))
+  word = token[:-1].lower()
+  if word in abbreviations or word.rsplit("-", 1)[-1] in abbreviations:
+    return False, True
+  return True, False
+
+
+def _punkt_context_has_break(context, abbreviations, sentence_starters):
+  """`PunktSentenceTokenizer.text_contains_sentbreak`と同じ判定をします。
+
+  最後のトークンを除くいずれかのトークンが文末と判定された場合にTrueを
+  返します。トークンの判定は次のトークンのみに依存するため、トークンごとに
+  2回の走査の判定を続けて行います。
+  """
+  if "\n" in context:
+    tokens = []
+    for line in context.split("\n"):
+      if line.strip():
+        tokens.extend(_PUNKT_WORD_TOKENIZER.findall(line))
+  else:
+    tokens = _PUNKT_WORD_TOKENIZER.findall(context)
+  for i in range(len(tokens) - 1):
+    token = tokens[i]
+    if token[-1] != ".":
+      if token in _PUNKT_SENTENCE_END_CHARS:
+        return True
+      continue
+    is_break, is_abbreviation = _punkt_first_pass(token, abbreviations)
+    next_token = tokens[i + 1]
+    next_type = _punkt_type(next_token)
+    if _punkt_first_pass(next_token, abbreviations)[0]:
+      next_type = _punkt_type_no_period(next_type)
+    is_initial = _PUNKT_INITIAL.match(token)
+    if (is_abbreviation and not is_initial and
+        _punkt_ortho_heuristic(next_token, next_type, sentence_starters)):
+      is_break = True
+    elif is_initial or (
+        _punkt_type_no_period(_punkt_type(token)) == _PUNKT_NUMBER):
+      is_sentence_starter = _punkt_ortho_heuristic(
+          next_token, next_type, sentence_starters)
+      if is_sentence_starter is False or (
+          is_sentence_starter is None and is_initial and
+          next_token[0].isupper()):
+        is_break = False
+    if is_break:
+      return True
+  return False
+
+
+# 最後の空白文字までの最長一致。punktと同じくASCIIの空白文字のみです。
+_PUNKT_LAST_WHITESPACE = re.compile(
+    "(?s).*[%s]" % re.escape(string.whitespace))
+
+
+def _last_whitespace_index(text, start, end):
+  """`text[start:end]`の最後の空白文字の位置を返します。ない場合は-1。"""
+  match = _PUNKT_LAST_WHITESPACE.match(text, start, end)
+  return match.end() - 1 if match else -1
+
+
+def _iter_punkt_end_contexts(text):
+  """`PunktSentenceTokenizer._match_potential_end_contexts`と同じ候補を返します。
+
+  文字列の文脈の代わりに、文末の候補の一致と、その前の単語の開始位置と
+  終了位置の組を返します。
+  """
+  previous_start = previous_stop = 0
+  previous_match = None
+  for match in _PUNKT_PERIOD_CONTEXT.finditer(text):
+    index = _last_whitespace_index(text, previous_stop, match.start())
+    # punktと同じく、空白が区間の先頭にある場合は見つからない場合と同じです。
+    if index > previous_stop:
+      index += 1
+    else:
+      index = previous_start
+    if previous_match and previous_stop <= index:
+      yield previous_match, previous_start, previous_stop
+    previous_match = match
+    previous_start, previous_stop = index, match.start()
+  if previous_match:
+    yield previous_match, previous_start, previous_stop
+
+
+# 数字を含まない2文字以上の単語。ピリオドが続く場合は1つのトークンになり、
+# 省略語でなければ常に文末と判定されます。
+_PUNKT_PLAIN_WORD = re.compile(r"[^\W\d]{2,}")
+
+
+def _punkt_is_break(text, match, start, stop, abbreviations,
+                    sentence_starters):
+  """前の単語が`text[start:stop]`である文末の候補が文の区切りかを返します。"""
+  # "?"と"!"は常に1つのトークンになり、後に別のトークンが続くため、
+  # 文の区切りです。
+  if match.group() != ".":
+    return True
+  if (match.group("next_tok") and
+      _PUNKT_PLAIN_WORD.fullmatch(text, start, stop) and
+      text[start:stop].lower() not in abbreviations):
+    return True
+  return _punkt_context_has_break(
+      text[start:stop] + "." + match.group("after_tok"),
+      abbreviations, sentence_starters)
+
+
+def _count_sentences_with_rules(
+    text,
+    abbreviations=_PUNKT_ABBREVIATIONS,
+    sentence_starters=_PUNKT_SENTENCE_STARTERS,
+):
+  """punktの判定の手順を、学習済みのモデルの代わりに固定の規則で行います。
+
+  文の候補と各候補の判定は`PunktSentenceTokenizer`と同じ手順で行い、
+  学習済みのパラメータの代わりに`abbreviations`と`sentence_starters`を
+  使います。どちらも空の場合は、学習していない`PunktSentenceTokenizer`と
+  同じ数を返します。
+
+  Args:
+    text: 文の数をカウントする文字列。
+    abbreviations: 文の区切りとみなさない省略語の集合。
+    sentence_starters: 大文字で始まる場合に文の始まりとみなす単語の集合。
+
+  Returns:
+    文の数。
+  """
+  count = 0
+  last_break = 0
+  for match, start, stop in _iter_punkt_end_contexts(text):
+    if _punkt_is_break(text, match, start, stop, abbreviations,
+                       sentence_starters):
+      count += 1
+      if match.group("next_tok"):
+        last_break = match.start("next_tok")
+      else:
+        last_break = match.end()
+  last_sentence = text[last_break:len(text.rstrip())]
+  if count:
+    # 閉じ括弧や引用符は前の文に含められます。
+    realignment = _PUNKT_BOUNDARY_REALIGNMENT.match(last_sentence)
+    if realignment:
+      last_sentence = last_sentence[realignment.end():]
+  return count + bool(last_sentence)
+
+
+def set_sentence_counter(counter):
+  """`count_sentences`に使うカウンターを設定します。
+
+  `PUNKT`はnltkの学習済みのpunktモデル、`RULES`はpunktと同じ手順を
+  punktのモデルから書き出した省略語と文頭の単語の一覧で行う、nltkを
+  使わないカウンターです。`RULES`は大文字と小文字の出現の統計を使わない
+  ため、文の数がpunktと異なる場合があります。
+
+  Args:
+    counter: `SENTENCE_COUNTERS`のいずれかの文字列。
+
+  Raises:
+    ValueError: 未知のカウンターが指定された場合。
+  """
+  global _sentence_counter
+  if counter not in SENTENCE_COUNTERS:
+    raise ValueError(f"The supported sentence counters are "
+                     f"{SENTENCE_COUNTERS}, but {counter} is given.")
+  _sentence_counter = counter
+  # 以前のカウンターで数えた文の数を使わないようにします。
+  analyze_response.cache_clear()
+
+
+def get_sentence_counter():
+  """現在の文の数のカウンターの名前を返します。"""
+  return _sentence_counter
 
 
 def count_sentences(text):
-  """文の数をカウントします。"""
+  """`set_sentence_counter`で設定したカウンターで文の数をカウントします。"""
+  if _sentence_counter == RULES:
+    return _count_sentences_with_rules(text)
   tokenizer = _get_sentence_tokenizer()
   tokenized_sentences = tokenizer.tokenize(text)
   return len(tokenized_sentences)
 
 
+class ResponseAnalysis:
+  """1つの応答から複数のチェッカーが使う値を遅延して計算し、保持します。
+
+  各値は最初に参照されたときに一度だけ計算されます。同じ応答に対する
+  インスタンスは`analyze_response`で共有されます。
+  """
+
+  def __init__(self, text):
+    self.text = text
+
+  @functools.cached_property
+  def lower(self):
+    """小文字に変換した応答。"""
+    return self.text.lower()
+
+  @functools.cached_property
+  def token_index(self):
+    """応答の`TokenIndex`。"""
+    return TokenIndex(self.text)
+
+  @functools.cached_property
+  def lower_token_index(self):
+    """小文字に変換した応答の`TokenIndex`。"""
+    return TokenIndex(self.lower)
+
+  @functools.cached_property
+  def line_index(self):
+    """応答の`LineIndex`。"""
+    return LineIndex(self.text)
+
+  @functools.cached_property
+  def num_words(self):
+    """`count_words`による単語数。"""
+    return len(self.token_index)
+
+  @functools.cached_property
+  def num_sentences(self):
+    """`count_sentences`による文の数。"""
+    return count_sentences(self.text)
+
+  @functools.cached_property
+  def word_tokens(self):
+    """`nltk.word_tokenize`によるトークンのリスト。"""
+    return _import_nltk().word_tokenize(self.text)
+
+  @functools.cached_property
+  def paragraphs(self):
+    """2つの改行で区切った段落のリスト。"""
+    return self.text.split("\n\n")
+
+  @functools.cached_property
+  def divided_paragraphs(self):
+    """マークダウン区切り文字`***`で区切った段落のリスト。"""
+    return _DIVIDED_PARAGRAPH_SPLITTER.split(self.text)
+
+
+@functools.lru_cache(maxsize=32)
+def analyze_response(text):
+  """応答の`ResponseAnalysis`を返します。
+
+  緩い評価の変形を含め、同じ応答に対して複数の指示をチェックする間は
+  同じインスタンスが返されるため、トークン化などは一度だけ行われます。
+  `evaluation_lib`の評価の関数は、例の評価を終えるたびにキャッシュを
+  空にします。
+
+  Args:
+    text: 応答を表す文字列。
+
+  Returns:
+    `text`の`ResponseAnalysis`。
+  """
+  return ResponseAnalysis(text)
+
+
 def generate_keywords(num_keywords):
   """いくつかのキーワードをランダムに生成します。"""
   return random.sample(WORD_LIST, k=num_keywords)
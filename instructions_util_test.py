@@ -14,6 +14,10 @@
 
 """指示のユーティリティライブラリのテスト。"""
 
+import re
+import subprocess
+import sys
+
 from absl.testing import absltest
 from absl.testing import parameterized
 from instruction_following_eval import instructions_util
@@ -55,8 +59,10 @@ class InstructionsUtilTest(parameterized.TestCase):
       [
           {  # pylint: disable=g-complex-comprehension（複雑な内包表記を無効化）
               "testcase_name": (
-                  f"_response={response}_num_sentences={num_sentences}"
+                  f"_{counter}_response={response}"
+                  f"_num_sentences={num_sentences}"
               ),
+              "counter": counter,
               "response": response,
               "num_sentences": num_sentences,
           }
@@ -66,13 +72,91 @@ class InstructionsUtilTest(parameterized.TestCase):
               ("xxxx. xx,x! xx|x. x&x x?", 4),
               ("xx-x]xx,x! x{x}xx,x.", 2),
           ]
+          for counter in instructions_util.SENTENCE_COUNTERS
       ]
   )
-  def test_count_sentences(self, response, num_sentences):
+  def test_count_sentences(self, counter, response, num_sentences):
     """文のカウンターをテストする。"""
+    instructions_util.set_sentence_counter(counter)
+    self.addCleanup(instructions_util.set_sentence_counter,
+                    instructions_util.PUNKT)
     actual_num_sentences = instructions_util.count_sentences(response)
     self.assertEqual(num_sentences, actual_num_sentences)
 
+  @parameterized.parameters(
+      ("", 0),
+      ("   \n ", 0),
+      ("Dr. Smith arrived at 5 p.m. on Friday. He left early.", 2),
+      # punktのモデルの省略語に"e.g"は含まれません。
+      ("See the notes, e.g. the appendix. It helps.", 3),
+      ("We met J. Doe. The meeting went well.", 2),
+      ("Step 1. check the input. Step 2. Run it!", 3),
+      ('He said "Stop." Then he left... and came back.', 2),
+      ("Really?! (Yes.) Good.", 3),
+  )
+  def test_count_sentences_with_rules(self, response, num_sentences):
+    """省略語などを固定の規則で扱う文のカウンターをテストする。"""
+    # pylint: disable-next=protected-access
+    actual_num_sentences = instructions_util._count_sentences_with_rules(
+        response)
+    self.assertEqual(num_sentences, actual_num_sentences)
+
+  def test_rules_match_untrained_punkt(self):
+    """規則を空にしたカウンターが学習していないpunktと一致するかをテストする。"""
+    punkt = instructions_util.nltk.tokenize.punkt
+    tokenizer = punkt.PunktSentenceTokenizer()
+    for response in [
+        "A. B. c. D.", "It is 3.5. it was 4. Then 5.", "Wait... really?",
+        'End." Next (one). ok', "a.\n\n b!! ?c 'd.' e", "x.) y.' z", "...",
+        "Mr. Smith. -- Yes.-- no", "1. 2. 3.", "Dr. Who? (x.)\t “Hi.” OK",
+    ]:
+      with self.subTest(response=response):
+        # pylint: disable-next=protected-access
+        actual_num_sentences = instructions_util._count_sentences_with_rules(
+            response, abbreviations=frozenset(), sentence_starters=frozenset())
+        self.assertEqual(len(tokenizer.tokenize(response)),
+                         actual_num_sentences)
+
+  def test_rules_match_punkt_model(self):
+    """規則がpunktのモデルのパラメータと一致し、同じ数を返すかをテストする。"""
+    try:
+      # pylint: disable-next=protected-access
+      tokenizer = instructions_util._get_sentence_tokenizer()
+    except LookupError:
+      self.skipTest("The punkt model is not installed.")
+    # pylint: disable=protected-access
+    self.assertEqual(tokenizer._params.abbrev_types,
+                     instructions_util._PUNKT_ABBREVIATIONS)
+    self.assertEqual(tokenizer._params.sent_starters,
+                     instructions_util._PUNKT_SENTENCE_STARTERS)
+    # pylint: enable=protected-access
+    for response in [
+        "Dr. Smith arrived at 5 p.m. on Friday. He left early.",
+        "The U.S. economy grew. However, prices rose in Jan. Despite this, "
+        "Mr. Lee stayed.",
+        "See the notes, e.g. the appendix. It helps.",
+        "Step 1. check the input. Step 2. Run it!",
+        'He said "Stop." Then he left... and came back.',
+    ]:
+      with self.subTest(response=response):
+        # pylint: disable-next=protected-access
+        actual_num_sentences = instructions_util._count_sentences_with_rules(
+            response)
+        self.assertEqual(len(tokenizer.tokenize(response)),
+                         actual_num_sentences)
+
+  def test_set_sentence_counter(self):
+    """カウンターの設定と、未知のカウンターの拒否をテストする。"""
+    self.addCleanup(instructions_util.set_sentence_counter,
+                    instructions_util.get_sentence_counter())
+    instructions_util.set_sentence_counter(instructions_util.RULES)
+    self.assertEqual(instructions_util.RULES,
+                     instructions_util.get_sentence_counter())
+    self.assertEqual(
+        2, instructions_util.analyze_response("One. Two.").num_sentences)
+    with self.assertRaises(ValueError):
+      instructions_util.set_sentence_counter("unknown")
+
   TEST_SENTENCE_SPLIT_1 = """
   Google is a technology company. It was founded in 1998 by Larry Page
 and Sergey Brin. Google's mission is to organize the world's information
@@ -113,6 +197,140 @@ sharing the research that they have done.
     self.assertEqual(self.EXPECTED_SENTENCE_SPLIT_1, sentence_split_1)
     self.assertEqual(self.EXPECTED_SENTENCE_SPLIT_2, sentence_split_2)
 
+  @parameterized.parameters(
+      ("", []),
+      ("Wait... what?! Yes.", ["Wait...", "what?", "!", "Yes."]),
+      ('He said "Stop." Then Mr. Smith left.',
+       ['He said "Stop".', "Then Mr. Smith left."]),
+      ("Acme Inc. He works at 3.14 a.m. today.",
+       ["Acme Inc", "He works at 3.14 a.m. today."]),
+      ("The U.S. He lives\nthere.", ["The U.S.", "He lives there."]),
+  )
+  def test_sentence_splitter_rules(self, text, expected):
+    """文の分割器の省略語や引用符の規則をテストする。"""
+    self.assertEqual(expected, instructions_util.split_into_sentences(text))
+
+  def test_sentence_offsets(self):
+    """文の位置が元のテキストの範囲を指すかをテストする。"""
+    text = self.TEST_SENTENCE_SPLIT_1
+    sentences = instructions_util.split_into_sentences_with_offsets(text)
+    self.assertEqual(self.EXPECTED_SENTENCE_SPLIT_1,
+                     [sentence for sentence, _, _ in sentences])
+    for sentence, start, end in sentences:
+      self.assertEqual(sentence, text[start:end].replace("\n", " "))
+    self.assertEqual(
+        [("Say \"hi\".", 0, 9), ("Bye!", 10, 14)],
+        instructions_util.split_into_sentences_with_offsets(
+            'Say "hi." Bye!'))
+
+  def test_token_index(self):
+    """単語の位置の索引をテストする。"""
+    text = "The NASA team, and the TEAM-lead, met the team."
+    index = instructions_util.TokenIndex(text)
+    self.assertLen(index, instructions_util.count_words(text))
+    self.assertEqual((4, 8), index.span(1))
+    self.assertEqual("NASA", index.word(1))
+    self.assertEqual(2, index.count_capital_words())
+    self.assertEqual({"team": 2, "the": 2},
+                     index.word_counts({"team": 5, "the": 1, "nasa": 1}))
+    # 位置を求めた後も単語数は変わりません。
+    index = instructions_util.TokenIndex(text)
+    index.span(0)
+    self.assertLen(index, 10)
+    self.assertEmpty(instructions_util.TokenIndex(" ,. ").word_counts({"a"}))
+
+  def test_line_index(self):
+    """行の位置の索引をテストする。"""
+    text = "first\n  \n\t- Second\n"
+    index = instructions_util.LineIndex(text)
+    self.assertLen(index, 4)
+    self.assertEqual(["first", "  ", "\t- Second", ""],
+                     [index.line(i) for i in range(len(index))])
+    self.assertEqual((9, 18), index.span(2))
+    self.assertEqual("\t- second", index.lower_line(2))
+    self.assertEqual([0, -1, 10, -1],
+                     [index.first_non_space(i) for i in range(len(index))])
+    self.assertEqual([(0, 0), (9, 10)], list(index.non_blank_lines()))
+
+  def test_keyword_matcher(self):
+    """複数のキーワードのパターンの検索をテストする。"""
+    matcher = instructions_util.KeywordMatcher(
+        ["cat", "category", "dog", "cat"], re.IGNORECASE)
+    self.assertEqual(("cat", "category", "dog"), matcher.keywords)
+    # "cat"と重なる位置にしか現れない"category"も見つかります。
+    self.assertEqual({"cat", "category"}, matcher.find_all("A Category."))
+    self.assertFalse(matcher.contains_all("A Category."))
+    self.assertTrue(matcher.contains_all("Dogs in a category."))
+    self.assertTrue(matcher.contains_any("hotdog"))
+    self.assertFalse(matcher.contains_any("bird"))
+
+    matcher = instructions_util.KeywordMatcher(
+        ["cat", "dog"], re.IGNORECASE, word_boundary=True)
+    self.assertFalse(matcher.contains_any("category hotdog"))
+    self.assertEqual({"dog"}, matcher.find_all("a DOG."))
+
+    # 後方参照を含むパターンは、まとめずに個別に探します。
+    matcher = instructions_util.KeywordMatcher([r"(a)\1", r"(b)\1"])
+    self.assertTrue(matcher.contains_any("xbb"))
+    self.assertFalse(matcher.contains_any("ab"))
+
+  @parameterized.parameters(
+      "", "[a] [b]", "[[a]]", "[a\nb] [c]", "[a [b] c]", "a [ b\n[c]]",
+      "[]" * 5, "[" * 1000, "[a [" * 1000 + "]",
+  )
+  def test_count_placeholders(self, text):
+    """プレースホルダーの数が正規表現の一致の数と同じかをテストする。"""
+    self.assertEqual(len(re.findall(r"\[.*?\]", text)),
+                     instructions_util.count_placeholders(text))
+
+  @parameterized.parameters(
+      "", "*a* **b**", "* * **  **", "*a\nb*", "***a***", "**a *b* c**",
+      "*" * 1001, "**a *" * 1000, "* " * 1000 + "*",
+  )
+  def test_count_highlighted_sections(self, text):
+    """空白だけでない強調の数が正規表現の一致の数と同じかをテストする。"""
+    expected = sum(
+        1 for pattern in [r"\*[^\n\*]*\*", r"\*\*[^\n\*]*\*\*"]
+        for highlight in re.findall(pattern, text)
+        if highlight.strip("*").strip())
+    self.assertEqual(expected,
+                     instructions_util.count_highlighted_sections(text))
+
+  def test_analyze_response(self):
+    """応答の解析結果が共有され、個別の関数と一致するかをテストする。"""
+    text = "Hello World.\n\n*** Second paragraph here. ***"
+    analysis = instructions_util.analyze_response(text)
+    self.assertIs(analysis, instructions_util.analyze_response(text))
+    self.assertEqual(text.lower(), analysis.lower)
+    self.assertEqual(instructions_util.count_words(text), analysis.num_words)
+    self.assertEqual(["Hello World.", "*** Second paragraph here. ***"],
+                     analysis.paragraphs)
+    self.assertEqual(["Hello World.\n", "Second paragraph here.", ""],
+                     analysis.divided_paragraphs)
+
+  def test_compile_pattern(self):
+    """コンパイル済みパターンが共有され、ヒット数が数えられるかをテストする。"""
+    hits = instructions_util.pattern_cache_info().hits
+    pattern = instructions_util.compile_pattern(r"\bunique-test\b", 2)
+    self.assertIs(
+        pattern, instructions_util.compile_pattern(r"\bunique-test\b", 2))
+    self.assertGreater(instructions_util.pattern_cache_info().hits, hits)
+
+  def test_heavy_imports_are_deferred(self):
+    """正規表現のみのチェッカーの実行でnltkとlangdetectが読み込まれないかをテストする。"""
+    code = (
+        "import sys\n"
+        "from instruction_following_eval import instructions_registry\n"
+        "instruction = instructions_registry.INSTRUCTION_DICT["
+        "'punctuation:no_comma']('punctuation:no_comma')\n"
+        "instruction.build_description()\n"
+        "assert instruction.check_following('no commas here')\n"
+        "print(sorted({'nltk', 'langdetect', 'numpy'} & set(sys.modules)))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], check=True,
+                            capture_output=True, text=True).stdout
+    self.assertEqual("[]", output.strip())
+
   def test_generate_keywords(self):
     """キーワード生成機能をテストする。"""
     self.assertLen(instructions_util.generate_keywords(10), 10)
@@ -0,0 +1,162 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""jsonlの行の読み書きに使うJSONライブラリの切り替え。
+
+`loads`はどのライブラリでも`json.loads`と同じ値を返します。`orjson`や
+`msgspec`が同じ値を返せない行（NaN、64ビットに収まらない整数、対に
+なっていないサロゲートなど）は標準ライブラリで読み直します。
+
+`dumps`は`JSON`と`AUTO`では`json.dumps`と同じ文字列を返し、評価結果の
+ファイルはインストールされているライブラリによらず同じになります。
+`ORJSON`と`MSGSPEC`では区切りの空白を省き、ASCII以外の文字をエスケープ
+せずに書き込みます。NaNと無限大はnullとして書き込まれます。
+"""
+
+import functools
+import importlib
+import json
+
+AUTO = "auto"
+JSON = "json"
+ORJSON = "orjson"
+MSGSPEC = "msgspec"
+BACKENDS = (AUTO, JSON, ORJSON, MSGSPEC)
+
+# `AUTO`で読み込みに使うライブラリの優先順位。
+_FAST_DECODERS = (MSGSPEC, ORJSON)
+
+
+@functools.lru_cache(maxsize=None)
+def _import(name):
+  """ライブラリを読み込み、インストールされていない場合はNoneを返します。"""
+  try:
+    return importlib.import_module(name)
+  except ImportError:
+    return None
+
+
+def installed_backends():
+  """インストールされているライブラリの`BACKENDS`の名前を返します。"""
+  return tuple(backend for backend in BACKENDS
+               if backend in (AUTO, JSON) or _import(backend) is not None)
+
+
+def _contains_float(value):
+  """値に浮動小数点数が含まれるかどうかを、再帰せずに返します。"""
+  stack = [value]
+  while stack:
+    value = stack.pop()
+    if isinstance(value, float):
+      return True
+    if isinstance(value, dict):
+      stack.extend(value.values())
+    elif isinstance(value, list):
+      stack.extend(value)
+  return False
+
+
+def _orjson_loads(text):
+  orjson = _import(ORJSON)
+  try:
+    value = orjson.loads(text)
+  except orjson.JSONDecodeError:
+    return json.loads(text)
+  # `orjson`は64ビットに収まらない整数を浮動小数点数として読み込むため、
+  # 浮動小数点数を含む行は標準ライブラリで読み直します。
+  return json.loads(text) if _contains_float(value) else value
+
+
+@functools.lru_cache(maxsize=None)
+def _msgspec_decoder():
+  return _import(MSGSPEC).json.Decoder()
+
+
+def _msgspec_loads(text):
+  try:
+    return _msgspec_decoder().decode(text)
+  except (_import(MSGSPEC).DecodeError, UnicodeEncodeError):
+    return json.loads(text)
+
+
+def _orjson_dumps(value):
+  try:
+    return _import(ORJSON).dumps(value).decode("utf-8")
+  except TypeError:
+    return json.dumps(value)
+
+
+@functools.lru_cache(maxsize=None)
+def _msgspec_encoder():
+  return _import(MSGSPEC).json.Encoder()
+
+
+def _msgspec_dumps(value):
+  try:
+    return _msgspec_encoder().encode(value).decode("utf-8")
+  except (TypeError, ValueError):
+    return json.dumps(value)
+
+
+_LOADS = {JSON: json.loads, ORJSON: _orjson_loads, MSGSPEC: _msgspec_loads}
+_DUMPS = {JSON: json.dumps, ORJSON: _orjson_dumps, MSGSPEC: _msgspec_dumps}
+
+_backend = AUTO
+_loads = None
+_dumps = json.dumps
+
+
+def set_backend(backend):
+  """jsonlの読み書きに使うライブラリを設定します。
+
+  `AUTO`では、インストールされている最も速いライブラリで読み込み、
+  標準ライブラリで書き込みます。
+
+  Args:
+    backend: `BACKENDS`のいずれかの文字列。
+
+  Raises:
+    ValueError: 未知のライブラリや、インストールされていないライブラリが
+      指定された場合。
+  """
+  global _backend, _loads, _dumps
+  if backend not in BACKENDS:
+    raise ValueError(f"The supported JSON backends are {BACKENDS}, "
+                     f"but {backend} is given.")
+  if backend not in installed_backends():
+    raise ValueError(f"The JSON backend {backend} is not installed.")
+  _backend = backend
+  # `AUTO`の読み込みのライブラリは最初の`loads`で選びます。
+  _loads = None if backend == AUTO else _LOADS[backend]
+  _dumps = json.dumps if backend == AUTO else _DUMPS[backend]
+
+
+def get_backend():
+  """現在のライブラリの名前を返します。"""
+  return _backend
+
+
+def loads(text):
+  """jsonlの1行を読み込み、`json.loads`と同じ値を返します。"""
+  global _loads
+  if _loads is None:
+    _loads = next(
+        (_LOADS[backend] for backend in _FAST_DECODERS
+         if _import(backend) is not None), json.loads)
+  return _loads(text)
+
+
+def dumps(value):
+  """値をjsonlの1行の（改行を含まない）文字列に変換します。"""
+  return _dumps(value)
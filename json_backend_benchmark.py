@@ -0,0 +1,168 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""JSONライブラリごとのjsonlの読み込みと書き込みのスループットのベンチマーク。
+
+`--size_mb`の大きさの応答ファイルを合成し（`--input_response_data`を
+指定した場合はそのファイルを使い）、インストールされている
+`json_backend`のライブラリごとに`read_prompt_to_response_dict`の読み込みと、
+読み込んだ応答の評価結果の`write_outputs`での書き込みのスループットを
+計測します。
+
+例:
+
+  python3 -m instruction_following_eval.json_backend_benchmark --size_mb=1024
+"""
+
+import gc
+import itertools
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from absl import app
+from absl import flags
+
+from instruction_following_eval import evaluation_lib
+from instruction_following_eval import json_backend
+
+
+_INPUT_RESPONSE_DATA = flags.DEFINE_string(
+    "input_response_data",
+    None,
+    "計測に使う入力応答データへのパス。指定しない場合は合成します。",
+)
+
+_SIZE_MB = flags.DEFINE_integer(
+    "size_mb", 1024, "合成する応答ファイルの大きさ（MB）。"
+)
+
+_RESPONSE_SIZE = flags.DEFINE_integer(
+    "response_size", 4096, "合成する応答の大きさ（文字数）。"
+)
+
+_BACKENDS = flags.DEFINE_list(
+    "backends",
+    None,
+    "計測するライブラリ。指定しない場合はインストールされているすべての"
+    "ライブラリ。",
+)
+
+_WORK_DIR = flags.DEFINE_string(
+    "work_dir",
+    None,
+    "合成した応答ファイルと評価結果を書き込むディレクトリ。指定しない場合は"
+    "一時ディレクトリを使います。",
+)
+
+
+_SEED = 0
+
+# 合成する応答の単語。ASCII以外の文字のエスケープも計測に含めます。
+_WORDS = ("the", "model", "answer", "should", "include", "JSON", "évaluation",
+          "日本語", "Paris", "\"quoted\"", "tab\there", "line\nbreak")
+
+# 合成する応答の種類の数。応答ファイルの行はこれらを繰り返します。
+_NUM_DISTINCT_RESPONSES = 256
+
+
+def _write_response_file(file_name, size, response_size):
+  """約`size`バイトの応答ファイルを書き込みます。"""
+  rng = random.Random(_SEED)
+  responses = []
+  for _ in range(_NUM_DISTINCT_RESPONSES):
+    words = []
+    length = 0
+    while length < response_size:
+      words.append(rng.choice(_WORDS))
+      length += len(words[-1]) + 1
+    responses.append(" ".join(words))
+  written = 0
+  with open(file_name, "w") as f:
+    for i in itertools.count():
+      if written >= size:
+        break
+      line = json.dumps({
+          "prompt": f"Prompt {i}: write an answer.",
+          "response": responses[i % len(responses)],
+      }) + "\n"
+      f.write(line)
+      written += len(line)
+
+
+def _iter_outputs(prompt_to_response):
+  for i, (prompt, response) in enumerate(prompt_to_response.items()):
+    yield evaluation_lib.OutputExample(
+        instruction_id_list=["punctuation:no_comma", "detectable_format:title"],
+        prompt=prompt,
+        response=response,
+        follow_all_instructions=i % 2 == 0,
+        follow_instruction_list=[i % 2 == 0, True],
+    )
+
+
+def _benchmark(backend, input_file_name, output_file_name):
+  """ライブラリの読み込みと書き込みの秒数と、書き込んだバイト数を返します。"""
+  json_backend.set_backend(backend)
+  gc.collect()
+  start = time.perf_counter()
+  prompt_to_response = evaluation_lib.read_prompt_to_response_dict(
+      input_file_name)
+  read_seconds = time.perf_counter() - start
+  start = time.perf_counter()
+  evaluation_lib.write_outputs(output_file_name,
+                               _iter_outputs(prompt_to_response))
+  write_seconds = time.perf_counter() - start
+  return read_seconds, write_seconds, os.path.getsize(output_file_name)
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError("コマンドライン引数が多すぎます。")
+  backends = _BACKENDS.value or [
+      backend for backend in json_backend.installed_backends()
+      if backend != json_backend.AUTO
+  ]
+  for backend in backends:
+    if backend not in json_backend.installed_backends():
+      raise app.UsageError(f"The JSON backend {backend} is not installed.")
+
+  work_dir = _WORK_DIR.value or tempfile.mkdtemp()
+  try:
+    input_file_name = _INPUT_RESPONSE_DATA.value
+    if not input_file_name:
+      input_file_name = os.path.join(work_dir, "responses.jsonl")
+      _write_response_file(input_file_name, _SIZE_MB.value * 1024 * 1024,
+                           _RESPONSE_SIZE.value)
+    input_size = os.path.getsize(input_file_name)
+    output_file_name = os.path.join(work_dir, "eval_results.jsonl")
+    print(f"{input_file_name}: {input_size / 1e6:.1f} MB")
+    print(f"{'backend':10s} {'read MB/s':>10s} {'write MB/s':>11s} "
+          f"{'output MB':>10s}")
+    for backend in backends:
+      read_seconds, write_seconds, output_size = _benchmark(
+          backend, input_file_name, output_file_name)
+      print(f"{backend:10s} {input_size / 1e6 / read_seconds:10.1f} "
+            f"{output_size / 1e6 / write_seconds:11.1f} "
+            f"{output_size / 1e6:10.1f}", flush=True)
+  finally:
+    if not _WORK_DIR.value:
+      shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+  app.run(main)
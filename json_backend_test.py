@@ -0,0 +1,73 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""json_backendのテスト。"""
+
+import json
+import math
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from instruction_following_eval import json_backend
+
+
+class JsonBackendTest(parameterized.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.addCleanup(json_backend.set_backend, json_backend.get_backend())
+
+  @parameterized.parameters(*json_backend.BACKENDS)
+  def test_loads_matches_json(self, backend):
+    """どのライブラリでも`json.loads`と同じ値を読み込むかのテスト。"""
+    if backend not in json_backend.installed_backends():
+      self.skipTest(f"{backend} is not installed.")
+    json_backend.set_backend(backend)
+    for line in [
+        '{"prompt": "a\\u00e9", "response": "\\ud800", "key": 1}',
+        '{"n": 123456789012345678901, "m": -9223372036854775809}',
+        '{"x": [1.5, 1e400, NaN, -Infinity], "y": {"z": null}}',
+        '[true, false, "\\n"]\r\n',
+    ]:
+      with self.subTest(line=line):
+        expected = json.loads(line)
+        actual = json_backend.loads(line)
+        self.assertEqual(repr(expected), repr(actual))
+    self.assertTrue(math.isnan(json_backend.loads('{"x": NaN}')["x"]))
+    with self.assertRaises(ValueError):
+      json_backend.loads('{"a": 1,}')
+
+  @parameterized.parameters(*json_backend.BACKENDS)
+  def test_dumps_round_trip(self, backend):
+    """書き込んだ行が同じ値として読み込めるかのテスト。"""
+    if backend not in json_backend.installed_backends():
+      self.skipTest(f"{backend} is not installed.")
+    json_backend.set_backend(backend)
+    value = {"prompt": "é\ud800", "list": [True, None, 10**30], "n": 1.5}
+    self.assertEqual(value, json.loads(json_backend.dumps(value)))
+
+  def test_auto_writes_like_json(self):
+    """`AUTO`では標準ライブラリと同じ形式で書き込むかのテスト。"""
+    json_backend.set_backend(json_backend.AUTO)
+    value = {"prompt": "é", "follow_instruction_list": [True, None]}
+    self.assertEqual(json.dumps(value), json_backend.dumps(value))
+
+  def test_unknown_backend(self):
+    """未知のライブラリを拒否するかのテスト。"""
+    with self.assertRaises(ValueError):
+      json_backend.set_backend("unknown")
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -0,0 +1,220 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""Pythonのオブジェクトを作らずにJSONの形式を検証するライブラリ。
+
+`is_valid_json`は`json.loads`が受け付けるテキストかどうかを、値を
+デコードせずに正規表現のトークンの走査で判定し、最初の構文の誤りで
+終了します。入れ子はリストで管理するため、深い入れ子でも再帰しません。
+`simdjson`（pysimdjson）がインストールされている場合は先に`simdjson`で
+検証し、受け付けられなかった場合のみ走査します。
+"""
+
+import functools
+import re
+import sys
+
+# `json.loads`が値の前後で読み飛ばす空白。
+_WS = r"[ \t\n\r]*"
+
+# 制御文字を含まず、エスケープが正しい文字列。
+_STRING = (r'"[^"\\\x00-\x1f]*'
+           r'(?:\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})[^"\\\x00-\x1f]*)*"')
+
+_FRACTION_OR_EXPONENT = (r"(?:\.[0-9]+(?:[eE][-+]?[0-9]+)?"
+                         r"|[eE][-+]?[0-9]+)")
+
+
+def _number(max_int_digits):
+  """`json.loads`が受け付ける数値のパターンを返します。
+
+  小数部と指数部のない整数は`int`に変換されるため、桁数が
+  `sys.get_int_max_str_digits()`を超える整数は受け付けません。
+
+  Args:
+    max_int_digits: 整数の最大の桁数。0の場合は制限しません。
+
+  Returns:
+    数値のパターンを表す文字列。
+  """
+  if max_int_digits:
+    integer = rf"[1-9][0-9]{{0,{max_int_digits - 1}}}(?![0-9])"
+  else:
+    integer = r"[1-9][0-9]*"
+  return (rf"-?(?:0{_FRACTION_OR_EXPONENT}?"
+          rf"|[1-9][0-9]*{_FRACTION_OR_EXPONENT}|{integer})")
+
+
+class _Patterns:
+  """整数の最大の桁数ごとに作るトークンのパターン。"""
+
+  def __init__(self, max_int_digits):
+    # 空の配列とオブジェクトもスカラー値と同じく1つのトークンとして読みます。
+    scalar = (rf"(?:{_STRING}|{_number(max_int_digits)}"
+              rf"|true|false|null|NaN|Infinity|-Infinity"
+              rf"|\[{_WS}\]|\{{{_WS}\}})")
+    # 値。グループの番号で種類を区別します。
+    self.value = re.compile(rf"{_WS}(?:({scalar})|(\[)|(\{{))")
+    # 配列の要素の位置から続く、スカラー値とカンマの組。
+    self.array_items = re.compile(rf"(?:{_WS}{scalar}{_WS},)*")
+    # オブジェクトのメンバーの位置から続く、値がスカラーのメンバーとカンマの組。
+    self.object_members = re.compile(
+        rf"(?:{_WS}{_STRING}{_WS}:{_WS}{scalar}{_WS},)*")
+
+
+_KEY_PATTERN = re.compile(rf"{_WS}{_STRING}{_WS}:")
+_SEPARATOR_PATTERN = re.compile(rf"{_WS}([,\]}}])")
+_WS_PATTERN = re.compile(_WS)
+_LEADING_SPACE_PATTERN = re.compile(r"\s*")
+
+# `JsonFormat`が取り除くコードブロックの開始の区切り。順に取り除きます。
+_CODE_FENCE_PREFIXES = ("```json", "```Json", "```JSON", "```")
+_CODE_FENCE = "```"
+
+_BOM = "\ufeff"
+
+
+@functools.lru_cache(maxsize=None)
+def _get_patterns(max_int_digits):
+  return _Patterns(max_int_digits)
+
+
+def _max_int_digits():
+  # `sys.get_int_max_str_digits`はPython 3.11で追加されました。
+  get_int_max_str_digits = getattr(sys, "get_int_max_str_digits", None)
+  return get_int_max_str_digits() if get_int_max_str_digits else 0
+
+
+@functools.lru_cache(maxsize=None)
+def _get_simdjson_parser():
+  """`simdjson`のパーサーを返し、インストールされていない場合はNoneを返します。"""
+  try:
+    import simdjson  # pylint: disable=g-import-not-at-top
+  except ImportError:
+    return None
+  return simdjson.Parser()
+
+
+def _is_valid_with_simdjson(parser, text):
+  """`simdjson`が`text`を受け付けるかどうかを返します。
+
+  `simdjson`はRFC 8259のJSONのみを受け付けるため、受け付けたテキストは
+  `json.loads`も受け付けます。NaN、64ビットに収まらない整数、対になって
+  いないサロゲートなど、`json.loads`のみが受け付けるテキストではFalseを
+  返すため、走査で判定し直す必要があります。
+  """
+  try:
+    parser.parse(text.encode("utf-8"))
+  except (ValueError, RuntimeError):
+    return False
+  return True
+
+
+def _strip(text, start, end):
+  """`text[start:end].strip()`の範囲を、文字列を複製せずに返します。"""
+  start = _LEADING_SPACE_PATTERN.match(text, start, end).end()
+  while end > start and text[end - 1].isspace():
+    end -= 1
+  return start, end
+
+
+def strip_code_fence(text):
+  """マークダウンのコードブロックの区切りと前後の空白を除いた範囲を返します。
+
+  `text.strip()`に`removeprefix("```json")`、`removeprefix("```Json")`、
+  `removeprefix("```JSON")`、`removeprefix("```")`、`removesuffix("```")`、
+  `strip()`を順に適用した文字列の範囲を、文字列を作らずに求めます。
+
+  Args:
+    text: 応答を表す文字列。
+
+  Returns:
+    (開始位置, 終了位置) の組。
+  """
+  start, end = _strip(text, 0, len(text))
+  for prefix in _CODE_FENCE_PREFIXES:
+    if text.startswith(prefix, start, end):
+      start += len(prefix)
+  if text.endswith(_CODE_FENCE, start, end):
+    end -= len(_CODE_FENCE)
+  return _strip(text, start, end)
+
+
+def is_valid_json(text, start=0, end=None):
+  """`text[start:end]`を`json.loads`が受け付けるかどうかを返します。
+
+  値をデコードせず、部分文字列も作りません。深さの制限がないため、
+  `json.loads`が`RecursionError`を送出するほど深い入れ子のJSONでも
+  Trueを返します。
+
+  Args:
+    text: 検証するテキスト。
+    start: 検証する範囲の開始位置。
+    end: 検証する範囲の終了位置。Noneの場合はテキストの終わりです。
+
+  Returns:
+    範囲が1つのJSONの値と前後の空白のみからなる場合はTrue。
+  """
+  if end is None:
+    end = len(text)
+  parser = _get_simdjson_parser()
+  # `simdjson`はUTF-8のBOMを読み飛ばしますが、`json.loads`は受け付けません。
+  if (parser is not None and not text.startswith(_BOM, start, end) and
+      _is_valid_with_simdjson(parser, text[start:end])):
+    return True
+
+  patterns = _get_patterns(_max_int_digits())
+  # 開いている配列とオブジェクトを閉じる文字。
+  closers = []
+  pos = start
+  while True:
+    # 値を読みます。
+    match = patterns.value.match(text, pos, end)
+    if not match:
+      return False
+    pos = match.end()
+    if match.lastindex == 2:
+      closers.append("]")
+      pos = patterns.array_items.match(text, pos, end).end()
+      continue
+    if match.lastindex == 3:
+      closers.append("}")
+      pos = patterns.object_members.match(text, pos, end).end()
+      key = _KEY_PATTERN.match(text, pos, end)
+      if not key:
+        return False
+      pos = key.end()
+      continue
+
+    # 値の後のカンマか、配列やオブジェクトの終わりを読みます。
+    while True:
+      if not closers:
+        return _WS_PATTERN.match(text, pos, end).end() == end
+      separator = _SEPARATOR_PATTERN.match(text, pos, end)
+      if not separator:
+        return False
+      pos = separator.end()
+      if separator.group(1) != ",":
+        if separator.group(1) != closers.pop():
+          return False
+        continue
+      if closers[-1] == "]":
+        pos = patterns.array_items.match(text, pos, end).end()
+      else:
+        pos = patterns.object_members.match(text, pos, end).end()
+        key = _KEY_PATTERN.match(text, pos, end)
+        if not key:
+          return False
+        pos = key.end()
+      break
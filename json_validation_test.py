@@ -0,0 +1,83 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""json_validationのテスト。"""
+
+import json
+import sys
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from instruction_following_eval import json_validation
+
+
+def _loads_succeeds(text):
+  try:
+    json.loads(text)
+  except ValueError:
+    return False
+  return True
+
+
+class JsonValidationTest(parameterized.TestCase):
+
+  @parameterized.parameters(
+      "", " ", "{}", "[]", " [ ] ", "{ }", "0", "-0.5e+3", "1.", "1e", "01",
+      "-", ".5", "true", "nul", "truefalse", "NaN", "-Infinity", "-NaN",
+      '"a\\u00e9\\n"', '"\\x"', '"\\u12"', '"\\ud800"', '"\x01"', '"\x7f"',
+      '"', '{"a": 1}', '{"a" 1}', '{"a": 1,}', '{1: 2}', '[1, 2]', '[1,]',
+      '[,1]', '[1 2]', '[[], {}, [{}]]', '[}', '{]', '[1]]', '{"a": [1, {"b":',
+      '{"a": {"b": [null]}, "c": []}', "﻿[]", "[1]\n\t ", "[1] x",
+      "1" * 5000, "1" * 5000 + ".5", "1" * 5000 + "e1", "1" * 5000 + ".",
+  )
+  def test_matches_json_loads(self, text):
+    """`json.loads`と同じテキストを受け付けるかのテスト。"""
+    self.assertEqual(_loads_succeeds(text),
+                     json_validation.is_valid_json(text))
+
+  def test_range(self):
+    """範囲を指定した検証のテスト。"""
+    text = 'x{"a": [1]}y'
+    self.assertTrue(json_validation.is_valid_json(text, 1, len(text) - 1))
+    self.assertFalse(json_validation.is_valid_json(text, 1))
+
+  def test_deep_nesting(self):
+    """再帰の上限を超える深さの入れ子のテスト。"""
+    depth = sys.getrecursionlimit() * 2
+    self.assertTrue(json_validation.is_valid_json("[" * depth + "]" * depth))
+    self.assertFalse(
+        json_validation.is_valid_json("[" * depth + "]" * (depth - 1)))
+
+  @parameterized.parameters(
+      "", "```", "``````", " ```json\n[1]\n``` ", "```Json[1]```",
+      "```json```JSON\n{}\n```", "```\n```json\n", "　[1]　",
+      "[1]```", "```json",
+  )
+  def test_strip_code_fence(self, text):
+    """コードブロックの区切りの除去が文字列の操作と同じかのテスト。"""
+    expected = (
+        text.strip()
+        .removeprefix("```json")
+        .removeprefix("```Json")
+        .removeprefix("```JSON")
+        .removeprefix("```")
+        .removesuffix("```")
+        .strip()
+    )
+    start, end = json_validation.strip_code_fence(text)
+    self.assertEqual(expected, text[start:end])
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -0,0 +1,294 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""応答の言語検出ライブラリ。
+
+検出結果は応答の内容のハッシュをキーとするLRUキャッシュに保持されるため、
+同じ応答に対する検出は一度だけ行われます。検出器は次から選択できます。
+
+  * `langdetect`: 固定のシードを与えた`langdetect`。従来と同じ検出器です。
+  * `ngram`: `langdetect`の言語プロファイルを一度だけ読み込み、応答の先頭
+    部分のn-gramの対数尤度で言語を決める決定的な検出器です。
+"""
+
+import collections
+import functools
+import hashlib
+import math
+import operator
+import re
+
+
+LANGDETECT = "langdetect"
+NGRAM = "ngram"
+BACKENDS = (LANGDETECT, NGRAM)
+
+# `langdetect`の乱数のシード。
+_SEED = 0
+
+# キャッシュに保持する検出結果の最大数。
+_CACHE_SIZE = 4096
+
+# `ngram`検出器が使う応答の先頭部分の最大文字数。
+_NGRAM_MAX_TEXT_LENGTH = 2000
+
+# `ngram`検出器が対数尤度を記憶する単語の最大数。
+_NGRAM_MAX_CACHED_WORDS = 200000
+
+# `langdetect.detector.Detector.cleaning_text`と同じ文字の分類。
+_LATIN_RE = re.compile("[A-z]")
+_NON_LATIN_RE = re.compile("[\u0300-\u1dff\u1f00-\U0010ffff]")
+
+# `langdetect`と同じ平滑化パラメータと確率の閾値。
+_NGRAM_ALPHA = 0.5
+_NGRAM_BASE_FREQ = 10000
+_NGRAM_PROB_THRESHOLD = 0.1
+
+_UNKNOWN_LANGUAGE = "unknown"
+
+
+class LanguageDetectionError(Exception):
+  """応答の言語を検出できない場合に送出されます。"""
+
+
+@functools.lru_cache(maxsize=None)
+def _get_detector_factory():
+  """言語プロファイルを読み込み、固定のシードを設定したファクトリを返します。
+
+  `langdetect`は最初の言語検出の時点で読み込みます。
+  """
+  from langdetect import detector_factory  # pylint: disable=g-import-not-at-top
+  detector_factory.init_factory()
+  factory = detector_factory._factory  # pylint: disable=protected-access
+  factory.set_seed(_SEED)
+  return factory
+
+
+def _detect_with_langdetect(text):
+  """`langdetect`で言語を検出します。"""
+  import langdetect  # pylint: disable=g-import-not-at-top
+  detector = _get_detector_factory().create()
+  try:
+    detector.append(text)
+    return detector.detect()
+  except langdetect.LangDetectException as e:
+    raise LanguageDetectionError(str(e)) from e
+
+
+class _NormalizationTable(dict):
+  """`NGram.normalize`の結果を文字ごとに記憶する`str.translate`用の表。"""
+
+  def __init__(self, normalize):
+    super().__init__()
+    self._normalize = normalize
+
+  def __missing__(self, codepoint):
+    normalized = self._normalize(chr(codepoint))
+    self[codepoint] = normalized
+    return normalized
+
+
+class NgramLanguageDetector:
+  """`langdetect`の言語プロファイルを使う決定的なn-gram検出器。
+
+  `langdetect`は抽出したn-gramを無作為に抽出して確率を何度も更新しますが、
+  この検出器は応答の先頭`max_text_length`文字に含まれるすべてのn-gramの
+  対数尤度を一度だけ合計します。乱数を使わないため結果は常に同じです。
+  n-gramの抽出規則（正規化、単語境界、大文字のみの単語の除外）は
+  `langdetect`と同じです。単語ごとの対数尤度は記憶され、再利用されます。
+  """
+
+  def __init__(self, max_text_length=_NGRAM_MAX_TEXT_LENGTH):
+    # pylint: disable=g-import-not-at-top
+    from langdetect import detector
+    from langdetect.utils import ngram
+    # pylint: enable=g-import-not-at-top
+    self._detector_cls = detector.Detector
+    self._ngram_cls = ngram.NGram
+    self._factory = _get_detector_factory()
+    self._max_text_length = max_text_length
+    self._weight = _NGRAM_ALPHA / _NGRAM_BASE_FREQ
+    self._normalization_table = _NormalizationTable(self._ngram_cls.normalize)
+    # n-gramから言語別の対数確率への対応表。
+    self._gram_log_probs = {}
+    # 単語（末尾の空白を含む）から言語別の対数尤度の合計への対応表。
+    # n-gramを1つも含まない単語はNoneに対応します。
+    self._word_log_probs = {}
+
+  def _get_gram_log_probs(self, gram):
+    log_probs = self._gram_log_probs.get(gram)
+    if log_probs is None:
+      log_probs = [
+          math.log(self._weight + prob)
+          for prob in self._factory.word_lang_prob_map[gram]
+      ]
+      self._gram_log_probs[gram] = log_probs
+    return log_probs
+
+  def _compute_word_log_probs(self, word):
+    """単語に含まれるn-gramの言語別の対数尤度の合計を返します。"""
+    word_lang_prob_map = self._factory.word_lang_prob_map
+    padded = " " + word
+    gram_log_probs = []
+    for i in range(1, len(padded)):
+      # 大文字が続く単語のn-gramは`langdetect`と同様に数えません。
+      if padded[i].isupper() and padded[i - 1].isupper():
+        continue
+      for n in range(1, min(i + 1, self._ngram_cls.N_GRAM) + 1):
+        gram = padded[i - n + 1:i + 1]
+        if gram != " " and gram in word_lang_prob_map:
+          gram_log_probs.append(self._get_gram_log_probs(gram))
+    if not gram_log_probs:
+      return None
+    return [math.fsum(column) for column in zip(*gram_log_probs)]
+
+  def _get_word_log_probs(self, word):
+    try:
+      return self._word_log_probs[word]
+    except KeyError:
+      pass
+    if len(self._word_log_probs) >= _NGRAM_MAX_CACHED_WORDS:
+      self._word_log_probs.clear()
+    log_probs = self._compute_word_log_probs(word)
+    self._word_log_probs[word] = log_probs
+    return log_probs
+
+  def _normalize(self, text):
+    """`langdetect.detector.Detector`と同じ前処理をした先頭部分を返します。"""
+    text = text[:self._max_text_length]
+    text = self._detector_cls.URL_RE.sub(" ", text)
+    text = self._detector_cls.MAIL_RE.sub(" ", text)
+    text = self._ngram_cls.normalize_vi(text)
+    # ラテン文字以外が大半を占める場合はラテン文字を除きます。
+    latin_count = len(_LATIN_RE.findall(text))
+    non_latin_count = len(_NON_LATIN_RE.findall(text))
+    if latin_count * 2 < non_latin_count:
+      text = _LATIN_RE.sub("", text)
+    return text.translate(self._normalization_table)
+
+  def detect(self, text):
+    """応答の言語のISO 639-1コードを返します。
+
+    Args:
+      text: 応答を表す文字列。
+
+    Returns:
+      検出された言語のコード。どの言語の確率も閾値に届かない場合は
+      "unknown"。
+
+    Raises:
+      LanguageDetectionError: 応答にn-gramが1つも含まれない場合。
+    """
+    words = self._normalize(text).split(" ")
+    # 空白で終わる単語には末尾の空白を含むn-gramがあるため、区別して数えます。
+    word_counts = collections.Counter(word + " " for word in words[:-1] if word)
+    if words[-1]:
+      word_counts[words[-1]] += 1
+
+    counts = []
+    word_log_probs = []
+    for word, count in word_counts.items():
+      log_probs = self._get_word_log_probs(word)
+      if log_probs is not None:
+        counts.append(count)
+        word_log_probs.append(log_probs)
+    if not counts:
+      raise LanguageDetectionError("No features in text.")
+
+    scores = [
+        sum(map(operator.mul, counts, column))
+        for column in zip(*word_log_probs)
+    ]
+    best = max(range(len(scores)), key=scores.__getitem__)
+    total = sum(math.exp(score - scores[best]) for score in scores)
+    if 1.0 / total <= _NGRAM_PROB_THRESHOLD:
+      return _UNKNOWN_LANGUAGE
+    return self._factory.langlist[best]
+
+
+@functools.lru_cache(maxsize=None)
+def _get_ngram_detector():
+  return NgramLanguageDetector()
+
+
+def _detect_with_ngram(text):
+  return _get_ngram_detector().detect(text)
+
+
+_DETECTORS = {
+    LANGDETECT: _detect_with_langdetect,
+    NGRAM: _detect_with_ngram,
+}
+
+_backend = LANGDETECT
+
+# (検出器, 応答のハッシュ) から検出結果または例外への対応表。
+_cache = collections.OrderedDict()
+
+
+def set_backend(backend):
+  """言語検出に使う検出器を設定します。
+
+  Args:
+    backend: `BACKENDS`のいずれかの文字列。
+
+  Raises:
+    ValueError: 未知の検出器が指定された場合。
+  """
+  global _backend
+  if backend not in _DETECTORS:
+    raise ValueError(f"The supported language detectors are {BACKENDS}, "
+                     f"but {backend} is given.")
+  _backend = backend
+
+
+def get_backend():
+  """現在の検出器の名前を返します。"""
+  return _backend
+
+
+def clear_cache():
+  """検出結果のキャッシュを空にします。"""
+  _cache.clear()
+
+
+def detect_language(text):
+  """応答の言語のISO 639-1コードを返します。
+
+  Args:
+    text: 応答を表す文字列。
+
+  Returns:
+    検出された言語のコード。
+
+  Raises:
+    LanguageDetectionError: 応答の言語を検出できない場合。
+  """
+  key = (_backend, hashlib.blake2b(text.encode("utf-8", "surrogatepass"),
+                                   digest_size=16).digest())
+  result = _cache.get(key)
+  if result is None:
+    try:
+      result = _DETECTORS[_backend](text)
+    except LanguageDetectionError as e:
+      result = e
+    _cache[key] = result
+    if len(_cache) > _CACHE_SIZE:
+      _cache.popitem(last=False)
+  else:
+    _cache.move_to_end(key)
+
+  if isinstance(result, LanguageDetectionError):
+    raise LanguageDetectionError(*result.args)
+  return result
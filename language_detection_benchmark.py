@@ -0,0 +1,110 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""言語検出の1回あたりのレイテンシを計測するベンチマーク。
+
+例:
+
+  python3 -m instruction_following_eval.language_detection_benchmark \
+    --input_response_data=instruction_following_eval/data/input_response_data_gpt4_20231107_145030.jsonl
+"""
+
+import json
+import time
+
+from absl import app
+from absl import flags
+import langdetect
+
+from instruction_following_eval import language_detection
+
+
+_INPUT_RESPONSE_DATA = flags.DEFINE_string(
+    "input_response_data", None, "入力応答データへのパス", required=True
+)
+
+_NUM_RESPONSES = flags.DEFINE_integer(
+    "num_responses", 200, "計測に使う応答の最大数。"
+)
+
+
+def _read_responses(filename, num_responses):
+  responses = []
+  with open(filename, "r") as f:
+    for l in f:
+      response = json.loads(l)["response"]
+      if response.strip():
+        responses.append(response)
+      if len(responses) >= num_responses:
+        break
+  return responses
+
+
+def _time_per_call(detect, responses, clear_cache):
+  """1回あたりの平均レイテンシ（ミリ秒）と検出結果を返します。"""
+  results = []
+  elapsed = 0.0
+  for response in responses:
+    if clear_cache:
+      language_detection.clear_cache()
+    start = time.perf_counter()
+    try:
+      results.append(detect(response))
+    except (langdetect.LangDetectException,
+            language_detection.LanguageDetectionError):
+      results.append(None)
+    elapsed += time.perf_counter() - start
+  return elapsed * 1000 / len(responses), results
+
+
+def _detect_with_backend(backend):
+  def detect(text):
+    language_detection.set_backend(backend)
+    return language_detection.detect_language(text)
+  return detect
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError("コマンドライン引数が多すぎます。")
+
+  responses = _read_responses(_INPUT_RESPONSE_DATA.value,
+                              _NUM_RESPONSES.value)
+  # プロファイルの読み込みは計測に含めません。
+  langdetect.detect("warm up")
+  _detect_with_backend(language_detection.NGRAM)("warm up")
+
+  baseline_ms, baseline = _time_per_call(
+      langdetect.detect, responses, clear_cache=False)
+  rows = [("langdetect.detect (no seed, no cache)", baseline_ms, baseline)]
+  for backend in language_detection.BACKENDS:
+    detect = _detect_with_backend(backend)
+    # 1回目は検出器内部の単語ごとの記憶も空の状態、2回目はその記憶が
+    # 温まった状態で、どちらも結果のキャッシュには当たりません。
+    for name in ("first pass", "steady state"):
+      ms, results = _time_per_call(detect, responses, clear_cache=True)
+      rows.append((f"{backend} ({name})", ms, results))
+    _time_per_call(detect, responses, clear_cache=False)
+    ms, results = _time_per_call(detect, responses, clear_cache=False)
+    rows.append((f"{backend} (cache hit)", ms, results))
+
+  print(f"{len(responses)} responses")
+  for name, ms, results in rows:
+    agreement = sum(a == b for a, b in zip(baseline, results)) / len(results)
+    print(f"{name:40s} {ms:9.4f} ms/call  "
+          f"speedup {baseline_ms / ms:8.1f}x  agreement {agreement:.3f}")
+
+
+if __name__ == "__main__":
+  app.run(main)
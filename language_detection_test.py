@@ -0,0 +1,62 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""language_detection.pyのテスト。"""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from instruction_following_eval import language_detection
+
+
+class LanguageDetectionTest(parameterized.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    language_detection.clear_cache()
+    self.addCleanup(language_detection.set_backend,
+                    language_detection.get_backend())
+
+  @parameterized.product(
+      backend=language_detection.BACKENDS,
+      text_and_language=[
+          ("The quick brown fox jumps over the lazy dog near the river.",
+           "en"),
+          ("Desayunamos en el restaurante de la esquina todos los domingos.",
+           "es"),
+          ("Nous avons visité le musée du Louvre avec nos enfants hier.",
+           "fr"),
+      ],
+  )
+  def test_detect_language(self, backend, text_and_language):
+    """各検出器で言語を検出できるかのテスト。"""
+    text, language = text_and_language
+    language_detection.set_backend(backend)
+    self.assertEqual(language, language_detection.detect_language(text))
+
+  @parameterized.parameters(*language_detection.BACKENDS)
+  def test_detection_error(self, backend):
+    """特徴のない応答で例外が送出され、キャッシュ後も同じかのテスト。"""
+    language_detection.set_backend(backend)
+    for _ in range(2):
+      with self.assertRaises(language_detection.LanguageDetectionError):
+        language_detection.detect_language("1234 5678")
+
+  def test_unknown_backend(self):
+    """未知の検出器を指定した場合のテスト。"""
+    with self.assertRaises(ValueError):
+      language_detection.set_backend("unknown")
+
+
+if __name__ == "__main__":
+  absltest.main()
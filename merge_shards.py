@@ -0,0 +1,159 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""`evaluation_main --num_shards`で評価したシャードをまとめるバイナリ。
+
+すべてのシャードの評価結果を入力データの順序にマージし、単一の実行と
+同じ評価結果のファイル、レポート、リーダーボードを書き込み、同じ
+レポートを出力します。評価結果の行は読み直さずにそのまま書き込み、
+レポートはシャードの集計から計算します。
+
+例:
+
+  for i in 0 1 2 3; do
+    python3 -m instruction_following_eval.evaluation_main \
+      --input_data=... --input_response_data=... --output_dir=/tmp/out \
+      --num_shards=4 --shard_index=$i &
+  done
+  wait
+  python3 -m instruction_following_eval.merge_shards --output_dir=/tmp/out
+"""
+
+import contextlib
+import glob
+import json
+import os
+
+from absl import app
+from absl import flags
+from absl import logging
+
+from instruction_following_eval import evaluation_lib
+
+
+_OUTPUT_DIR = flags.DEFINE_string(
+    "output_dir",
+    None,
+    "`evaluation_main`にシャードごとに指定した出力ディレクトリ。",
+    required=True,
+)
+
+
+def _accumulator_pattern(output_dir, result_file_name):
+  return evaluation_lib.shard_file_pattern(os.path.join(
+      output_dir, result_file_name + evaluation_lib.ACCUMULATOR_FILE_SUFFIX))
+
+
+def _read_accumulators(output_dir, result_file_name):
+  """評価結果のファイルのすべてのシャードの集計を、シャードの順に返します。"""
+  accumulators = []
+  for accumulator_file_name in glob.glob(
+      _accumulator_pattern(output_dir, result_file_name)):
+    with open(accumulator_file_name) as f:
+      accumulators.append(json.load(f))
+  if not accumulators:
+    raise app.UsageError(
+        f"No shards of {result_file_name} found in {output_dir}.")
+  accumulators.sort(key=lambda accumulator: accumulator["shard_index"])
+  num_shards = accumulators[0]["num_shards"]
+  shard_indices = [accumulator["shard_index"] for accumulator in accumulators]
+  if (shard_indices != list(range(num_shards)) or
+      any(a["num_shards"] != num_shards for a in accumulators)):
+    raise app.UsageError(
+        f"Expected shards 0-{num_shards - 1} of {result_file_name} in "
+        f"{output_dir}, found {shard_indices}.")
+  return accumulators
+
+
+def _merge_result_file(output_dir, result_file_name, accumulators):
+  """評価結果のファイルのシャードをまとめ、レポートを出力します。
+
+  Args:
+    output_dir: シャードを含むディレクトリ。
+    result_file_name: 評価結果のファイル名（拡張子を除く）。
+    accumulators: `_read_accumulators`が返すシャードの集計のリスト。
+
+  Returns:
+    評価結果を集めた`ReportAccumulator`。
+  """
+  output_file_name = os.path.join(output_dir, result_file_name + ".jsonl")
+  accumulator = evaluation_lib.ReportAccumulator()
+  with contextlib.ExitStack() as stack:
+    shards = [
+        (stack.enter_context(open(
+            evaluation_lib.shard_file_name(
+                output_file_name, shard["shard_index"], shard["num_shards"]),
+            encoding="utf-8")),
+         shard)
+        for shard in accumulators
+    ]
+    with open(output_file_name, "w", encoding="utf-8") as f:
+      for line, instruction_id_list, follow_instruction_list in (
+          evaluation_lib.merge_shard_results(shards)):
+        f.write(line)
+        accumulator.add_verdicts(instruction_id_list, follow_instruction_list)
+  logging.info("Generated: %s", output_file_name)
+
+  settings = accumulators[0]
+  report_file_name = evaluation_lib.write_report(
+      output_file_name, accumulator, settings["num_bootstrap_samples"],
+      settings["prompt_level_only"])
+  logging.info("Generated: %s", report_file_name)
+  return accumulator
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError("コマンドライン引数が多すぎます。")
+
+  # 複数の応答ファイルを評価した場合、シャードはモデルのディレクトリにあり、
+  # 集計にモデルの評価の順序が記録されています。
+  output_dirs = [_OUTPUT_DIR.value]
+  models = None
+  strict_file_name = evaluation_lib.RESULT_FILE_NAMES[0]
+  if not glob.glob(_accumulator_pattern(_OUTPUT_DIR.value, strict_file_name)):
+    accumulator_file_names = glob.glob(_accumulator_pattern(
+        os.path.join(_OUTPUT_DIR.value, "*"), strict_file_name))
+    if not accumulator_file_names:
+      raise app.UsageError(f"No shards found in {_OUTPUT_DIR.value}.")
+    with open(accumulator_file_names[0]) as f:
+      models = json.load(f)["models"]
+    output_dirs = [os.path.join(_OUTPUT_DIR.value, model) for model in models]
+
+  model_to_accumulators = {}
+  prompt_level_only = False
+  for model, output_dir in zip(models or [None], output_dirs):
+    model_to_accumulators[model] = []
+    for result_file_name in evaluation_lib.RESULT_FILE_NAMES:
+      accumulators = _read_accumulators(output_dir, result_file_name)
+      prompt_level_only = accumulators[0]["prompt_level_only"]
+      model_to_accumulators[model].append(
+          _merge_result_file(output_dir, result_file_name, accumulators))
+    if prompt_level_only:
+      # 呼び出し回数はどちらの評価結果のファイルの集計にも同じ値が
+      # 記録されているため、最後に読んだ集計のみを合計します。
+      checker_calls = evaluation_lib.CheckerCalls()
+      for shard in accumulators:
+        checker_calls.merge(
+            evaluation_lib.CheckerCalls(**shard["checker_calls"]))
+      print(checker_calls.format_summary())
+
+  if models is not None:
+    evaluation_lib.write_leaderboard(
+        os.path.join(_OUTPUT_DIR.value, evaluation_lib.LEADERBOARD_FILE_NAME),
+        model_to_accumulators, prompt_level_only)
+
+
+if __name__ == "__main__":
+  app.run(main)
@@ -0,0 +1,134 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""チェッカーの呼び出しごとのレイテンシのプロファイル。
+
+`evaluation_lib.enable_profiling`で有効にすると、`check_following`と
+`build_description`の呼び出しごとのレイテンシと入力の長さが
+(メソッド, 指示ID, 変形の番号) ごとに記録されます。変形の番号は緩い評価で
+試す応答の変形の番号で、0は元の応答（厳密な評価）です。
+`build_description`の変形の番号は常に0です。
+"""
+
+import array
+import csv
+import json
+
+
+CHECK_FOLLOWING = "check_following"
+BUILD_DESCRIPTION = "build_description"
+
+# CSVとJSONの各行の列。
+_FIELDS = (
+    "method",
+    "instruction_id",
+    "variant",
+    "count",
+    "total_ms",
+    "p50_ms",
+    "p99_ms",
+    "mean_input_length",
+)
+
+
+class Profile:
+  """呼び出しごとのレイテンシの標本を集めます。"""
+
+  def __init__(self):
+    # (メソッド, 指示ID, 変形の番号) から (レイテンシ（秒）の配列,
+    # 入力の長さの合計) への対応表。
+    self._samples = {}
+
+  def record(self, method, instruction_id, variant, input_length, seconds):
+    """1回の呼び出しを記録します。"""
+    key = (method, instruction_id, variant)
+    samples = self._samples.get(key)
+    if samples is None:
+      samples = [array.array("d"), 0]
+      self._samples[key] = samples
+    samples[0].append(seconds)
+    samples[1] += input_length
+
+  def merge(self, other):
+    """別のプロファイル（ワーカープロセスのものなど）の標本を加えます。"""
+    # pylint: disable-next=protected-access
+    for key, (latencies, input_length) in other._samples.items():
+      samples = self._samples.get(key)
+      if samples is None:
+        self._samples[key] = [array.array("d", latencies), input_length]
+      else:
+        samples[0].extend(latencies)
+        samples[1] += input_length
+
+  def __bool__(self):
+    return bool(self._samples)
+
+  def rows(self):
+    """集計した行を合計時間の降順で返します。"""
+    import numpy as np  # pylint: disable=g-import-not-at-top
+    rows = []
+    for (method, instruction_id, variant), (latencies, input_length) in (
+        self._samples.items()):
+      latencies_ms = np.frombuffer(latencies, dtype=np.float64) * 1000
+      p50, p99 = np.percentile(latencies_ms, [50, 99])
+      rows.append({
+          "method": method,
+          "instruction_id": instruction_id,
+          "variant": variant,
+          "count": len(latencies),
+          "total_ms": float(latencies_ms.sum()),
+          "p50_ms": float(p50),
+          "p99_ms": float(p99),
+          "mean_input_length": input_length / len(latencies),
+      })
+    rows.sort(key=lambda row: row["total_ms"], reverse=True)
+    return rows
+
+  def write_json(self, output_file_name):
+    """集計した行をJSONで書き込みます。"""
+    with open(output_file_name, "w") as f:
+      json.dump(self.rows(), f, indent=2)
+      f.write("\n")
+
+  def write_csv(self, output_file_name):
+    """集計した行をCSVで書き込みます。"""
+    with open(output_file_name, "w", newline="") as f:
+      writer = csv.DictWriter(f, fieldnames=_FIELDS)
+      writer.writeheader()
+      writer.writerows(self.rows())
+
+  def format_summary(self, num_rows=10):
+    """指示IDごとの合計時間の上位と、時間のかかる呼び出しの一覧を返します。"""
+    rows = self.rows()
+    total_ms = sum(row["total_ms"] for row in rows)
+    by_instruction = {}
+    for row in rows:
+      by_instruction[row["instruction_id"]] = (
+          by_instruction.get(row["instruction_id"], 0.0) + row["total_ms"])
+
+    lines = [f"checker time: {total_ms:.1f} ms in "
+             f"{sum(row['count'] for row in rows)} calls"]
+    for instruction_id, ms in sorted(
+        by_instruction.items(), key=lambda item: item[1], reverse=True
+    )[:num_rows]:
+      lines.append(f"{instruction_id} {ms:.1f} ms "
+                   f"({ms / total_ms * 100 if total_ms else 0.0:.1f}%)")
+    lines.append("")
+    lines.append(" ".join(_FIELDS))
+    for row in rows[:num_rows]:
+      lines.append(
+          f"{row['method']} {row['instruction_id']} {row['variant']} "
+          f"{row['count']} {row['total_ms']:.3f} {row['p50_ms']:.4f} "
+          f"{row['p99_ms']:.4f} {row['mean_input_length']:.0f}")
+    return "\n".join(lines)
@@ -0,0 +1,244 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""精度スコアのレポートとブートストラップ信頼区間の計算ライブラリ。
+
+評価結果を (例 × 指示ID) の行列に一度だけまとめ、プロンプトレベル、
+指示レベル、tier0（指示IDの接頭辞）、tier1（指示ID）の精度を分子と分母の
+列の和として計算します。ブートストラップでは例の再標本化を重み行列で表し、
+すべての精度を行列積でまとめて計算します。numpyはレポートの計算の時点で
+読み込みます。
+"""
+
+import array
+import dataclasses
+from typing import Dict, Optional
+
+
+# ブートストラップの乱数のシード。
+_BOOTSTRAP_SEED = 0
+
+# ブートストラップの重み行列の1回あたりの最大要素数。
+_MAX_WEIGHT_ELEMENTS = 1 << 24
+
+
+@dataclasses.dataclass(frozen=True)
+class Accuracy:
+  """精度と、その信頼区間。"""
+  value: float
+  ci_low: Optional[float] = None
+  ci_high: Optional[float] = None
+
+
+@dataclasses.dataclass(frozen=True)
+class Report:
+  """精度スコアのレポート。"""
+  prompt_level: Accuracy
+  instruction_level: Accuracy
+  tier0: Dict[str, Accuracy]
+  tier1: Dict[str, Accuracy]
+  num_bootstrap_samples: int
+  confidence: float
+
+
+class VerdictMatrix:
+  """評価結果を (例 × 指示ID) の行列として集める。
+
+  `total[i, j]`は例iに含まれる指示ID jの数、`followed[i, j]`はそのうち
+  追従した数です。評価結果は`add`で1つずつ加えられ、行列は`build`で
+  一度だけ作成されます。
+  """
+
+  def __init__(self):
+    self.num_examples = 0
+    self._columns = {}
+    self._rows = array.array("q")
+    self._column_indices = array.array("q")
+    self._followed = array.array("b")
+
+  def add(self, instruction_id_list, follow_instruction_list):
+    """1つの例の評価結果を加えます。"""
+    for instruction_id, followed_or_not in zip(
+        instruction_id_list, follow_instruction_list
+    ):
+      column = self._columns.setdefault(instruction_id, len(self._columns))
+      self._rows.append(self.num_examples)
+      self._column_indices.append(column)
+      self._followed.append(bool(followed_or_not))
+    self.num_examples += 1
+
+  def build(self):
+    """指示IDのリストと、`total`と`followed`の行列を返します。"""
+    import numpy as np  # pylint: disable=g-import-not-at-top
+    instruction_ids = list(self._columns)
+    shape = (self.num_examples, len(instruction_ids))
+    rows = np.frombuffer(self._rows, dtype=np.int64)
+    columns = np.frombuffer(self._column_indices, dtype=np.int64)
+    flat_indices = rows * shape[1] + columns
+    size = shape[0] * shape[1]
+    total = np.bincount(flat_indices, minlength=size).reshape(shape)
+    followed = np.bincount(
+        flat_indices,
+        weights=np.frombuffer(self._followed, dtype=np.int8),
+        minlength=size,
+    ).reshape(shape).astype(np.int64)
+    return instruction_ids, total, followed
+
+
+def _bootstrap_weights(num_examples, num_samples, rng):
+  """再標本化での各例の出現回数を表す (標本 × 例) の重み行列を返します。
+
+  行列が大きくなりすぎないように、標本を分割して順に返します。
+  """
+  import numpy as np  # pylint: disable=g-import-not-at-top
+  batch_size = max(1, _MAX_WEIGHT_ELEMENTS // max(num_examples, 1))
+  for start in range(0, num_samples, batch_size):
+    size = min(batch_size, num_samples - start)
+    indices = rng.integers(0, num_examples, size=(size, num_examples))
+    indices += np.arange(size)[:, np.newaxis] * num_examples
+    yield np.bincount(
+        indices.ravel(), minlength=size * num_examples
+    ).reshape(size, num_examples).astype(np.float64)
+
+
+def compute_report(matrix, num_bootstrap_samples=0, confidence=0.95,
+                   seed=_BOOTSTRAP_SEED):
+  """評価結果の行列から精度スコアのレポートを計算します。
+
+  Args:
+    matrix: `VerdictMatrix`。
+    num_bootstrap_samples: ブートストラップの標本数。0の場合は信頼区間を
+      計算しません。
+    confidence: 信頼区間の信頼水準。
+    seed: ブートストラップの乱数のシード。
+
+  Returns:
+    `Report`。
+  """
+  import numpy as np  # pylint: disable=g-import-not-at-top
+  instruction_ids, total, followed = matrix.build()
+  tier0_ids = sorted({i.split(":")[0] for i in instruction_ids})
+  tier0_index = {tier0_id: j for j, tier0_id in enumerate(tier0_ids)}
+  # 指示IDの列をtier0の列にまとめる行列。
+  grouping = np.zeros((len(instruction_ids), len(tier0_ids)), dtype=np.int64)
+  for j, instruction_id in enumerate(instruction_ids):
+    grouping[j, tier0_index[instruction_id.split(":")[0]]] = 1
+
+  # 各精度は分子の列の和を分母の列の和で割った値です。
+  # 列の順序: プロンプトレベル, 指示レベル, tier0..., tier1...
+  num_total = total.sum(axis=1)
+  num_followed = followed.sum(axis=1)
+  numerators = np.column_stack([
+      num_followed == num_total, num_followed, followed @ grouping, followed,
+  ]).astype(np.int64)
+  denominators = np.column_stack([
+      np.ones_like(num_total), num_total, total @ grouping, total,
+  ]).astype(np.int64)
+  # 点推定はPythonの整数の除算で計算し、従来の集計と同じ値にします。
+  values = [
+      int(n) / int(d)
+      for n, d in zip(numerators.sum(axis=0), denominators.sum(axis=0))
+  ]
+
+  ci_low = ci_high = [None] * len(values)
+  if num_bootstrap_samples > 0 and matrix.num_examples > 0:
+    rng = np.random.default_rng(seed)
+    samples = []
+    with np.errstate(divide="ignore", invalid="ignore"):
+      for weights in _bootstrap_weights(
+          matrix.num_examples, num_bootstrap_samples, rng):
+        samples.append((weights @ numerators) / (weights @ denominators))
+    tail = (1 - confidence) / 2 * 100
+    # 再標本に含まれない指示IDの標本（0/0）は除いて分位点を求めます。
+    ci_low, ci_high = (
+        [float(x) for x in bounds]
+        for bounds in np.nanpercentile(
+            np.concatenate(samples), [tail, 100 - tail], axis=0)
+    )
+
+  accuracies = [
+      Accuracy(value, low, high)
+      for value, low, high in zip(values, ci_low, ci_high)
+  ]
+  return Report(
+      prompt_level=accuracies[0],
+      instruction_level=accuracies[1],
+      tier0=dict(zip(tier0_ids, accuracies[2:2 + len(tier0_ids)])),
+      tier1=dict(sorted(zip(instruction_ids, accuracies[2 + len(tier0_ids):]))),
+      num_bootstrap_samples=num_bootstrap_samples,
+      confidence=confidence,
+  )
+
+
+def _format_accuracy(accuracy):
+  if accuracy.ci_low is None:
+    return f"{accuracy.value}"
+  return f"{accuracy.value} [{accuracy.ci_low:.4f}, {accuracy.ci_high:.4f}]"
+
+
+def format_report(report, prompt_level_only=False):
+  """レポートを従来と同じ形式のテキストにします。
+
+  信頼区間がある場合は、各精度の後に`[下限, 上限]`を付けます。
+
+  Args:
+    report: `Report`。
+    prompt_level_only: Trueの場合はプロンプトレベルの精度のみを出力します。
+
+  Returns:
+    レポートのテキスト。
+  """
+  lines = [f"prompt-level: {_format_accuracy(report.prompt_level)}"]
+  if prompt_level_only:
+    return "\n".join(lines)
+  lines += [
+      f"instruction-level: {_format_accuracy(report.instruction_level)}",
+      "",
+  ]
+  for instruction_id, accuracy in report.tier0.items():
+    lines.append(f"{instruction_id} {_format_accuracy(accuracy)}")
+  lines.append("")
+  for instruction_id, accuracy in report.tier1.items():
+    lines.append(f"{instruction_id} {_format_accuracy(accuracy)}")
+  return "\n".join(lines)
+
+
+def report_to_json(report, prompt_level_only=False):
+  """レポートをJSONに変換できる辞書にします。
+
+  Args:
+    report: `Report`。
+    prompt_level_only: Trueの場合はプロンプトレベルの精度のみを含めます。
+
+  Returns:
+    JSONに変換できる辞書。
+  """
+  result = {
+      "num_bootstrap_samples": report.num_bootstrap_samples,
+      "confidence": report.confidence,
+      "prompt_level": dataclasses.asdict(report.prompt_level),
+  }
+  if prompt_level_only:
+    return result
+  return result | {
+      "instruction_level": dataclasses.asdict(report.instruction_level),
+      "tier0": {
+          instruction_id: dataclasses.asdict(accuracy)
+          for instruction_id, accuracy in report.tier0.items()
+      },
+      "tier1": {
+          instruction_id: dataclasses.asdict(accuracy)
+          for instruction_id, accuracy in report.tier1.items()
+      },
+  }
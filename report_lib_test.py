@@ -0,0 +1,83 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""report_lib.pyのテスト。"""
+
+from absl.testing import absltest
+from instruction_following_eval import report_lib
+
+
+# (指示IDのリスト, 追従したかのリスト) の例。
+_EXAMPLES = (
+    (["keywords:existence", "punctuation:no_comma"], [True, True]),
+    (["keywords:existence", "keywords:frequency"], [False, True]),
+    (["punctuation:no_comma"], [False]),
+    (["keywords:frequency", "keywords:frequency"], [True, False]),
+)
+
+
+def _make_matrix():
+  matrix = report_lib.VerdictMatrix()
+  for instruction_id_list, follow_instruction_list in _EXAMPLES:
+    matrix.add(instruction_id_list, follow_instruction_list)
+  return matrix
+
+
+class ReportLibTest(absltest.TestCase):
+
+  def test_point_estimates(self):
+    """各レベルの精度が正しく計算されるかのテスト。"""
+    report = report_lib.compute_report(_make_matrix())
+    self.assertEqual(report_lib.Accuracy(1 / 4), report.prompt_level)
+    self.assertEqual(report_lib.Accuracy(4 / 7), report.instruction_level)
+    self.assertEqual(
+        {"keywords": report_lib.Accuracy(3 / 5),
+         "punctuation": report_lib.Accuracy(1 / 2)},
+        report.tier0)
+    self.assertEqual(
+        {"keywords:existence": report_lib.Accuracy(1 / 2),
+         "keywords:frequency": report_lib.Accuracy(2 / 3),
+         "punctuation:no_comma": report_lib.Accuracy(1 / 2)},
+        report.tier1)
+
+  def test_bootstrap_confidence_intervals(self):
+    """信頼区間が決定的で、点推定を含むかのテスト。"""
+    report = report_lib.compute_report(
+        _make_matrix(), num_bootstrap_samples=2000)
+    self.assertEqual(
+        report,
+        report_lib.compute_report(_make_matrix(), num_bootstrap_samples=2000))
+    accuracies = [report.prompt_level, report.instruction_level]
+    accuracies += list(report.tier0.values()) + list(report.tier1.values())
+    for accuracy in accuracies:
+      self.assertBetween(accuracy.value, accuracy.ci_low, accuracy.ci_high)
+      self.assertLess(accuracy.ci_low, accuracy.ci_high)
+
+  def test_format_report(self):
+    """信頼区間がない場合に従来と同じ形式で出力されるかのテスト。"""
+    self.assertEqual(
+        "prompt-level: 0.25\n"
+        "instruction-level: 0.5714285714285714\n"
+        "\n"
+        "keywords 0.6\n"
+        "punctuation 0.5\n"
+        "\n"
+        "keywords:existence 0.5\n"
+        "keywords:frequency 0.6666666666666666\n"
+        "punctuation:no_comma 0.5",
+        report_lib.format_report(report_lib.compute_report(_make_matrix())))
+
+
+if __name__ == "__main__":
+  absltest.main()
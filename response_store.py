@@ -0,0 +1,161 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""応答ファイルをメモリマップし、応答を必要なときに読み込むストア。
+
+`ResponseStore`はプロンプトのハッシュから行のバイト位置への索引のみを
+保持し、応答は参照されるたびに行をデコードして返します。保持するのは
+1行あたり16バイトの索引のみで、ファイルの内容はOSのページキャッシュを
+通して読まれるため、応答ファイルより小さいメモリでも評価できます。
+索引の作成では各行の`"prompt"`の文字列のみをデコードし、応答は
+デコードしません。
+"""
+
+import array
+import bisect
+import collections.abc
+import hashlib
+import itertools
+import mmap
+import re
+
+from instruction_following_eval import evaluation_lib
+from instruction_following_eval import json_backend
+
+
+# 索引の項目を1つの整数にまとめるときの、行のバイト位置のビット数。
+_OFFSET_BITS = 48
+_OFFSET_MASK = (1 << _OFFSET_BITS) - 1
+
+# 行の`"prompt"`のキーと、その値の文字列（引用符を含む）。JSONの文字列の
+# 中の引用符はエスケープされるため、`{`か`,`か空白の後に始まり`:`が続く
+# 一致は文字列の中には現れません。
+_PROMPT_KEY = b'"prompt"'
+_PROMPT_PATTERN = re.compile(
+    rb'(?<=[{, \t])"prompt"[ \t]*:[ \t]*("[^"\\]*(?:\\.[^"\\]*)*")',
+    re.DOTALL)
+
+
+def _prompt_hash(prompt):
+  """プロンプトの64ビットのハッシュを返します。"""
+  digest = hashlib.blake2b(
+      prompt.encode("utf-8", "surrogatepass"), digest_size=8).digest()
+  return int.from_bytes(digest, "big")
+
+
+class ResponseStore(collections.abc.Mapping):
+  """プロンプトから応答への読み取り専用の辞書として使える応答ファイル。
+
+  `evaluation_lib.read_prompt_to_response_dict`と同じ対応付けを返します。
+  同じプロンプトが複数の行にある場合は最後の行の応答を返します。
+  キーは応答ファイルでの順序で返します。索引の作成後に応答ファイルを
+  変更してはいけません。
+  """
+
+  def __init__(self, input_jsonl_filename, shard_index=0, num_shards=1):
+    """応答ファイルをメモリマップし、索引を作成します。
+
+    Args:
+      input_jsonl_filename: プロンプトと応答を含むjsonlファイル。
+      shard_index: 読み込むシャードの番号。
+      num_shards: シャードの数。2以上の場合は`shard_index`のシャードの
+        プロンプトの応答のみを索引に加えます。
+    """
+    with open(input_jsonl_filename, "rb") as f:
+      # 空のファイルはメモリマップできません。
+      self._mmap = (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    if f.seek(0, 2) else b"")
+    self._hashes, self._offsets = self._build_index(shard_index, num_shards)
+
+  def _line_end(self, offset):
+    """`offset`から始まる行の、改行を含む終了位置を返します。"""
+    return self._mmap.find(b"\n", offset) + 1 or len(self._mmap)
+
+  def _read(self, offset, end=None):
+    """`offset`から始まる行をデコードした値を返します。"""
+    if end is None:
+      end = self._line_end(offset)
+    return json_backend.loads(self._mmap[offset:end].decode("utf-8"))
+
+  def _read_prompt(self, offset, end=None):
+    """`offset`から始まる行のプロンプトを、応答をデコードせずに返します。"""
+    if end is None:
+      end = self._line_end(offset)
+    start = self._mmap.find(_PROMPT_KEY, offset, end)
+    match = (_PROMPT_PATTERN.match(self._mmap, start, end)
+             if start >= 0 else None)
+    # 応答の中にも`"prompt"`がある行や、キーの形式が異なる行は行全体を
+    # デコードします。
+    if match is None or self._mmap.find(_PROMPT_KEY, match.end(), end) >= 0:
+      return self._read(offset, end)["prompt"]
+    return json_backend.loads(match.group(1).decode("utf-8"))
+
+  def _build_index(self, shard_index, num_shards):
+    """プロンプトのハッシュと行のバイト位置の、ハッシュの順の配列を返します。"""
+    # ハッシュとバイト位置を1つの整数にまとめて並べ替えます。
+    entries = []
+    offset = 0
+    while offset < len(self._mmap):
+      end = self._line_end(offset)
+      prompt = self._read_prompt(offset, end)
+      if num_shards <= 1 or evaluation_lib.shard_of(
+          prompt, num_shards) == shard_index:
+        entries.append(_prompt_hash(prompt) << _OFFSET_BITS | offset)
+      offset = end
+    entries.sort()
+
+    hashes = array.array("Q")
+    offsets = array.array("Q")
+    for prompt_hash, group in itertools.groupby(
+        entries, key=lambda entry: entry >> _OFFSET_BITS):
+      group_offsets = [entry & _OFFSET_MASK for entry in group]
+      if len(group_offsets) > 1:
+        # ハッシュが同じ行のうち、同じプロンプトの行は最後の行のみ残します。
+        prompt_to_offset = {}
+        for offset in group_offsets:
+          prompt_to_offset[self._read_prompt(offset)] = offset
+        group_offsets = sorted(prompt_to_offset.values())
+      hashes.extend(itertools.repeat(prompt_hash, len(group_offsets)))
+      offsets.extend(group_offsets)
+    return hashes, offsets
+
+  def __getitem__(self, prompt):
+    if not isinstance(prompt, str):
+      raise KeyError(prompt)
+    prompt_hash = _prompt_hash(prompt)
+    i = bisect.bisect_left(self._hashes, prompt_hash)
+    while i < len(self._hashes) and self._hashes[i] == prompt_hash:
+      example = self._read(self._offsets[i])
+      if example["prompt"] == prompt:
+        return example["response"]
+      i += 1
+    raise KeyError(prompt)
+
+  def __iter__(self):
+    for offset in sorted(self._offsets):
+      yield self._read_prompt(offset)
+
+  def __len__(self):
+    return len(self._offsets)
+
+  def close(self):
+    """メモリマップを閉じます。"""
+    if isinstance(self._mmap, mmap.mmap):
+      self._mmap.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
@@ -0,0 +1,160 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""response_store.pyのテスト。"""
+
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from absl.testing import absltest
+from instruction_following_eval import evaluation_lib
+from instruction_following_eval import response_store
+
+
+# 重複するプロンプト、ASCII以外の文字、改行を含む応答の行。
+_EXAMPLES = (
+    {"prompt": "Prompt 0", "response": "Answer 0"},
+    {"prompt": "Prompt é", "response": "Réponse\nsur deux lignes"},
+    {"prompt": "Prompt 2", "response": ""},
+    {"prompt": "Prompt 0", "response": "Answer 0, revised"},
+    {"prompt": "日本語のプロンプト", "response": "日本語の応答"},
+)
+
+
+class ResponseStoreTest(absltest.TestCase):
+
+  def _make_tempdir(self):
+    tempdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, tempdir)
+    return tempdir
+
+  def _write_response_file(self, lines):
+    file_name = os.path.join(self._make_tempdir(), "responses.jsonl")
+    with open(file_name, "w", encoding="utf-8") as f:
+      f.write("".join(lines))
+    return file_name
+
+  def _open_store(self, file_name, *args):
+    store = response_store.ResponseStore(file_name, *args)
+    self.addCleanup(store.close)
+    return store
+
+  def test_matches_prompt_to_response_dict(self):
+    """応答の辞書と同じ対応付けになるかのテスト。"""
+    lines = [json.dumps(example) + "\n" for example in _EXAMPLES]
+    # 最後の行に改行がない場合と、改行がCRLFの場合も読み込めること。
+    for name, file_lines in (
+        ("lf", lines),
+        ("no_trailing_newline", lines[:-1] + [lines[-1].rstrip("\n")]),
+        ("crlf", [line.replace("\n", "\r\n") for line in lines]),
+    ):
+      with self.subTest(name):
+        file_name = self._write_response_file(file_lines)
+        expected = evaluation_lib.read_prompt_to_response_dict(file_name)
+        store = self._open_store(file_name)
+        self.assertLen(store, len(expected))
+        self.assertEqual(expected, dict(store))
+        self.assertEqual("Answer 0, revised", store["Prompt 0"])
+        self.assertNotIn("Prompt 1", store)
+        self.assertNotIn(0, store)
+        with self.assertRaises(KeyError):
+          _ = store["Prompt 1"]
+
+  def test_iterates_in_file_order(self):
+    """キーを応答ファイルでの順序で返すかのテスト。"""
+    file_name = self._write_response_file(
+        [json.dumps(example) + "\n" for example in _EXAMPLES])
+    self.assertEqual(
+        ["Prompt é", "Prompt 2", "Prompt 0", "日本語のプロンプト"],
+        list(self._open_store(file_name)))
+
+  def test_empty_file(self):
+    """空のファイルを読み込めるかのテスト。"""
+    store = self._open_store(self._write_response_file([]))
+    self.assertEmpty(store)
+    self.assertNotIn("Prompt 0", store)
+
+  def test_hash_collisions(self):
+    """プロンプトのハッシュが衝突しても正しい応答を返すかのテスト。"""
+    file_name = self._write_response_file(
+        [json.dumps(example) + "\n" for example in _EXAMPLES])
+    with mock.patch.object(response_store, "_prompt_hash", lambda prompt: 7):
+      store = self._open_store(file_name)
+      self.assertEqual(
+          evaluation_lib.read_prompt_to_response_dict(file_name), dict(store))
+      self.assertNotIn("Prompt 1", store)
+
+  def test_sharded_reading(self):
+    """シャードのプロンプトの応答のみを索引に加えるかのテスト。"""
+    file_name = self._write_response_file([
+        json.dumps({"prompt": f"Prompt {i}", "response": f"Answer {i}"}) + "\n"
+        for i in range(30)
+    ])
+    num_shards = 3
+    for shard_index in range(num_shards):
+      with self.subTest(shard_index=shard_index):
+        self.assertEqual(
+            evaluation_lib.read_prompt_to_response_dict(
+                file_name, shard_index, num_shards),
+            dict(self._open_store(file_name, shard_index, num_shards)))
+
+  def test_index_decodes_only_prompts(self):
+    """索引の作成で応答をデコードしないかのテスト。"""
+    file_name = self._write_response_file(
+        [json.dumps(example) + "\n" for example in _EXAMPLES])
+    decoded = []
+    loads = response_store.json_backend.loads
+
+    def record(text):
+      decoded.append(text)
+      return loads(text)
+
+    with mock.patch.object(response_store.json_backend, "loads", record):
+      store = self._open_store(file_name)
+      self.assertEqual(
+          ["Prompt é", "Prompt 2", "Prompt 0", "日本語のプロンプト"],
+          list(store))
+    self.assertNotEmpty(decoded)
+    for text in decoded:
+      self.assertNotIn("response", text)
+
+  def test_unusual_prompt_keys(self):
+    """`"prompt"`のキーの形式や位置によらず同じプロンプトを返すかのテスト。"""
+    lines = [
+        # 応答がプロンプトより前にある行と、キーの前後の空白。
+        '{"response": "Answer 0", "prompt": "Prompt 0"}\n',
+        '{ "prompt" :  "Prompt 1" , "response": "Answer 1"}\n',
+        # 応答やほかのキーの中の`"prompt"`。
+        '{"prompt": "Prompt 2", "response": "the \\"prompt\\": \\"x\\""}\n',
+        '{"prompt": "Prompt 3", "response": "say \\"prompt"}\n',
+        '{"meta": {"prompt": "Nested"}, "prompt": "Prompt 4",'
+        ' "response": "Answer 4"}\n',
+        '{"x\\"prompt": "Key", "prompt": "Prompt 5", "response": "Answer 5"}\n',
+        # エスケープされたキーと、エスケープを含むプロンプト。
+        '{"\\u0070rompt": "Prompt 6", "response": "Answer 6"}\n',
+        '{"prompt": "Prompt \\"7\\"\\n\\u00e9", "response": "Answer 7"}\n',
+    ]
+    file_name = self._write_response_file(lines)
+    expected = evaluation_lib.read_prompt_to_response_dict(file_name)
+    self.assertLen(expected, len(lines))
+    store = self._open_store(file_name)
+    self.assertEqual(list(expected), list(store))
+    self.assertEqual(expected, dict(store))
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -0,0 +1,170 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""評価結果の内容アドレス型キャッシュ。
+
+(指示ID, 引数, プロンプト, 応答, チェッカーのバージョン) のハッシュをキーに、
+指示ごとの厳密な評価と緩い評価の結果をSQLiteデータベースに保存します。
+チェッカーのバージョンはチェッカーのクラスとチェッカーが使うヘルパーの
+モジュール（`instructions_util`、`json_validation`、`language_detection`）の
+ソースコードと、言語検出器と文の数のカウンターから決まるため、これらを
+変更すると古い結果は使われなくなります。`instructions`モジュールの
+クラスの外の定数の変更など、それ以外の変更の後は`clear`でキャッシュを
+無効にしてください。
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import sqlite3
+
+from instruction_following_eval import instructions_registry
+from instruction_following_eval import instructions_util
+from instruction_following_eval import json_validation
+from instruction_following_eval import language_detection
+
+
+# 他のプロセスが書き込み中のデータベースのロックを待つ秒数。
+_BUSY_TIMEOUT_SECONDS = 60
+
+# ソースコードをすべてのチェッカーのバージョンに含める、チェッカーが使う
+# ヘルパーのモジュール。
+_HELPER_MODULES = (instructions_util, json_validation, language_detection)
+
+
+@functools.lru_cache(maxsize=None)
+def _source_version(obj):
+  """クラスまたはモジュールのソースコードのハッシュを返します。"""
+  return hashlib.sha256(inspect.getsource(obj).encode("utf-8")).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _helpers_version():
+  """ヘルパーのモジュールのソースコードをまとめたハッシュを返します。"""
+  return hashlib.sha256("".join(
+      _source_version(module) for module in _HELPER_MODULES).encode(
+          "utf-8")).hexdigest()
+
+
+def checker_version(instruction_id):
+  """指示IDのチェッカーのバージョンを表す文字列を返します。"""
+  instruction_cls = instructions_registry.INSTRUCTION_DICT[instruction_id]
+  return (f"{_source_version(instruction_cls)}:{_helpers_version()}:"
+          f"{language_detection.get_backend()}:"
+          f"{instructions_util.get_sentence_counter()}")
+
+
+def _digest(text):
+  return hashlib.sha256(text.encode("utf-8", "surrogatepass")).digest()
+
+
+def make_keys(inp, response):
+  """入力の各指示について、応答の評価結果のキーを返します。
+
+  Args:
+    inp: `evaluation_lib.InputExample`。
+    response: 応答を表す文字列。
+
+  Returns:
+    入力の指示と同じ順序のキー（バイト列）のリスト。
+  """
+  prompt_digest = _digest(inp.prompt)
+  response_digest = _digest(response)
+  keys = []
+  for instruction_id, kwargs in zip(inp.instruction_id_list, inp.kwargs):
+    key = hashlib.sha256()
+    key.update(instruction_id.encode("utf-8"))
+    key.update(b"\0")
+    key.update(json.dumps(kwargs, sort_keys=True).encode("utf-8"))
+    key.update(b"\0")
+    key.update(prompt_digest)
+    key.update(response_digest)
+    key.update(checker_version(instruction_id).encode("utf-8"))
+    keys.append(key.digest())
+  return keys
+
+
+class ResultCache:
+  """指示ごとの評価結果をSQLiteデータベースに保存するキャッシュ。"""
+
+  def __init__(self, path):
+    """キャッシュを開きます。ファイルが存在しない場合は作成します。
+
+    Args:
+      path: SQLiteデータベースのファイルへのパス。
+    """
+    self._connection = sqlite3.connect(path, timeout=_BUSY_TIMEOUT_SECONDS)
+    # 並行して実行されるシャードが同じファイルを共有できるよう、WALモードで
+    # 読み込みが書き込みを待たないようにします。
+    self._connection.execute("PRAGMA journal_mode=WAL")
+    self._connection.execute("PRAGMA synchronous=NORMAL")
+    self._connection.execute(
+        "CREATE TABLE IF NOT EXISTS results ("
+        "key BLOB PRIMARY KEY, strict INTEGER NOT NULL, loose INTEGER NOT NULL)"
+    )
+    self.hits = 0
+    self.misses = 0
+
+  def get_many(self, keys):
+    """キーに対応する評価結果を返します。
+
+    Args:
+      keys: `make_keys`で作成したキーのリスト。
+
+    Returns:
+      キーと同じ順序の`(strict, loose)`のタプルのリスト。キャッシュに
+      ない場合はNone。
+    """
+    placeholders = ",".join("?" * len(keys))
+    rows = self._connection.execute(
+        f"SELECT key, strict, loose FROM results WHERE key IN ({placeholders})",
+        keys,
+    ).fetchall()
+    found = {key: (bool(strict), bool(loose)) for key, strict, loose in rows}
+    verdicts = [found.get(key) for key in keys]
+    num_hits = sum(verdict is not None for verdict in verdicts)
+    self.hits += num_hits
+    self.misses += len(keys) - num_hits
+    return verdicts
+
+  def put_many(self, items):
+    """評価結果を保存してコミットします。
+
+    書き込みのトランザクションを開いたままにすると、同じファイルを使う
+    他のプロセスの書き込みが待たされるため、呼び出しごとにコミットします。
+
+    Args:
+      items: `(キー, strict, loose)`のタプルのイテラブル。
+    """
+    with self._connection:
+      self._connection.executemany(
+          "INSERT OR REPLACE INTO results (key, strict, loose) "
+          "VALUES (?, ?, ?)",
+          items,
+      )
+
+  def flush(self):
+    """保存した評価結果をコミットします。"""
+    self._connection.commit()
+
+  def clear(self):
+    """キャッシュ内のすべての評価結果を削除します。"""
+    self._connection.execute("DELETE FROM results")
+    self.flush()
+
+  def close(self):
+    """評価結果をコミットしてキャッシュを閉じます。"""
+    self.flush()
+    self._connection.close()
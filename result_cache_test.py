@@ -0,0 +1,104 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""result_cache.pyのテスト。"""
+
+import inspect
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from absl.testing import absltest
+from instruction_following_eval import evaluation_lib
+from instruction_following_eval import instructions_util
+from instruction_following_eval import json_validation
+from instruction_following_eval import language_detection
+from instruction_following_eval import result_cache
+
+
+class ResultCacheTest(absltest.TestCase):
+
+  def _make_tempdir(self):
+    tempdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, tempdir)
+    return tempdir
+
+  def _open_cache(self, path):
+    cache = result_cache.ResultCache(path)
+    self.addCleanup(cache.close)
+    return cache
+
+  def test_concurrent_handles(self):
+    """同じファイルを開いた2つのキャッシュが交互に読み書きできるかのテスト。"""
+    path = os.path.join(self._make_tempdir(), "cache.sqlite")
+    caches = [self._open_cache(path), self._open_cache(path)]
+    keys = [f"key {i}".encode("utf-8") for i in range(10)]
+    for i, key in enumerate(keys):
+      # 一方の書き込みがロックを保持したままにならず、もう一方がすぐに
+      # 書き込めて、書き込んだ結果を読めること。
+      caches[i % 2].put_many([(key, i % 2 == 0, i % 3 == 0)])
+      self.assertEqual([(i % 2 == 0, i % 3 == 0)],
+                       caches[1 - i % 2].get_many([key]))
+    expected = [(i % 2 == 0, i % 3 == 0) for i in range(len(keys))]
+    for cache in caches:
+      self.assertEqual(expected, cache.get_many(keys))
+
+  def test_clear(self):
+    """`clear`がすべての評価結果を削除するかのテスト。"""
+    cache = self._open_cache(
+        os.path.join(self._make_tempdir(), "cache.sqlite"))
+    cache.put_many([(b"key", True, False)])
+    self.assertEqual([(True, False)], cache.get_many([b"key"]))
+    cache.clear()
+    self.assertEqual([None], cache.get_many([b"key"]))
+    self.assertEqual(1, cache.hits)
+    self.assertEqual(1, cache.misses)
+
+  def _clear_versions(self):
+    result_cache._source_version.cache_clear()
+    result_cache._helpers_version.cache_clear()
+
+  def test_helper_change_invalidates_entries(self):
+    """ヘルパーのモジュールを変更すると古い評価結果が使われないかのテスト。"""
+    cache = self._open_cache(
+        os.path.join(self._make_tempdir(), "cache.sqlite"))
+    inp = evaluation_lib.InputExample(
+        key=0, instruction_id_list=["punctuation:no_comma"], prompt="Prompt",
+        kwargs=[{}])
+    cache.put_many([(result_cache.make_keys(inp, "Response")[0], True, True)])
+    self.assertEqual([(True, True)],
+                     cache.get_many(result_cache.make_keys(inp, "Response")))
+
+    getsource = inspect.getsource
+    self.addCleanup(self._clear_versions)
+    for module in (instructions_util, json_validation, language_detection):
+      with self.subTest(module.__name__):
+
+        def edited_getsource(obj, module=module):
+          source = getsource(obj)
+          return source + "\n# edited\n" if obj is module else source
+
+        self._clear_versions()
+        with mock.patch.object(inspect, "getsource", edited_getsource):
+          self.assertEqual(
+              [None], cache.get_many(result_cache.make_keys(inp, "Response")))
+    # 変更を戻すと保存した評価結果が再び使われること。
+    self._clear_versions()
+    self.assertEqual([(True, True)],
+                     cache.get_many(result_cache.make_keys(inp, "Response")))
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -0,0 +1,129 @@
+# coding=utf-8
+# Copyright 2025 The Google Research Authors.
+#
+# Apache License, Version 2.0（「ライセンス」）に基づいてライセンスされています。
+# このファイルは、ライセンスに準拠していない限り使用できません。
+# ライセンスのコピーは以下で入手できます：
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# 適用法で要求されるか、書面で合意されない限り、ライセンスに基づいて
+# 配布されるソフトウェアは「現状のまま」で配布され、
+# 明示的または黙示的を問わず、いかなる保証も条件もありません。
+# 詳細については、ライセンスを参照してください。
+
+"""文の数のカウンターの1回あたりのレイテンシと一致率を計測するベンチマーク。
+
+`--input_data`を指定した場合は、`length_constraints:number_sentences`の
+指示の判定がpunktと異なる応答の数も出力します。
+
+例:
+
+  python3 -m instruction_following_eval.sentence_counter_benchmark \
+    --input_data=instruction_following_eval/data/input_data.jsonl \
+    --input_response_data=instruction_following_eval/data/input_response_data_gpt4_20231107_145030.jsonl
+"""
+
+import json
+import time
+
+from absl import app
+from absl import flags
+
+from instruction_following_eval import evaluation_lib
+from instruction_following_eval import instructions_util
+
+
+_INPUT_RESPONSE_DATA = flags.DEFINE_string(
+    "input_response_data", None, "入力応答データへのパス", required=True
+)
+
+_NUM_RESPONSES = flags.DEFINE_integer(
+    "num_responses", 1000, "計測に使う応答の最大数。"
+)
+
+_INPUT_DATA = flags.DEFINE_string(
+    "input_data", None,
+    "入力データへのパス。指定した場合は文の数の指示の判定も比較します。"
+)
+
+_NUMBER_SENTENCES_ID = "length_constraints:number_sentences"
+
+
+def _read_responses(filename, num_responses):
+  responses = []
+  with open(filename, "r") as f:
+    for l in f:
+      responses.append(json.loads(l)["response"])
+      if len(responses) >= num_responses:
+        break
+  return responses
+
+
+def _time_per_call(counter, responses):
+  """1回あたりの平均レイテンシ（ミリ秒）と文の数を返します。"""
+  instructions_util.set_sentence_counter(counter)
+  results = []
+  start = time.perf_counter()
+  for response in responses:
+    results.append(instructions_util.count_sentences(response))
+  elapsed = time.perf_counter() - start
+  return elapsed * 1000 / len(responses), results
+
+
+def _number_sentences_verdicts(counter, inputs, prompt_to_response):
+  """文の数の指示ごとの`check_following`の判定のリストを返します。"""
+  instructions_util.set_sentence_counter(counter)
+  verdicts = []
+  for inp in inputs:
+    for instruction_id, kwargs in zip(inp.instruction_id_list, inp.kwargs):
+      if instruction_id != _NUMBER_SENTENCES_ID:
+        continue
+      instruction = evaluation_lib.get_prepared_instruction(
+          instruction_id, kwargs, inp.prompt)
+      verdicts.append(
+          instruction.check_following(prompt_to_response[inp.prompt]))
+  return verdicts
+
+
+def _print_verdict_differences(input_data, input_response_data):
+  """文の数の指示の判定がpunktと異なる数を出力します。"""
+  inputs = evaluation_lib.read_prompt_list(input_data)
+  prompt_to_response = evaluation_lib.read_prompt_to_response_dict(
+      input_response_data)
+  baseline = _number_sentences_verdicts(
+      instructions_util.PUNKT, inputs, prompt_to_response)
+  for counter in instructions_util.SENTENCE_COUNTERS[1:]:
+    verdicts = _number_sentences_verdicts(counter, inputs, prompt_to_response)
+    num_differences = sum(a != b for a, b in zip(baseline, verdicts))
+    print(f"{counter:10s} {_NUMBER_SENTENCES_ID} verdicts differ from punkt "
+          f"on {num_differences} of {len(baseline)} instructions")
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError("コマンドライン引数が多すぎます。")
+
+  responses = _read_responses(_INPUT_RESPONSE_DATA.value,
+                              _NUM_RESPONSES.value)
+  start = time.perf_counter()
+  _time_per_call(instructions_util.PUNKT, ["Warm up."])
+  load_ms = (time.perf_counter() - start) * 1000
+
+  rows = []
+  for counter in instructions_util.SENTENCE_COUNTERS:
+    ms, results = _time_per_call(counter, responses)
+    rows.append((counter, ms, results))
+  _, baseline_ms, baseline = rows[0]
+
+  print(f"{len(responses)} responses, punkt model loaded in {load_ms:.1f} ms")
+  for counter, ms, results in rows:
+    agreement = sum(a == b for a, b in zip(baseline, results)) / len(results)
+    print(f"{counter:10s} {ms:9.4f} ms/call  "
+          f"speedup {baseline_ms / ms:8.1f}x  agreement {agreement:.3f}")
+  if _INPUT_DATA.value:
+    _print_verdict_differences(_INPUT_DATA.value, _INPUT_RESPONSE_DATA.value)
+
+
+if __name__ == "__main__":
+  app.run(main)